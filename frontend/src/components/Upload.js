@@ -8,6 +8,7 @@ const Upload = () => {
     const [uploading, setUploading] = useState(false);
     const [result, setResult] = useState(null);
     const [error, setError] = useState(null);
+    const [stage, setStage] = useState(null);
 
     const handleFileChange = (e) => {
         const selectedFile = e.target.files[0];
@@ -35,24 +36,53 @@ const Upload = () => {
         formData.append('file', file);
 
         try {
+            // The server answers 202 with a job id; progress arrives over SSE
             const response = await axios.post(`${API_BASE}/upload-pdf`, formData, {
                 headers: {
                     'Content-Type': 'multipart/form-data',
                 },
             });
 
-            setResult(response.data);
-            setFile(null);
-            // Reset file input
-            document.getElementById('file-input').value = '';
+            const job = await followJob(response.data.job_id);
+            if (job.stage === 'failed') {
+                setError(job.error || 'Failed to process PDF');
+            } else {
+                setResult(job.result);
+                setFile(null);
+                // Reset file input
+                document.getElementById('file-input').value = '';
+            }
         } catch (error) {
             setError(error.response?.data?.detail || 'Failed to upload PDF');
             console.error('Upload error:', error);
         } finally {
             setUploading(false);
+            setStage(null);
         }
     };
 
+    // Resolves with the job's final state, updating the stage as it changes
+    const followJob = (jobId) => new Promise((resolve, reject) => {
+        const events = new EventSource(`${API_BASE}/jobs/${jobId}/events`);
+        events.addEventListener('stage', (event) => {
+            const job = JSON.parse(event.data);
+            setStage(job.stage);
+            if (job.stage === 'done' || job.stage === 'failed') {
+                events.close();
+                resolve(job);
+            }
+        });
+        events.onerror = () => {
+            events.close();
+            // Stream dropped; fall back to polling the job status
+            axios.get(`${API_BASE}/jobs/${jobId}`)
+                .then(({ data }) => (data.stage === 'done' || data.stage === 'failed')
+                    ? resolve(data)
+                    : setTimeout(() => followJob(jobId).then(resolve, reject), 2000))
+                .catch(reject);
+        };
+    });
+
     const handleDrop = (e) => {
         e.preventDefault();
         const droppedFile = e.dataTransfer.files[0];
@@ -108,7 +138,7 @@ const Upload = () => {
                         disabled={!file || uploading}
                         className="upload-btn"
                     >
-                        {uploading ? 'Processing...' : 'Upload and Process'}
+                        {uploading ? (stage ? `Processing (${stage})...` : 'Uploading...') : 'Upload and Process'}
                     </button>
                 </div>
 
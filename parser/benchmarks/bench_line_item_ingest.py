@@ -0,0 +1,80 @@
+# benchmarks/bench_line_item_ingest.py
+"""Time line item ingestion: one INSERT per row vs executemany vs COPY.
+
+Each measurement inserts a synthetic PO's expanded rows inside a transaction
+that is rolled back, so the database is left untouched. Run from parser/:
+
+    python -m benchmarks.bench_line_item_ingest --repeat 5
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import asyncpg
+
+from benchmarks.common import database_url, percentile
+from benchmarks.synthetic import make_parsed_po
+from ingest import LINE_ITEM_COLUMNS, LINE_ITEM_INSERT_QUERY, expand_line_items
+
+LINE_ITEM_COUNTS = [10, 100, 1000]
+
+
+async def per_row(conn, rows):
+    for row in rows:
+        await conn.execute(LINE_ITEM_INSERT_QUERY, *row)
+
+
+async def executemany(conn, rows):
+    await conn.executemany(LINE_ITEM_INSERT_QUERY, rows)
+
+
+async def copy(conn, rows):
+    await conn.copy_records_to_table("line_items", records=rows, columns=LINE_ITEM_COLUMNS)
+
+
+async def time_variant(conn, parsed, write):
+    """Insert one PO's line items with `write` and return (seconds, rows)"""
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        order_id = uuid.uuid4()
+        await conn.execute(
+            "INSERT INTO orders (id, purchase_order_id, total_amount) VALUES ($1, $2, 0)",
+            order_id, f"BENCH-INGEST-{order_id}"
+        )
+        started = time.perf_counter()
+        rows = expand_line_items(order_id, parsed["line_items"])
+        await write(conn, rows)
+        return time.perf_counter() - started, len(rows)
+    finally:
+        await tr.rollback()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per variant and size")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    conn = await asyncpg.connect(database_url())
+    try:
+        print(f"{'line items':>10} {'rows':>6} {'variant':<12} {'p50 ms':>9} {'rows/s':>10}")
+        for n_items in LINE_ITEM_COUNTS:
+            parsed = make_parsed_po(rng, 0, n_items)
+            for name, write in (("per-row", per_row), ("executemany", executemany), ("copy", copy)):
+                await time_variant(conn, parsed, write)  # warm up
+                timings = []
+                rows = 0
+                for _ in range(args.repeat):
+                    seconds, rows = await time_variant(conn, parsed, write)
+                    timings.append(seconds)
+                median = percentile(timings, 50)
+                print(f"{n_items:>10} {rows:>6} {name:<12} {median * 1000:>9.2f} {rows / median:>10.0f}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
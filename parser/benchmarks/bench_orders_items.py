@@ -0,0 +1,95 @@
+# benchmarks/bench_orders_items.py
+"""Compare the per-order line item lookup in GET /orders with the batched fetch.
+
+Run from the parser/ directory against a disposable database:
+
+    python -m benchmarks.bench_orders_items --orders 10000 --iterations 50
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+
+from benchmarks.common import CountingConnection, database_url, percentile
+from benchmarks.seed import seed_orders
+from queries import (
+    build_item_match_conditions, build_order_filters, build_orders_page_query,
+    fetch_matching_items, where_sql
+)
+
+SCENARIOS = [
+    {"name": "unfiltered", "model_id": None, "color": None, "size": None},
+    {"name": "color=navy", "model_id": None, "color": "navy", "size": None},
+    {"name": "model+size", "model_id": "MDL-0", "color": None, "size": "M"},
+]
+
+
+async def items_per_order(conn, orders, model_id, color, size):
+    """The original N+1 shape: one line item query per order on the page"""
+    result = {}
+    for order in orders:
+        item_conditions, item_params = build_item_match_conditions(model_id, color, size, param_count=1)
+        item_where = " AND ".join(item_conditions) if item_conditions else "1=1"
+        items_query = f"""
+        SELECT li.*,
+               CASE WHEN ({item_where}) THEN true ELSE false END as is_match
+        FROM line_items li
+        WHERE li.order_id = $1
+        ORDER BY is_match DESC, li.created_at
+        """
+        items = await conn.fetch(items_query, order["id"], *item_params)
+        result[order["id"]] = [dict(item) for item in items if item["is_match"]]
+    return result
+
+
+async def items_batched(conn, orders, model_id, color, size):
+    return await fetch_matching_items(conn, [order["id"] for order in orders], model_id, color, size)
+
+
+async def run_page(conn, scenario, limit, fetch_items):
+    """Run the full GET /orders query sequence for one page and return the round trip count"""
+    counted = CountingConnection(conn)
+    where_conditions, params = build_order_filters(None, scenario["model_id"], scenario["color"], scenario["size"])
+    where_clause = where_sql(where_conditions)
+
+    await counted.fetchval(f"SELECT COUNT(*) FROM orders o {where_clause}", *params)
+    orders_query = build_orders_page_query(where_clause, "order_date", "desc", len(params))
+    orders = await counted.fetch(orders_query, *params, limit, 0)
+    await fetch_items(counted, orders, scenario["model_id"], scenario["color"], scenario["size"])
+    return counted.round_trips
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=10000, help="seeded orders to ensure exist")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100, help="page size")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        added = await seed_orders(conn, args.orders)
+        print(f"Seeded {added} new orders (target {args.orders})\n")
+
+        print(f"{'scenario':<14} {'variant':<10} {'round trips':>11} {'p50 ms':>9} {'p95 ms':>9}")
+        for scenario in SCENARIOS:
+            for variant, fetch_items in (("per-order", items_per_order), ("batched", items_batched)):
+                # Warm the statement cache so both variants are measured hot
+                await run_page(conn, scenario, args.limit, fetch_items)
+
+                timings = []
+                round_trips = 0
+                for _ in range(args.iterations):
+                    started = time.perf_counter()
+                    round_trips = await run_page(conn, scenario, args.limit, fetch_items)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                print(f"{scenario['name']:<14} {variant:<10} {round_trips:>11} "
+                      f"{percentile(timings, 50):>9.2f} {percentile(timings, 95):>9.2f}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
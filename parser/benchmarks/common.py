@@ -0,0 +1,45 @@
+# benchmarks/common.py
+"""Helpers shared by the benchmark scripts"""
+import os
+from dotenv import load_dotenv
+
+from database import database_url  # noqa: F401 (re-exported for the scripts)
+
+load_dotenv()
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class CountingConnection:
+    """Wraps an asyncpg connection and counts statements sent to the server"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.round_trips = 0
+
+    async def fetch(self, *args, **kwargs):
+        self.round_trips += 1
+        return await self._conn.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        self.round_trips += 1
+        return await self._conn.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        self.round_trips += 1
+        return await self._conn.fetchval(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        self.round_trips += 1
+        return await self._conn.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
@@ -0,0 +1,123 @@
+# benchmarks/load_pos.py
+"""Generate synthetic parsed POs and load them through save_to_database.
+
+POs come from benchmarks.synthetic.PurchaseOrderGenerator (or a JSONL file of
+parsed POs written earlier with --out), and are saved by --concurrency workers
+through the same save_to_database the upload path uses, so stats, rollups and
+line item reconciliation all run. Needs the API's environment (.env with the
+database and GEMINI_API_KEY, which is never called). Run from parser/:
+
+    python -m benchmarks.load_pos --count 100000 --concurrency 16 --revision-rate 0.05
+    python -m benchmarks.load_pos --count 1000000 --out pos.jsonl --no-load   # just write the JSON
+    python -m benchmarks.load_pos --from pos.jsonl                            # load a file
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.synthetic import PurchaseOrderGenerator, check_parsed_po
+import server
+
+
+def read_jsonl(path: str):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def load(parsed_orders, concurrency: int, report_every: int) -> dict:
+    """Save every PO with `concurrency` workers pulling from the (lazy) iterator"""
+    totals = {"orders": 0, "created": 0, "duplicates": 0, "failed": 0, "line_items": 0}
+    started = time.perf_counter()
+    source = iter(parsed_orders)
+
+    async def worker():
+        for parsed in source:
+            try:
+                result = await server.save_to_database(parsed)
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"❌ {parsed.get('purchase_order_id')}: {e}")
+                continue
+            totals["orders"] += 1
+            totals["duplicates" if result["is_duplicate"] else "created"] += 1
+            totals["line_items"] += result["line_items"]["inserted"]
+            if totals["orders"] % report_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  {totals['orders']} saved, {totals['orders'] / elapsed:.0f} POs/s")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    totals["elapsed_seconds"] = time.perf_counter() - started
+    return totals
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000, help="POs to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="SYNTH", help="purchase_order_id prefix")
+    parser.add_argument("--first", type=int, default=0, help="number of the first generated PO")
+    parser.add_argument("--revision-rate", type=float, default=0.0, help="share of POs that re-send an earlier one")
+    parser.add_argument("--models", type=int, default=5000)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--suppliers", type=int, default=50)
+    parser.add_argument("--from", dest="source", help="load parsed POs from this JSONL file instead of generating")
+    parser.add_argument("--out", help="also write the POs to this JSONL file")
+    parser.add_argument("--no-load", action="store_true", help="only write --out, don't touch the database")
+    parser.add_argument("--check", action="store_true", help="validate every PO against the prompt schema")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    if args.no_load and not args.out:
+        parser.error("--no-load needs --out")
+
+    if args.source:
+        parsed_orders = read_jsonl(args.source)
+    else:
+        generator = PurchaseOrderGenerator(
+            seed=args.seed, prefix=args.prefix, models=args.models, buyers=args.buyers,
+            suppliers=args.suppliers, revision_rate=args.revision_rate
+        )
+        parsed_orders = generator.generate(args.count, first_po_number=args.first)
+
+    out = open(args.out, "w") if args.out else None
+
+    def emit(stream):
+        for parsed in stream:
+            if args.check:
+                problems = check_parsed_po(parsed)
+                if problems:
+                    print(f"❌ {parsed.get('purchase_order_id')} doesn't match the schema: {'; '.join(problems)}")
+                    sys.exit(1)
+            if out:
+                out.write(json.dumps(parsed) + "\n")
+            yield parsed
+
+    try:
+        if args.no_load:
+            written = sum(1 for _ in emit(parsed_orders))
+            print(f"✅ Wrote {written} POs to {args.out}")
+            return
+
+        await server.db_manager.create_pool()
+        try:
+            totals = await load(emit(parsed_orders), args.concurrency, report_every=max(1, min(1000, args.count // 10)))
+        finally:
+            await server.db_manager.close_pool()
+    finally:
+        if out:
+            out.close()
+
+    elapsed = totals["elapsed_seconds"]
+    print(f"\n✅ Saved {totals['orders']} POs ({totals['created']} new, {totals['duplicates']} re-sent, "
+          f"{totals['failed']} failed) in {elapsed:.1f}s")
+    print(f"   {totals['orders'] / elapsed:.1f} POs/s, {totals['line_items'] / elapsed:.0f} line item rows/s "
+          f"at concurrency {args.concurrency}")
+    if totals["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,230 @@
+# benchmarks/load_test.py
+"""Replay a mix of read API calls at a target rate and report latency per endpoint.
+
+Requests go to the FastAPI app in-process through httpx's ASGI transport (no
+sockets, no uvicorn), or to a running server with --url. Arrivals are open
+loop: request n is due at n / --rps seconds whatever happened to earlier ones,
+and latency is measured from when it was due, so a server that falls behind
+shows up in the percentiles instead of silently lowering the rate. Requests
+due while --max-in-flight are outstanding are dropped and counted.
+
+Seed data first (e.g. python -m benchmarks.load_pos --count 100000), then run
+from parser/:
+
+    python -m benchmarks.load_test --rps 200 --duration 60
+    python -m benchmarks.load_test --rps 500 --mix orders=50,order=30,filters=10,stats=10 --json results.json
+
+In-process runs share one event loop between the driver and the app, so they
+measure the app's cost per request rather than what a multi-worker deployment
+would sustain.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.common import percentile
+from benchmarks.synthetic import BUYERS, COLORS, SIZES
+
+DEFAULT_MIX = "orders=60,order=25,filters=10,stats=5"
+ORDER_SAMPLE_SIZE = 1000
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}, expected one of {sorted(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def orders_path(rng: random.Random, sample: dict) -> str:
+    """A GET /orders call with a random filter/sort/pagination mix"""
+    params = {
+        "limit": rng.choice([20, 50, 100]),
+        "sort_by": rng.choice(["order_date", "total_amount", "item_count"]),
+        "sort_order": rng.choice(["desc", "asc"]),
+    }
+    if rng.random() < 0.3:
+        params["paginate"] = "cursor"
+    else:
+        params["page"] = rng.choice([1, 1, 1, 2, 3, 5])
+    if rng.random() < 0.2:
+        params["search"] = rng.choice(BUYERS)[:9]
+    if rng.random() < 0.2:
+        params["model_id"] = f"MDL-{rng.randrange(0, 500):04d}"
+    if rng.random() < 0.2:
+        params["color"] = rng.choice(COLORS)
+    if rng.random() < 0.1:
+        params["size"] = rng.choice(SIZES)
+    return f"/orders?{httpx.QueryParams(params)}"
+
+
+def order_path(rng: random.Random, sample: dict) -> str:
+    """A GET /orders/{id} call for a sampled order, by id or purchase_order_id"""
+    order_id, purchase_order_id = rng.choice(sample["orders"])
+    key = purchase_order_id if rng.random() < 0.3 else order_id
+    page = rng.choice([1, 1, 2])
+    return f"/orders/{key}?page={page}"
+
+
+ENDPOINTS = {
+    "orders": orders_path,
+    "order": order_path,
+    "filters": lambda rng, sample: "/filters",
+    "stats": lambda rng, sample: "/stats",
+}
+
+
+class Recorder:
+    """Latencies, errors and drops per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = sorted(set(self.latencies) | set(self.errors) | set(self.dropped))
+        result = {}
+        for name in endpoints + ["all"]:
+            if name == "all":
+                latencies = [ms for values in self.latencies.values() for ms in values]
+                errors = sum(self.errors.values())
+                dropped = sum(self.dropped.values())
+            else:
+                latencies, errors, dropped = self.latencies[name], self.errors[name], self.dropped[name]
+            result[name] = {
+                "requests": len(latencies) + errors,
+                "errors": errors,
+                "dropped": dropped,
+                "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "max_ms": round(max(latencies), 2) if latencies else 0.0,
+            }
+        return result
+
+
+async def drive(client: httpx.AsyncClient, rng: random.Random, sample: dict, mix: Dict[str, float],
+                rps: float, duration: float, max_in_flight: int, recorder: Optional[Recorder]) -> float:
+    """Issue requests at rps for duration seconds; returns the elapsed time including the tail"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+
+    async def call(name: str, path: str, due: float):
+        try:
+            response = await client.get(path)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if recorder is None:
+            return
+        if ok:
+            recorder.latencies[name].append((loop.time() - due) * 1000)
+        else:
+            recorder.errors[name] += 1
+
+    started = loop.time()
+    n = 0
+    while True:
+        due = started + n / rps
+        if due - started >= duration:
+            break
+        n += 1
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = rng.choices(names, weights=weights)[0]
+        if len(in_flight) >= max_in_flight:
+            if recorder is not None:
+                recorder.dropped[name] += 1
+            continue
+        task = asyncio.create_task(call(name, ENDPOINTS[name](rng, sample), due))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return loop.time() - started
+
+
+async def sample_orders(client: httpx.AsyncClient, url: Optional[str]) -> list:
+    """(id, purchase_order_id) pairs to request; read from the database in-process, else via /orders"""
+    if url is None:
+        import server
+        async with server.db_manager.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id, purchase_order_id FROM orders ORDER BY random() LIMIT $1", ORDER_SAMPLE_SIZE
+            )
+        return [(str(row["id"]), row["purchase_order_id"]) for row in rows]
+    response = await client.get("/orders", params={"limit": 100, "paginate": "cursor"})
+    response.raise_for_status()
+    return [(order["id"], order["purchase_order_id"]) for order in response.json()["orders"]]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rps", type=float, default=100.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        import server
+        await server.db_manager.create_pool()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://loadtest", timeout=60)
+
+    try:
+        sample = {"orders": await sample_orders(client, args.url)}
+        if not sample["orders"] and "order" in args.mix:
+            print("⚠️  No orders to request; dropping /orders/{id} from the mix (seed some with benchmarks.load_pos)")
+            args.mix.pop("order")
+
+        if args.warmup:
+            print(f"Warming up for {args.warmup:.0f}s...")
+            await drive(client, rng, sample, args.mix, args.rps, args.warmup, args.max_in_flight, None)
+
+        print(f"Running {args.rps:.0f} rps for {args.duration:.0f}s ({', '.join(f'{k}={v:g}' for k, v in args.mix.items())})")
+        recorder = Recorder()
+        wall_started = time.perf_counter()
+        elapsed = await drive(client, rng, sample, args.mix, args.rps, args.duration, args.max_in_flight, recorder)
+        wall = time.perf_counter() - wall_started
+    finally:
+        await client.aclose()
+        if not args.url:
+            await server.db_manager.close_pool()
+
+    results = recorder.summary(elapsed)
+    print(f"\n{'endpoint':<10} {'requests':>9} {'errors':>7} {'dropped':>8} {'rps':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['requests']:>9} {row['errors']:>7} {row['dropped']:>8} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+    print(f"\nTarget {args.rps:.0f} rps, achieved {results['all']['throughput_rps']:.1f} rps over {wall:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"target_rps": args.rps, "duration": args.duration, "mix": args.mix, "endpoints": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
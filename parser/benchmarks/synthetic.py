@@ -0,0 +1,230 @@
+# benchmarks/synthetic.py
+"""Synthetic purchase orders shaped like the parsed JSON extract_pdf_data returns"""
+import json
+import random
+from datetime import date, timedelta
+
+SIZES = ["XXS", "XS", "S", "M", "L", "XL", "XXL", "XXXL", "XXXXL"]
+COLORS = ["black", "white", "navy", "sand stone", "olive", "red", "blue", "grey", "beige", "burgundy"]
+BUYERS = [f"Buyer {i:03d} Retail GmbH" for i in range(200)]
+SUPPLIERS = [f"Supplier {i:03d} Textiles Ltd" for i in range(50)]
+
+
+def make_parsed_po(rng: random.Random, po_number: int, n_items: int, prefix: str = "BENCH") -> dict:
+    """Build one parsed PO with n_items line items and a random size spread"""
+    order_date = date(2023, 1, 1) + timedelta(days=rng.randrange(0, 3 * 365))
+    line_items = []
+    total_quantity = 0
+    net_value = 0.0
+
+    for i in range(n_items):
+        sizes = {size: (rng.choice([0, 0, 2, 3, 6, 12, 24]) if rng.random() < 0.8 else 0) for size in SIZES}
+        if not any(sizes.values()):
+            sizes["M"] = 6
+        piece = sum(sizes.values())
+        price = round(rng.uniform(4.0, 120.0), 2)
+        total = round(piece * price, 2)
+        total_quantity += piece
+        net_value += total
+        line_items.append({
+            "model_id": f"MDL-{rng.randrange(0, 5000):05d}",
+            "description": f"Garment style {i}",
+            "article": f"ART-{rng.randrange(0, 99999):05d}",
+            "color": rng.choice(COLORS),
+            "sizes": sizes,
+            "piece": piece,
+            "price": price,
+            "total": total
+        })
+
+    net_value = round(net_value, 2)
+    return {
+        "purchase_order_id": f"{prefix}-{po_number:08d}",
+        "order_date": order_date.isoformat(),
+        "buyer": {"name": rng.choice(BUYERS), "address": f"{rng.randrange(1, 999)} Market Street"},
+        "supplier": {"name": rng.choice(SUPPLIERS), "address": f"{rng.randrange(1, 999)} Mill Road"},
+        "currency": "USD",
+        "total_quantity": total_quantity,
+        "net_order_value": net_value,
+        "total_amount": net_value,
+        "line_items": line_items
+    }
+
+
+# --- Realistic generator --------------------------------------------------------
+
+GARMENTS = ["t-shirt", "polo", "hoodie", "sweatshirt", "jogger", "chino", "denim jacket", "parka", "dress", "skirt", "blouse", "cardigan"]
+FABRICS = ["cotton jersey", "organic cotton", "fleece", "twill", "denim", "merino", "linen", "recycled polyester"]
+CURRENCIES = [("USD", 6), ("EUR", 3), ("GBP", 1)]
+# Relative demand per size, in SIZES order
+SIZE_CURVES = {
+    "core": [0, 1, 4, 8, 8, 5, 2, 1, 0],
+    "petite": [2, 6, 8, 5, 2, 1, 0, 0, 0],
+    "plus": [0, 0, 1, 3, 6, 8, 7, 4, 2],
+}
+# Order intake per month (pre-season peaks in Feb/Mar and Aug/Sep)
+MONTH_WEIGHTS = [6, 10, 10, 7, 5, 4, 6, 10, 10, 7, 5, 3]
+PACK_QUANTITIES = [6, 12, 24, 36, 48, 96, 120, 240]
+
+
+class PurchaseOrderGenerator:
+    """Parsed POs in the SCHEMA_INSTRUCTION_PROMPT shape, at any volume.
+
+    Unlike make_parsed_po, a generated order draws from a fixed catalogue:
+    suppliers make a set of models, a model keeps its description, article,
+    price band and colours, buyers order with their own size curve and
+    currency, and dates follow a seasonal intake. Deterministic for a seed.
+    With revision_rate > 0, some orders are re-sends of an earlier PO with
+    changed quantities (the same purchase_order_id), as re-uploads are.
+    """
+
+    def __init__(self, seed: int = 42, prefix: str = "SYNTH", start: date = date(2023, 1, 1), days: int = 3 * 365,
+                 models: int = 5000, buyers: int = 200, suppliers: int = 50,
+                 items_per_order=(1, 12), revision_rate: float = 0.0):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.start = start
+        self.days = days
+        self.items_per_order = items_per_order
+        self.revision_rate = revision_rate
+        self.issued = []
+
+        rng = self.rng
+        self.models = []
+        for n in range(models):
+            garment = rng.choice(GARMENTS)
+            self.models.append({
+                "model_id": f"MDL-{n:05d}",
+                "description": f"{rng.choice(FABRICS)} {garment}",
+                "article": f"ART-{rng.randrange(0, 99999):05d}",
+                "price": round(rng.lognormvariate(3.0, 0.6), 2),
+                "colors": rng.sample(COLORS, rng.randint(1, 4)),
+            })
+        self.suppliers = [
+            {
+                "name": f"Supplier {n:03d} Textiles Ltd",
+                "address": f"{rng.randrange(1, 999)} Mill Road",
+                "models": rng.sample(self.models, min(len(self.models), rng.randint(20, 200))),
+            }
+            for n in range(suppliers)
+        ]
+        self.buyers = [
+            {
+                "name": f"Buyer {n:03d} Retail GmbH",
+                "address": f"{rng.randrange(1, 999)} Market Street",
+                "sizes": SIZE_CURVES[rng.choice(["core", "core", "petite", "plus"])],
+                "currency": rng.choices([c for c, _ in CURRENCIES], weights=[w for _, w in CURRENCIES])[0],
+            }
+            for n in range(buyers)
+        ]
+
+    def order_date(self) -> date:
+        while True:
+            day = self.start + timedelta(days=self.rng.randrange(0, self.days))
+            if self.rng.random() * max(MONTH_WEIGHTS) < MONTH_WEIGHTS[day.month - 1]:
+                return day
+
+    def sizes(self, curve: list) -> dict:
+        quantities = dict.fromkeys(SIZES, 0)
+        for size in self.rng.choices(SIZES, weights=curve, k=self.rng.choice(PACK_QUANTITIES)):
+            quantities[size] += 1
+        return quantities
+
+    def line_item(self, model: dict, buyer: dict) -> dict:
+        sizes = self.sizes(buyer["sizes"])
+        piece = sum(sizes.values())
+        price = round(model["price"] * self.rng.uniform(0.9, 1.1), 2)
+        return {
+            "model_id": model["model_id"],
+            "description": model["description"],
+            "article": model["article"],
+            "color": self.rng.choice(model["colors"]),
+            "sizes": sizes,
+            "piece": piece,
+            "price": price,
+            "total": round(piece * price, 2)
+        }
+
+    def make(self, po_number: int) -> dict:
+        """A new PO"""
+        rng = self.rng
+        buyer = rng.choice(self.buyers)
+        supplier = rng.choice(self.suppliers)
+        n_items = min(len(supplier["models"]), rng.randint(*self.items_per_order))
+        line_items = [self.line_item(model, buyer) for model in rng.sample(supplier["models"], n_items)]
+        return finish_parsed_po({
+            "purchase_order_id": f"{self.prefix}-{po_number:08d}",
+            "order_date": self.order_date().isoformat(),
+            "buyer": {"name": buyer["name"], "address": buyer["address"]},
+            "supplier": {"name": supplier["name"], "address": supplier["address"]},
+            "currency": buyer["currency"],
+            "line_items": line_items
+        })
+
+    def revise(self, parsed: dict) -> dict:
+        """A re-sent PO: same id, some quantities changed, sometimes a line added or dropped"""
+        revised = json.loads(json.dumps(parsed))
+        items = revised["line_items"]
+        for item in items:
+            if self.rng.random() < 0.5:
+                size = self.rng.choice(SIZES)
+                item["sizes"][size] = max(0, item["sizes"][size] + self.rng.choice([-6, -2, 2, 6, 12]))
+                item["piece"] = sum(item["sizes"].values())
+                item["total"] = round(item["piece"] * item["price"], 2)
+        if len(items) > 1 and self.rng.random() < 0.2:
+            items.pop(self.rng.randrange(len(items)))
+        return finish_parsed_po(revised)
+
+    def generate(self, count: int, first_po_number: int = 0):
+        """Yield count POs (new ones numbered from first_po_number, plus revisions per revision_rate)"""
+        po_number = first_po_number
+        for _ in range(count):
+            if self.issued and self.rng.random() < self.revision_rate:
+                index = self.rng.randrange(len(self.issued))
+                parsed = self.revise(self.issued[index])
+                self.issued[index] = parsed
+            else:
+                parsed = self.make(po_number)
+                po_number += 1
+                if self.revision_rate:
+                    self.issued.append(parsed)
+            yield parsed
+
+
+def finish_parsed_po(parsed: dict) -> dict:
+    """Fill in the order totals from the line items"""
+    parsed["total_quantity"] = sum(item["piece"] for item in parsed["line_items"])
+    parsed["net_order_value"] = round(sum(item["total"] for item in parsed["line_items"]), 2)
+    parsed["total_amount"] = parsed["net_order_value"]
+    return parsed
+
+
+def check_parsed_po(parsed: dict) -> list:
+    """Ways a parsed PO departs from the SCHEMA_INSTRUCTION_PROMPT schema ([] when it conforms)"""
+    problems = []
+    for key, kind in (("purchase_order_id", str), ("order_date", str), ("currency", str),
+                      ("total_quantity", (int, float)), ("net_order_value", (int, float)),
+                      ("total_amount", (int, float)), ("line_items", list)):
+        if not isinstance(parsed.get(key), kind):
+            problems.append(f"{key} is missing or not a {kind}")
+    for party in ("buyer", "supplier"):
+        if not isinstance(parsed.get(party), dict) or set(parsed[party]) != {"name", "address"}:
+            problems.append(f"{party} must have exactly name and address")
+    try:
+        date.fromisoformat(parsed.get("order_date") or "")
+    except ValueError:
+        problems.append("order_date is not YYYY-MM-DD")
+
+    for n, item in enumerate(parsed.get("line_items") or []):
+        for key, kind in (("model_id", str), ("description", str), ("article", str), ("color", str),
+                          ("piece", (int, float)), ("price", (int, float)), ("total", (int, float))):
+            if not isinstance(item.get(key), kind):
+                problems.append(f"line_items[{n}].{key} is missing or not a {kind}")
+        sizes = item.get("sizes")
+        if not isinstance(sizes, dict) or list(sizes) != SIZES:
+            problems.append(f"line_items[{n}].sizes must have the keys {SIZES}")
+        elif item.get("piece") != sum(sizes.values()):
+            problems.append(f"line_items[{n}].piece doesn't match its sizes")
+        if item.get("color") != (item.get("color") or "").strip().lower():
+            problems.append(f"line_items[{n}].color isn't normalised")
+    return problems
@@ -0,0 +1,254 @@
+# cache.py
+"""In-process read caches and their write invalidation.
+
+Every committed write bumps `data_generation`; cached entries remember the
+generation they were loaded under and are stale once it moves on. Writes also
+NOTIFY the po_data_changed channel in their transaction, and each worker's
+InvalidationListener bumps its own generation when that arrives, so caches
+stay correct when the API runs as several processes.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+import asyncpg
+
+INVALIDATION_CHANNEL = "po_data_changed"
+
+
+class DataGeneration:
+    """Counter bumped after every committed write to orders/line_items"""
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self) -> int:
+        self.value += 1
+        return self.value
+
+
+data_generation = DataGeneration()
+
+
+def make_etag(payload) -> str:
+    """Strong ETag over the canonical JSON form of a payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against our ETag (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
+
+
+class FilterCache:
+    """Caches the /filters payload until the next write"""
+
+    def __init__(self):
+        self.payload = None
+        self.etag = None
+        self.generation = -1
+        self.hits = 0
+        self.misses = 0
+        self._lock = asyncio.Lock()
+
+    async def get(self, loader: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+        """Return (payload, etag), calling loader only when the cached copy is stale"""
+        if self.payload is not None and self.generation == data_generation.value:
+            self.hits += 1
+            return self.payload, self.etag
+
+        async with self._lock:
+            # Another request may have reloaded while we waited for the lock
+            if self.payload is not None and self.generation == data_generation.value:
+                self.hits += 1
+                return self.payload, self.etag
+
+            self.misses += 1
+            generation = data_generation.value
+            payload = await loader()
+            etag = make_etag(payload)
+
+            # A write that committed mid-load may not be in payload; serve it
+            # but don't keep it
+            if data_generation.value == generation:
+                self.payload, self.etag, self.generation = payload, etag, generation
+            return payload, etag
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "generation": self.generation,
+            "current_generation": data_generation.value,
+            "etag": self.etag
+        }
+
+
+filter_cache = FilterCache()
+
+
+class QueryCache:
+    """Bounded LRU cache with a TTL, keyed on normalised query parameters.
+
+    Entries also die when data_generation moves on. Concurrent misses for the
+    same key share one load (single flight); the load runs as its own task so
+    a disconnecting client doesn't cancel it for everyone else waiting.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 30.0, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (generation, expires_at, value)
+        self._inflight = {}  # (generation, key) -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        generation, expires_at, value = entry
+        if generation != data_generation.value or expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, generation: int, value):
+        # Don't keep results that may predate a write committed during the load
+        if generation != data_generation.value:
+            return
+        self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable]):
+        """Return the cached value for key, or run loader once for all concurrent callers"""
+        if not self.enabled:
+            return await loader()
+
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[2]
+
+        generation = data_generation.value
+        flight_key = (generation, key)
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+
+            async def load():
+                try:
+                    value = await loader()
+                    self._store(key, generation, value)
+                    return value
+                finally:
+                    self._inflight.pop(flight_key, None)
+
+            task = asyncio.ensure_future(load())
+            self._inflight[flight_key] = task
+
+        return await asyncio.shield(task)
+
+    def get(self, key: Hashable):
+        """The cached value for key, or None; for values computed by the caller and stored with put()"""
+        if not self.enabled:
+            return None
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: Hashable, generation: int, value):
+        """Cache a value loaded under data generation `generation` (read before loading)"""
+        if self.enabled:
+            self._store(key, generation, value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "in_flight": len(self._inflight),
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+        }
+
+
+class InvalidationListener:
+    """LISTENs for writes committed by other workers and bumps data_generation"""
+
+    def __init__(self, dsn: str, reconnect_delay: float = 5.0):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.notifications = 0
+        self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.notifications += 1
+        data_generation.bump()
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                await conn.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+                # Anything committed while we weren't listening is unknown
+                data_generation.bump()
+                while not conn.is_closed():
+                    await asyncio.sleep(self.reconnect_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Cache invalidation listener error: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            data_generation.bump()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
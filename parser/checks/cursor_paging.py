@@ -0,0 +1,114 @@
+# checks/cursor_paging.py
+"""Check that cursor pagination reaches exactly the orders page/limit mode lists.
+
+Saves --orders synthetic CURSORCHECK- POs, about a quarter of them with an
+order date that doesn't parse (stored as NULL), then for every sort_by in both
+sort orders follows next_cursor from the first page to the end, and
+prev_cursor from the last page back to the start. Each walk must end within
+the expected number of pages, never repeat an order and return the same
+orders as the page/limit listing. The check's orders are deleted again at the
+end. Needs the same environment as the API (.env with the database and
+GEMINI_API_KEY, which is never called). Run from parser/:
+
+    python -m checks.cursor_paging --orders 23 --limit 4
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+from benchmarks.synthetic import make_parsed_po
+import server
+
+PREFIX = "CURSORCHECK"
+SORTS = [(sort_by, sort_order) for sort_by in ("order_date", "total_amount", "item_count") for sort_order in ("asc", "desc")]
+
+
+async def page_ids(sort_by: str, sort_order: str, limit: int) -> list:
+    ids, page = [], 1
+    while True:
+        response = await server.get_orders_by_page(page, limit, PREFIX, "contains", None, None, None, sort_by, sort_order)
+        ids.extend(str(order["id"]) for order in response["orders"])
+        if page >= response["total_pages"]:
+            return ids
+        page += 1
+
+
+async def cursor_walk(sort_by: str, sort_order: str, limit: int, max_pages: int, backwards: bool) -> list:
+    """Ids in listing order; raises RuntimeError when the walk doesn't end"""
+    cursor, key = None, "next_cursor"
+    if backwards:
+        # Find the last page going forwards, then walk back from it
+        for _ in range(max_pages):
+            response = await server.get_orders_by_cursor(limit, PREFIX, None, None, None, sort_by, sort_order, cursor, False)
+            if not response["next_cursor"]:
+                break
+            cursor = response["next_cursor"]
+        else:
+            raise RuntimeError(f"still returning a next_cursor after {max_pages} pages")
+        pages = [[str(order["id"]) for order in response["orders"]]]
+        key = "prev_cursor"
+        cursor = response["prev_cursor"]
+        if not cursor:
+            return pages[0]
+    else:
+        pages = []
+
+    for _ in range(max_pages):
+        response = await server.get_orders_by_cursor(limit, PREFIX, None, None, None, sort_by, sort_order, cursor, False)
+        pages.append([str(order["id"]) for order in response["orders"]])
+        cursor = response[key]
+        if not cursor:
+            if backwards:
+                pages.reverse()
+            return [order_id for page in pages for order_id in page]
+    raise RuntimeError(f"still returning a {key} after {max_pages} pages")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check cursor pagination against page/limit listings")
+    parser.add_argument("--orders", type=int, default=23)
+    parser.add_argument("--limit", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    await server.db_manager.create_pool()
+    ok = True
+    try:
+        for n in range(args.orders):
+            parsed = make_parsed_po(rng, n, rng.randint(1, 4), prefix=PREFIX)
+            if n % 4 == 0:
+                parsed["order_date"] = "unknown"  # doesn't parse: saved as NULL
+            await server.save_to_database(parsed)
+
+        # A full walk needs ceil(orders / limit) pages; allow a few more before calling it a loop
+        max_pages = -(-args.orders // args.limit) + 3
+        for sort_by, sort_order in SORTS:
+            expected = await page_ids(sort_by, sort_order, args.limit)
+            for backwards in (False, True):
+                label = f"sort_by={sort_by} sort_order={sort_order} {'prev' if backwards else 'next'}_cursor"
+                try:
+                    walked = await cursor_walk(sort_by, sort_order, args.limit, max_pages, backwards)
+                except RuntimeError as e:
+                    ok = False
+                    print(f"❌ {label}: {e}")
+                    continue
+                if len(walked) != len(set(walked)) or set(walked) != set(expected):
+                    ok = False
+                    print(f"❌ {label}: {len(set(walked))} distinct orders of {len(walked)} returned, "
+                          f"page/limit lists {len(expected)}; {len(set(expected) - set(walked))} never reached")
+                else:
+                    print(f"✅ {label}: all {len(expected)} orders, once each")
+    finally:
+        async with server.db_manager.acquire() as conn:
+            remaining = await conn.fetch("SELECT purchase_order_id FROM orders WHERE purchase_order_id LIKE $1", f"{PREFIX}-%")
+        for row in remaining:
+            await server.db_manager.delete_purchase_order(row["purchase_order_id"])
+        await server.db_manager.close_pool()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
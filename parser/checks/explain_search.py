@@ -0,0 +1,83 @@
+# checks/explain_search.py
+"""Check that GET /orders?search=... is served by the trigram indexes.
+
+Seeds a disposable database up to --orders BENCH- orders (1M by default),
+then EXPLAINs the count and page queries the API builds for each search mode
+and fails unless a trigram index is used and orders is never seq scanned.
+Run from parser/ after `python migrate.py`:
+
+    python -m checks.explain_search --orders 1000000
+"""
+import argparse
+import asyncio
+import sys
+
+import asyncpg
+
+from benchmarks.common import database_url
+from benchmarks.seed import seed_orders_bulk
+from checks.plans import explain, seq_scanned_tables, used_indexes
+from queries import build_order_filters, build_orders_page_query, where_sql
+
+TRGM_INDEXES = {
+    "idx_orders_purchase_order_id_trgm",
+    "idx_orders_buyer_name_trgm",
+    "idx_orders_supplier_name_trgm",
+}
+
+CASES = [
+    ("contains", "Buyer 0042"),
+    ("contains", "00123456"),
+    ("contains", "Supplier 017 1f"),
+    ("ranked", "Buyer 0042"),
+    ("ranked", "Supplier 017"),
+]
+
+
+async def check_case(conn, search_mode: str, term: str, analyze: bool) -> bool:
+    where_conditions, params = build_order_filters(search=term, search_mode=search_mode)
+    where_clause = where_sql(where_conditions)
+    queries = {
+        "count": (f"SELECT COUNT(*) FROM orders o {where_clause}", params),
+        "page": (
+            build_orders_page_query(where_clause, "order_date", "desc", len(params), search_mode == "ranked"),
+            params + [50, 0]
+        ),
+    }
+
+    ok = True
+    for name, (query, query_params) in queries.items():
+        plan = await explain(conn, query, query_params, analyze=analyze)
+        trgm_used = used_indexes(plan) & TRGM_INDEXES
+        seq_scans = seq_scanned_tables(plan) & {"orders"}
+        passed = bool(trgm_used) and not seq_scans
+        ok = ok and passed
+        timing = f" {plan['_execution_ms']:.1f} ms" if plan["_execution_ms"] is not None else ""
+        print(f"{'PASS' if passed else 'FAIL'} {search_mode:<8} {term!r:<20} {name:<5} "
+              f"indexes={sorted(trgm_used) or '-'} seq_scan={sorted(seq_scans) or '-'}{timing}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--analyze", action="store_true", help="run EXPLAIN ANALYZE and print execution times")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        added = await seed_orders_bulk(conn, args.orders)
+        print(f"Seeded {added} new orders (target {args.orders})\n")
+
+        results = [await check_case(conn, mode, term, args.analyze) for mode, term in CASES]
+    finally:
+        await conn.close()
+
+    if not all(results):
+        print("\nSearch is not using the trigram indexes; run `python migrate.py` and re-check.")
+        sys.exit(1)
+    print("\nAll search query shapes use the trigram indexes.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
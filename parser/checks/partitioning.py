@@ -0,0 +1,106 @@
+# checks/partitioning.py
+"""Check that a partitioning backfill stays verifiable when order dates change.
+
+Saves --orders synthetic PARTCHECK- POs, runs `partitioning.py prepare` and a
+backfill, moves every check order's order_date forward with a plain
+UPDATE orders, plants a stale copy of some rows under their old date (what a
+batch racing the date change writes), backfills again and asserts that
+verify() reports no problems. The staging table, its triggers and the check's
+orders are removed again at the end.
+
+Run from parser/ after `python migrate.py`, on a database whose line_items
+isn't partitioned or being migrated:
+
+    python -m checks.partitioning --orders 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+import asyncpg
+
+from benchmarks.synthetic import make_parsed_po
+from database import database_url
+import partitioning
+import server
+
+PREFIX = "PARTCHECK"
+
+
+async def teardown(conn):
+    await conn.execute("DROP TRIGGER IF EXISTS line_items_mirror_partitioned ON line_items")
+    await conn.execute("DROP TRIGGER IF EXISTS line_items_order_date_sync ON orders")
+    await conn.execute("DROP FUNCTION IF EXISTS mirror_line_items_partitioned()")
+    await conn.execute("DROP FUNCTION IF EXISTS sync_line_items_order_date()")
+    await conn.execute(f"DROP TABLE IF EXISTS {partitioning.STAGING_TABLE} CASCADE")
+
+
+async def report(conn, step: str) -> bool:
+    problems = await partitioning.verify(conn)
+    if not problems:
+        print(f"✅ {step}: {partitioning.STAGING_TABLE} matches line_items")
+        return True
+    for problem in problems:
+        print(f"❌ {step}: {problem}")
+    return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check that backfill survives order_date changes")
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    conn = await asyncpg.connect(database_url())
+    if await partitioning.partitioned_parent(conn) is not None:
+        print("❌ line_items is partitioned or a migration is in progress; run this on another database")
+        await conn.close()
+        sys.exit(1)
+
+    await server.db_manager.create_pool()
+    ok = True
+    moved = []
+    try:
+        for n in range(args.orders):
+            await server.save_to_database(make_parsed_po(rng, n, rng.randint(1, 8), prefix=PREFIX))
+
+        await partitioning.prepare(conn, ahead=3)
+        await partitioning.backfill(conn, args.batch_size, pause=0.0)
+        ok &= await report(conn, "first backfill")
+
+        moved = await conn.fetch("""
+        UPDATE orders SET order_date = order_date + 45
+        WHERE purchase_order_id LIKE $1
+        RETURNING id, order_date - 45 as old_date
+        """, f"{PREFIX}-%")
+        print(f"📅 Moved {len(moved)} orders' order_date forward 45 days")
+        for row in moved[: max(1, len(moved) // 5)]:
+            await conn.execute(f"""
+            INSERT INTO {partitioning.STAGING_TABLE}
+            SELECT id, order_id, model_id, item_code, description, color, size, quantity,
+                   unit_price, amount, delivery_date, created_at, $2::date
+            FROM {partitioning.STAGING_TABLE} WHERE order_id = $1
+            """, row["id"], row["old_date"])
+
+        await partitioning.backfill(conn, args.batch_size, pause=0.0)
+        ok &= await report(conn, "backfill after order_date changes")
+    finally:
+        # Put the dates back so the rollups match the orders again before deleting them
+        if moved:
+            await conn.execute("UPDATE orders SET order_date = order_date - 45 WHERE id = ANY($1::uuid[])",
+                               [row["id"] for row in moved])
+        await teardown(conn)
+        remaining = await conn.fetch("SELECT purchase_order_id FROM orders WHERE purchase_order_id LIKE $1", f"{PREFIX}-%")
+        for row in remaining:
+            await server.db_manager.delete_purchase_order(row["purchase_order_id"])
+        await conn.close()
+        await server.db_manager.close_pool()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+# checks/plan_regression.py
+"""Query-plan regression suite for GET /orders and GET /orders/{id}.
+
+Seeds the database up to --orders BENCH- orders (with line items), then runs
+every query shape the two endpoints generate, for every filter combination,
+sort and pagination mode, under EXPLAIN (ANALYZE, BUFFERS). A shape fails when
+
+  * its plan seq scans a large table (over --large-rows rows) that the stored
+    baseline doesn't list for that shape, or
+  * its best execution time over --repeat runs exceeds the baseline's by more
+    than --tolerance (a factor) plus --slack-ms.
+
+Record a baseline on a known-good tree, then re-run after a change (from parser/,
+after `python migrate.py`, against a disposable database):
+
+    python -m checks.plan_regression --orders 200000 --update-baseline
+    python -m checks.plan_regression --orders 200000
+
+Baselines are machine specific; keep one per machine (see --baseline). --match
+restricts the run to shapes whose name contains the given text.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from datetime import date
+
+import asyncpg
+
+from benchmarks.common import database_url
+from benchmarks.seed import seed_orders
+from checks.plans import explain, seq_scanned_tables
+from queries import (
+    build_line_item_filters, build_line_items_keyset_query, build_line_items_page_query,
+    build_matching_items_query, build_order_filters, build_order_lookup, build_orders_keyset_query,
+    build_orders_count_query, build_orders_page_query, decode_cursor, line_item_cursor, order_cursor, where_sql
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_baseline.json")
+
+# Filter values that match a slice of the benchmarks.synthetic data
+ORDER_FILTER_VALUES = {
+    "search": "Buyer 042",
+    "model_id": "MDL-0004",
+    "color": "navy",
+    "size": "M",
+    "dates": (date(2024, 3, 1), date(2024, 3, 31)),
+}
+SORTS = [(sort_by, sort_order) for sort_by in ("order_date", "total_amount", "item_count") for sort_order in ("desc", "asc")]
+ORDERS_LIMIT = 50
+ORDER_ITEMS_LIMIT = 10
+
+
+def order_filter_combinations():
+    """Every subset of the /orders filters, with search in both modes; yields (label, kwargs)"""
+    fields = list(ORDER_FILTER_VALUES)
+    for mask in itertools.product((False, True), repeat=len(fields)):
+        chosen = [field for field, on in zip(fields, mask) if on]
+        search_modes = ("contains", "ranked") if "search" in chosen else ("contains",)
+        for search_mode in search_modes:
+            kwargs = {"search_mode": search_mode}
+            for field in chosen:
+                if field == "dates":
+                    kwargs["date_from"], kwargs["date_to"] = ORDER_FILTER_VALUES["dates"]
+                else:
+                    kwargs[field] = ORDER_FILTER_VALUES[field]
+            label = "+".join(f"search:{search_mode}" if field == "search" else field for field in chosen) or "unfiltered"
+            yield label, kwargs
+
+
+async def order_list_shapes(conn):
+    """Yield (name, query, params) for every GET /orders query shape"""
+    for label, kwargs in order_filter_combinations():
+        ranked = kwargs["search_mode"] == "ranked"
+        where_conditions, params = build_order_filters(
+            kwargs.get("search"), kwargs.get("model_id"), kwargs.get("color"), kwargs.get("size"),
+            kwargs["search_mode"], kwargs.get("date_from"), kwargs.get("date_to")
+        )
+        where_clause = where_sql(where_conditions)
+        yield f"orders {label} count", build_orders_count_query(where_clause), params
+
+        for sort_by, sort_order in SORTS:
+            sort = f"{sort_by}.{sort_order}"
+            page_query = build_orders_page_query(where_clause, sort_by, sort_order, len(params), ranked)
+            page_params = params + [ORDERS_LIMIT, 0]
+            yield f"orders {label} page sort={sort}", page_query, page_params
+            window_query = build_orders_page_query(where_clause, sort_by, sort_order, len(params), ranked, with_total=True)
+            yield f"orders {label} page+count sort={sort}", window_query, page_params
+
+            if (sort_by, sort_order) == SORTS[0]:
+                # The item fetch doesn't depend on the sort; run it once per filter set
+                orders = await conn.fetch(page_query, *page_params)
+                items_query, items_params = build_matching_items_query(
+                    [order["id"] for order in orders], kwargs.get("model_id"), kwargs.get("color"),
+                    kwargs.get("size"), kwargs.get("date_from"), kwargs.get("date_to")
+                )
+                yield f"orders {label} items", items_query, items_params
+
+            if ranked:
+                continue  # ranked search has no cursor mode
+            query, keyset_params = build_orders_keyset_query(where_conditions, sort_by, sort_order, None, len(params))
+            first_params = params + keyset_params + [ORDERS_LIMIT + 1]
+            yield f"orders {label} cursor-first sort={sort}", query, first_params
+
+            rows = await conn.fetch(query, *first_params)
+            if len(rows) > ORDERS_LIMIT:
+                cursor = decode_cursor(order_cursor(rows[ORDERS_LIMIT - 1], sort_by, sort_order, "next"))
+                query, keyset_params = build_orders_keyset_query(where_conditions, sort_by, sort_order, cursor, len(params))
+                yield f"orders {label} cursor-next sort={sort}", query, params + keyset_params + [ORDERS_LIMIT + 1]
+
+
+async def order_detail_shapes(conn):
+    """Yield (name, query, params) for every GET /orders/{id} query shape, on the order with most items"""
+    order_id = await conn.fetchval("""
+    SELECT order_id FROM line_items GROUP BY order_id ORDER BY COUNT(*) DESC LIMIT 1
+    """)
+    if order_id is None:
+        return
+    for label, key in (("by-id", str(order_id)), ("by-po", None)):
+        if key is None:
+            key = await conn.fetchval("SELECT purchase_order_id FROM orders WHERE id = $1", order_id)
+        query, params = build_order_lookup(key)
+        yield f"order lookup {label}", query, params
+
+    order = await conn.fetchrow("SELECT * FROM orders WHERE id = $1", order_id)
+    sample = await conn.fetchrow("SELECT model_id, color, size FROM line_items WHERE order_id = $1 LIMIT 1", order_id)
+    fields = ("model_id", "color", "size")
+    for mask in itertools.product((False, True), repeat=len(fields)):
+        kwargs = {field: sample[field] for field, on in zip(fields, mask) if on}
+        label = "+".join(kwargs) or "unfiltered"
+        where_conditions, params = build_line_item_filters(order, **kwargs)
+        where_clause = " AND ".join(where_conditions)
+
+        yield f"order items {label} count", f"SELECT COUNT(*) FROM line_items li WHERE {where_clause}", params
+        yield (f"order items {label} page", build_line_items_page_query(where_clause, len(params)),
+               params + [ORDER_ITEMS_LIMIT, 0])
+
+        query, keyset_params = build_line_items_keyset_query(where_conditions, None, len(params))
+        first_params = params + keyset_params + [ORDER_ITEMS_LIMIT + 1]
+        yield f"order items {label} cursor-first", query, first_params
+        rows = await conn.fetch(query, *first_params)
+        if len(rows) > ORDER_ITEMS_LIMIT:
+            cursor = decode_cursor(line_item_cursor(rows[ORDER_ITEMS_LIMIT - 1], "next"))
+            query, keyset_params = build_line_items_keyset_query(where_conditions, cursor, len(params))
+            yield f"order items {label} cursor-next", query, params + keyset_params + [ORDER_ITEMS_LIMIT + 1]
+
+
+async def large_tables(conn, min_rows: int) -> set:
+    """Tables (and partitions) the planner estimates at min_rows rows or more"""
+    rows = await conn.fetch("""
+    SELECT relname FROM pg_class
+    WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND reltuples >= $1
+    """, min_rows)
+    return {row["relname"] for row in rows}
+
+
+async def measure(conn, query: str, params: list, repeat: int) -> dict:
+    """Best-of-repeat execution time, plus the seq scans and buffer counts of that run"""
+    best = None
+    for _ in range(repeat):
+        plan = await explain(conn, query, params, analyze=True, buffers=True)
+        if best is None or plan["_execution_ms"] < best["_execution_ms"]:
+            best = plan
+    return {
+        "execution_ms": round(best["_execution_ms"], 3),
+        "seq_scans": sorted(seq_scanned_tables(best)),
+        "shared_hit": best.get("Shared Hit Blocks", 0),
+        "shared_read": best.get("Shared Read Blocks", 0),
+    }
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"shapes": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def judge(name: str, result: dict, baseline: dict, large: set, tolerance: float, slack_ms: float) -> list:
+    """Reasons this shape fails against its baseline ([] when it passes)"""
+    expected = baseline["shapes"].get(name)
+    problems = []
+    known_scans = set(expected["seq_scans"]) if expected else set()
+    new_scans = (set(result["seq_scans"]) & large) - known_scans
+    if new_scans:
+        problems.append(f"seq scan on {', '.join(sorted(new_scans))}")
+    if expected:
+        limit = expected["execution_ms"] * tolerance + slack_ms
+        if result["execution_ms"] > limit:
+            problems.append(f"{result['execution_ms']:.1f} ms > {limit:.1f} ms (baseline {expected['execution_ms']:.1f} ms)")
+    return problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200000, help="seeded BENCH- orders to ensure exist")
+    parser.add_argument("--min-items", type=int, default=2, help="fewest line items (models) per seeded order")
+    parser.add_argument("--max-items", type=int, default=10, help="most line items (models) per seeded order")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="record this run as the baseline instead of checking")
+    parser.add_argument("--repeat", type=int, default=3, help="EXPLAIN ANALYZE runs per shape (the fastest counts)")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor over the baseline")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="absolute slack added to every time limit")
+    parser.add_argument("--large-rows", type=int, default=10000, help="tables at least this big must not be seq scanned")
+    parser.add_argument("--match", help="only run shapes whose name contains this text")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        added = await seed_orders(conn, args.orders, items_per_order=(args.min_items, args.max_items))
+        print(f"Seeded {added} new orders (target {args.orders})")
+        dataset = {
+            "orders": await conn.fetchval("SELECT COUNT(*) FROM orders"),
+            "line_items": await conn.fetchval("SELECT COUNT(*) FROM line_items"),
+        }
+        large = await large_tables(conn, args.large_rows)
+        print(f"Dataset: {dataset['orders']} orders, {dataset['line_items']} line items; large tables: {sorted(large)}\n")
+
+        baseline = load_baseline(args.baseline)
+        if not args.update_baseline:
+            if not baseline["shapes"]:
+                print(f"❌ No baseline at {args.baseline}; record one with --update-baseline")
+                sys.exit(1)
+            if baseline.get("dataset") != dataset:
+                print(f"⚠️  Baseline was recorded on {baseline.get('dataset')}; timings may not compare\n")
+
+        results = {}
+        failures = {}
+        for shapes in (order_list_shapes(conn), order_detail_shapes(conn)):
+            async for name, query, params in shapes:
+                if args.match and args.match not in name:
+                    continue
+                result = await measure(conn, query, params, args.repeat)
+                results[name] = result
+                scans = ",".join(result["seq_scans"]) or "-"
+                buffers = f"hit={result['shared_hit']} read={result['shared_read']}"
+                if args.update_baseline:
+                    flag = "⚠️ " if set(result["seq_scans"]) & large else "  "
+                    print(f"{flag}REC  {name:<70} {result['execution_ms']:>9.2f} ms  seq_scan={scans}  {buffers}")
+                    continue
+                problems = judge(name, result, baseline, large, args.tolerance, args.slack_ms)
+                if problems:
+                    failures[name] = problems
+                status = "FAIL" if problems else ("NEW " if name not in baseline["shapes"] else "PASS")
+                print(f"{status} {name:<70} {result['execution_ms']:>9.2f} ms  seq_scan={scans}  {buffers}"
+                      + (f"  <- {'; '.join(problems)}" if problems else ""))
+    finally:
+        await conn.close()
+
+    if args.update_baseline:
+        if args.match:
+            # Partial runs update their shapes and keep the rest
+            baseline["shapes"].update(results)
+            results = baseline["shapes"]
+        with open(args.baseline, "w") as f:
+            json.dump({"dataset": dataset, "shapes": results}, f, indent=2, sort_keys=True)
+        print(f"\n🔧 Recorded {len(results)} shapes in {args.baseline}")
+        print("   Shapes marked ⚠️  seq scan a large table; they are accepted from now on, so check them first.")
+        return
+
+    if failures:
+        print(f"\n❌ {len(failures)} of {len(results)} query shapes regressed")
+        sys.exit(1)
+    print(f"\n✅ All {len(results)} query shapes are within the baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
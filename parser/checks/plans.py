@@ -0,0 +1,35 @@
+# checks/plans.py
+"""Helpers for inspecting EXPLAIN (FORMAT JSON) output"""
+import json
+
+
+async def explain(conn, query: str, params: list, analyze: bool = False, buffers: bool = False) -> dict:
+    """Return the root plan node (plus timing keys when analyzing) for a query"""
+    options = ["FORMAT JSON"]
+    if analyze:
+        options.append("ANALYZE")
+    if buffers:
+        options.append("BUFFERS")
+    raw = await conn.fetchval(f"EXPLAIN ({', '.join(options)}) {query}", *params)
+    result = json.loads(raw)[0] if isinstance(raw, str) else raw[0]
+    root = result["Plan"]
+    root["_execution_ms"] = result.get("Execution Time")
+    root["_planning_ms"] = result.get("Planning Time")
+    return root
+
+
+def iter_nodes(plan: dict):
+    """Yield every node of a plan tree, depth first"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from iter_nodes(child)
+
+
+def seq_scanned_tables(plan: dict) -> set:
+    """Tables read with a sequential scan anywhere in the plan"""
+    return {node["Relation Name"] for node in iter_nodes(plan) if node["Node Type"] == "Seq Scan"}
+
+
+def used_indexes(plan: dict) -> set:
+    """Indexes touched by any index, index-only or bitmap index scan"""
+    return {node["Index Name"] for node in iter_nodes(plan) if "Index Name" in node}
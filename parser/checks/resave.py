@@ -0,0 +1,67 @@
+# checks/resave.py
+"""Check that re-saving an identical parsed PO reports no line item changes.
+
+Saves --orders synthetic RESAVECHECK- POs shaped like raw Gemini output
+(quantities as floats such as 12.0, prices with more than two decimals), then
+saves every one again unchanged with LINE_ITEM_SAVE_MODE=reconcile and
+asserts that each re-save reports 0 inserted, updated and deleted rows. The
+check's orders are deleted again at the end. Needs the same environment as
+the API (.env with the database and GEMINI_API_KEY, which is never called).
+Run from parser/ after `python migrate.py`:
+
+    python -m checks.resave --orders 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+from benchmarks.synthetic import make_parsed_po
+import server
+
+PREFIX = "RESAVECHECK"
+
+
+def as_extracted(rng: random.Random, parsed: dict) -> dict:
+    """The PO as the model tends to return it: float quantities and unrounded prices"""
+    for item in parsed["line_items"]:
+        item["sizes"] = {size: float(quantity) for size, quantity in item["sizes"].items()}
+        item["price"] = item["price"] + rng.choice([0.0, 0.001, 0.004, 0.005, 0.0049999, 1 / 3])
+    return parsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check that identical re-saves report 0 updated line items")
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    server.LINE_ITEM_SAVE_MODE = "reconcile"
+    await server.db_manager.create_pool()
+    failures = 0
+    try:
+        parsed_orders = [as_extracted(rng, make_parsed_po(rng, n, rng.randint(1, 8), prefix=PREFIX))
+                         for n in range(args.orders)]
+        for parsed in parsed_orders:
+            await server.save_to_database(parsed)
+
+        for parsed in parsed_orders:
+            changes = (await server.save_to_database(parsed))["line_items"]
+            if changes["inserted"] or changes["updated"] or changes["deleted"]:
+                failures += 1
+                print(f"❌ {parsed['purchase_order_id']}: re-save reported {changes}")
+        if not failures:
+            print(f"✅ Re-saved {len(parsed_orders)} identical orders: 0 line items inserted, updated or deleted")
+    finally:
+        async with server.db_manager.acquire() as conn:
+            remaining = await conn.fetch("SELECT purchase_order_id FROM orders WHERE purchase_order_id LIKE $1", f"{PREFIX}-%")
+        for row in remaining:
+            await server.db_manager.delete_purchase_order(row["purchase_order_id"])
+        await server.db_manager.close_pool()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
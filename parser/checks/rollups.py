@@ -0,0 +1,102 @@
+# checks/rollups.py
+"""Check that save_to_database keeps line_item_rollups equal to a full recompute.
+
+Saves --orders synthetic ROLLUPCHECK- POs (concurrently), re-saves half of them
+with changed quantities, items, colors and order months through both
+LINE_ITEM_SAVE_MODEs, deletes a quarter, and compares the rollups with a
+recompute after each step. The check's orders are deleted again at the end.
+Needs the same environment as the API (.env with the database and
+GEMINI_API_KEY, which is never called). Run from parser/ after `python migrate.py`:
+
+    python -m checks.rollups --orders 200
+"""
+import argparse
+import asyncio
+import copy
+import random
+import sys
+from datetime import date, timedelta
+
+from benchmarks.synthetic import COLORS, make_parsed_po
+from rollups import find_drift
+import server
+
+PREFIX = "ROLLUPCHECK"
+
+
+def mutate(rng: random.Random, parsed: dict) -> dict:
+    """Re-upload variant of a parsed PO: new month, changed sizes and colors, an item dropped and one added"""
+    changed = copy.deepcopy(parsed)
+    order_date = date.fromisoformat(changed["order_date"]) + timedelta(days=rng.choice([0, 31, 62]))
+    changed["order_date"] = order_date.isoformat()
+
+    items = changed["line_items"]
+    if len(items) > 1:
+        items.pop(rng.randrange(len(items)))
+    for item in items:
+        size = rng.choice(list(item["sizes"]))
+        item["sizes"][size] = rng.choice([0, 1, 5, 10])
+        if rng.random() < 0.3:
+            item["color"] = rng.choice(COLORS)
+    items.append(copy.deepcopy(rng.choice(items)) if items else make_parsed_po(rng, 0, 1)["line_items"][0])
+    return changed
+
+
+async def report(step: str) -> bool:
+    async with server.db_manager.acquire() as conn:
+        drift = await find_drift(conn)
+    if not drift:
+        print(f"✅ {step}: rollups match a full recompute")
+        return True
+    print(f"❌ {step}: {len(drift)} rollup rows differ")
+    for key, stored, actual in drift[:10]:
+        print(f"   {key}: stored={stored} actual={actual}")
+    return False
+
+
+async def save_all(parsed_orders: list, concurrency: int = 10):
+    for start in range(0, len(parsed_orders), concurrency):
+        await asyncio.gather(*(server.save_to_database(parsed) for parsed in parsed_orders[start:start + concurrency]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check incremental rollup maintenance against a full recompute")
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    await server.db_manager.create_pool()
+    ok = True
+    try:
+        if not await report("baseline"):
+            print("   Fix the existing drift first: python rollups.py reconcile --fix")
+            sys.exit(1)
+
+        parsed_orders = [make_parsed_po(rng, n, rng.randint(1, 8), prefix=PREFIX) for n in range(args.orders)]
+        await save_all(parsed_orders)
+        ok &= await report(f"saved {len(parsed_orders)} orders")
+
+        half = parsed_orders[: len(parsed_orders) // 2]
+        for mode in ("reconcile", "replace"):
+            server.LINE_ITEM_SAVE_MODE = mode
+            await save_all([mutate(rng, parsed) for parsed in half])
+            ok &= await report(f"re-saved {len(half)} orders ({mode})")
+
+        quarter = parsed_orders[len(parsed_orders) // 2:][: len(parsed_orders) // 4]
+        for parsed in quarter:
+            await server.db_manager.delete_purchase_order(parsed["purchase_order_id"])
+        ok &= await report(f"deleted {len(quarter)} orders")
+    finally:
+        async with server.db_manager.acquire() as conn:
+            remaining = await conn.fetch("SELECT purchase_order_id FROM orders WHERE purchase_order_id LIKE $1", f"{PREFIX}-%")
+        for row in remaining:
+            await server.db_manager.delete_purchase_order(row["purchase_order_id"])
+        ok &= await report("cleaned up")
+        await server.db_manager.close_pool()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,18 +3,49 @@ import asyncpg
 import json
 from typing import Dict, Any, Optional
 import asyncio
-from datetime import datetime
-import uuid
+import os
+import time
+from contextlib import asynccontextmanager
+
+def database_url() -> str:
+    """Build the Postgres DSN from the POSTGRES_* environment variables (used by the CLI scripts)"""
+    host = os.getenv("POSTGRES_HOST", "localhost")
+    port = os.getenv("POSTGRES_PORT", "4000")
+    user = os.getenv("POSTGRES_USER", "parser")
+    password = os.getenv("POSTGRES_PASSWORD", "parser123")
+    db = os.getenv("POSTGRES_DB", "parser")
+    return f"postgresql://{user}:{password}@{host}:{port}/{db}"
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the acquire timeout"""
+    pass
 
 class DatabaseManager:
-    def __init__(self, host="localhost", port=4000, user="parser", password="parser123", database="parser"):
+    def __init__(self, host="localhost", port=4000, user="parser", password="parser123", database="parser",
+                 min_size=1, max_size=10, acquire_timeout=10.0, command_timeout=60.0,
+                 statement_cache_size=256, max_cached_statement_lifetime=300,
+                 max_inactive_connection_lifetime=300.0):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
+        self.statement_cache_size = statement_cache_size
+        self.max_cached_statement_lifetime = max_cached_statement_lifetime
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
         self.pool = None
 
+        # Acquire bookkeeping for /debug/pool
+        self.acquire_count = 0
+        self.acquire_timeouts = 0
+        self.waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
     async def create_pool(self):
         """Create database connection pool"""
         self.pool = await asyncpg.create_pool(
@@ -23,14 +54,72 @@ class DatabaseManager:
             user=self.user,
             password=self.password,
             database=self.database,
-            min_size=1,
-            max_size=10
+            min_size=self.min_size,
+            max_size=self.max_size,
+            command_timeout=self.command_timeout,
+            # Each pooled connection keeps its own LRU of prepared statements,
+            # so repeated dashboard queries skip the parse/plan round trip.
+            statement_cache_size=self.statement_cache_size,
+            max_cached_statement_lifetime=self.max_cached_statement_lifetime,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime
         )
 
     async def close_pool(self):
         """Close database connection pool"""
         if self.pool:
             await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Acquire a pooled connection, recording how long the caller waited for it"""
+        if self.pool is None:
+            raise RuntimeError("Database pool is not initialised")
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise PoolTimeoutError(
+                f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+            )
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - started
+        self.acquire_count += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Report pool occupancy and acquire wait times"""
+        if self.pool is None:
+            return {"initialised": False}
+
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "initialised": True,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": self.waiting,
+            "acquire_timeout": self.acquire_timeout,
+            "statement_cache_size": self.statement_cache_size,
+            "acquires": self.acquire_count,
+            "acquire_timeouts": self.acquire_timeouts,
+            "avg_wait_ms": round(self.total_wait_seconds / self.acquire_count * 1000, 3) if self.acquire_count else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3)
+        }
 
     async def create_tables(self):
         """Create database tables if they don't exist - This is handled by database_schema.sql"""
@@ -38,102 +127,6 @@ class DatabaseManager:
         print("Tables should be created using database_schema.sql file")
         pass
 
-    async def save_purchase_order(self, order_data: Dict[Any, Any]) -> str:
-        """Save purchase order and line items to database"""
-        try:
-            async with self.pool.acquire() as conn:
-                async with conn.transaction():
-                    # Generate UUID for the order
-                    order_id = str(uuid.uuid4())
-                    
-                    # Insert purchase order
-                    order_query = """
-                    INSERT INTO orders 
-                    (id, purchase_order_id, order_date, buyer_name, buyer_address, 
-                     supplier_name, supplier_address, currency, tax_amount, total_amount)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                    ON CONFLICT (purchase_order_id) 
-                    DO UPDATE SET
-                        order_date = EXCLUDED.order_date,
-                        buyer_name = EXCLUDED.buyer_name,
-                        buyer_address = EXCLUDED.buyer_address,
-                        supplier_name = EXCLUDED.supplier_name,
-                        supplier_address = EXCLUDED.supplier_address,
-                        currency = EXCLUDED.currency,
-                        tax_amount = EXCLUDED.tax_amount,
-                        total_amount = EXCLUDED.total_amount,
-                        updated_at = CURRENT_TIMESTAMP
-                    RETURNING id
-                    """
-                    
-                    # Parse order date
-                    order_date = None
-                    if order_data.get("order_date"):
-                        try:
-                            order_date = datetime.strptime(order_data["order_date"], "%Y-%m-%d").date()
-                        except:
-                            order_date = None
-                    
-                    result = await conn.fetchrow(
-                        order_query,
-                        order_id,
-                        order_data["purchase_order_id"],
-                        order_date,
-                        order_data["buyer"]["name"],
-                        order_data["buyer"]["address"],
-                        order_data["supplier"]["name"],
-                        order_data["supplier"]["address"],
-                        order_data.get("currency", "USD"),
-                        order_data.get("tax_amount", 0),
-                        order_data.get("total_amount", 0)
-                    )
-                    
-                    # Use the returned order_id or the original one if it was an update
-                    actual_order_id = result["id"] if result else order_id
-
-                    # Delete existing line items for this order
-                    await conn.execute(
-                        "DELETE FROM line_items WHERE order_id = (SELECT id FROM orders WHERE purchase_order_id = $1)",
-                        order_data["purchase_order_id"]
-                    )
-
-                    # Insert line items
-                    line_item_query = """
-                    INSERT INTO line_items 
-                    (id, order_id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-                    """
-                    
-                    for item in order_data.get("line_items", []):
-                        # Parse delivery date
-                        delivery_date = None
-                        if item.get("delivery_date"):
-                            try:
-                                delivery_date = datetime.strptime(item["delivery_date"], "%Y-%m-%d").date()
-                            except:
-                                delivery_date = None
-
-                        await conn.execute(
-                            line_item_query,
-                            str(uuid.uuid4()),
-                            actual_order_id,
-                            item.get("model_id", ""),
-                            item.get("item_code", ""),
-                            item.get("description", ""),
-                            item.get("color", ""),
-                            item.get("size", ""),
-                            item.get("quantity", 0),
-                            item.get("unit_price", 0),
-                            item.get("amount", 0),
-                            delivery_date
-                        )
-                        
-                    return str(actual_order_id)
-                    
-        except Exception as e:
-            print(f"Error saving purchase order: {e}")
-            raise e
-
     async def get_purchase_orders(self, limit: int = 50, offset: int = 0, 
                                  model_id: Optional[str] = None, 
                                  color: Optional[str] = None,
@@ -226,15 +219,41 @@ class DatabaseManager:
 
     async def delete_purchase_order(self, purchase_order_id: str) -> bool:
         """Delete a purchase order and its line items"""
+        from stats import record_order_change
+        from rollups import apply_rollup_delta, order_contribution, rollup_delta
+        from cache import INVALIDATION_CHANNEL, data_generation
+
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 async with conn.transaction():
-                    # Delete order (line items will be deleted due to CASCADE)
-                    result = await conn.execute(
-                        "DELETE FROM orders WHERE purchase_order_id = $1 OR id::text = $1",
+                    order = await conn.fetchrow(
+                        "SELECT purchase_order_id FROM orders WHERE purchase_order_id = $1 OR id::text = $1",
                         purchase_order_id
                     )
-                    return result != "DELETE 0"
+                    if not order:
+                        return False
+
+                    # Same per-PO lock as save_to_database, then re-read the row under it
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", order["purchase_order_id"])
+                    order = await conn.fetchrow(
+                        "SELECT id, purchase_order_id, buyer_name, total_amount FROM orders WHERE purchase_order_id = $1",
+                        order["purchase_order_id"]
+                    )
+                    if not order:
+                        return False
+
+                    item_count = await conn.fetchval("SELECT COUNT(*) FROM line_items WHERE order_id = $1", order["id"])
+                    rollups_before = await order_contribution(conn, order["id"])
+
+                    # Delete order (line items will be deleted due to CASCADE)
+                    await conn.execute("DELETE FROM orders WHERE id = $1", order["id"])
+                    await apply_rollup_delta(conn, rollup_delta(rollups_before, {}))
+                    await record_order_change(
+                        conn, order["purchase_order_id"], (order["buyer_name"], order["total_amount"]), None, -item_count
+                    )
+                    await conn.execute(f"NOTIFY {INVALIDATION_CHANNEL}")
+            data_generation.bump()
+            return True
         except Exception as e:
             print(f"Error deleting purchase order: {e}")
             return False
@@ -1,6 +1,9 @@
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+-- Trigram indexes for the orders search filter
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
@@ -40,16 +43,84 @@ CREATE TABLE IF NOT EXISTS line_items (
     CONSTRAINT line_items_order_id_fkey FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
 );
 
+-- Dashboard statistics maintained by save_to_database, one row per slot
+-- (saves add to the slot their PO id hashes to; reads sum them), see stats.py
+CREATE TABLE IF NOT EXISTS order_stats (
+    id SMALLINT PRIMARY KEY DEFAULT 1,
+    total_orders BIGINT NOT NULL DEFAULT 0,
+    total_items BIGINT NOT NULL DEFAULT 0,
+    total_value NUMERIC(18,2) NOT NULL DEFAULT 0,
+    total_buyers BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO order_stats (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS buyer_order_counts (
+    buyer_name VARCHAR(255) PRIMARY KEY,
+    order_count BIGINT NOT NULL
+);
+
+-- Line item rollups by model/color/size/month maintained by save_to_database, see rollups.py
+CREATE TABLE IF NOT EXISTS line_item_rollups (
+    model_id VARCHAR(100),
+    color VARCHAR(50),
+    size VARCHAR(20),
+    month DATE,
+    total_quantity BIGINT NOT NULL DEFAULT 0,
+    total_value NUMERIC(18,2) NOT NULL DEFAULT 0,
+    line_item_count BIGINT NOT NULL DEFAULT 0,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT line_item_rollups_key UNIQUE NULLS NOT DISTINCT (model_id, color, size, month)
+);
+
+-- Parsed Gemini output keyed by PDF content, prompt and model, see extraction_cache.py
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    content_sha256 CHAR(64) NOT NULL,
+    prompt_version VARCHAR(64) NOT NULL,
+    model_name VARCHAR(100) NOT NULL,
+    parsed_data JSONB NOT NULL,
+    size_bytes BIGINT,
+    hit_count BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (content_sha256, prompt_version, model_name)
+);
+
+-- Upload job status shared by every API worker, see jobs.py
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id UUID PRIMARY KEY,
+    stage VARCHAR(20) NOT NULL,
+    snapshot JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 CREATE INDEX IF NOT EXISTS idx_orders_purchase_order_id ON orders(purchase_order_id);
 CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders(order_date);
 CREATE INDEX IF NOT EXISTS idx_orders_buyer_name ON orders(buyer_name);
 CREATE INDEX IF NOT EXISTS idx_orders_supplier_name ON orders(supplier_name);
 
+-- Serve ILIKE '%term%' and the <% word-similarity search, see queries.py
+CREATE INDEX IF NOT EXISTS idx_orders_purchase_order_id_trgm ON orders USING GIN (purchase_order_id gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_buyer_name_trgm ON orders USING GIN (buyer_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_supplier_name_trgm ON orders USING GIN (supplier_name gin_trgm_ops);
+
 CREATE INDEX IF NOT EXISTS idx_line_items_order_id ON line_items(order_id);
 CREATE INDEX IF NOT EXISTS idx_line_items_model_id ON line_items(model_id);
 CREATE INDEX IF NOT EXISTS idx_line_items_color ON line_items(color);
 CREATE INDEX IF NOT EXISTS idx_line_items_size ON line_items(size);
 
+-- Keyset (cursor) pagination, see queries.py
+CREATE INDEX IF NOT EXISTS idx_orders_keyset_order_date ON orders((COALESCE(order_date, DATE '0001-01-01')), (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
+CREATE INDEX IF NOT EXISTS idx_orders_keyset_total_amount ON orders((COALESCE(total_amount, -1000000000)), (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
+CREATE INDEX IF NOT EXISTS idx_line_items_keyset ON line_items(order_id, (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
+
+CREATE INDEX IF NOT EXISTS idx_line_item_rollups_month ON line_item_rollups(month);
+CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used_at ON extraction_cache(last_used_at);
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_updated_at ON upload_jobs(updated_at);
+
 CREATE TRIGGER update_orders_updated_at
     BEFORE UPDATE ON orders
     FOR EACH ROW
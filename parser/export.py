@@ -0,0 +1,179 @@
+# export.py
+"""Bulk export of orders joined with their line items.
+
+Rows are read through a server-side cursor in EXPORT_BATCH_SIZE batches and
+encoded batch by batch (CSV text, or one Parquet row group per batch), so
+memory stays flat however many rows match.
+
+pyarrow is imported only when a Parquet export runs, so CSV exports and the
+rest of the API don't depend on it loading.
+"""
+import csv
+import io
+import os
+from datetime import date
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Tuple
+
+from queries import build_order_filters, build_item_match_conditions, where_sql
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (column name, SQL expression, Parquet type), in output order
+EXPORT_COLUMNS = [
+    ("order_id", "o.id::text", "string"),
+    ("purchase_order_id", "o.purchase_order_id", "string"),
+    ("order_date", "o.order_date", "date"),
+    ("buyer_name", "o.buyer_name", "string"),
+    ("buyer_address", "o.buyer_address", "string"),
+    ("supplier_name", "o.supplier_name", "string"),
+    ("supplier_address", "o.supplier_address", "string"),
+    ("currency", "o.currency", "string"),
+    ("tax_amount", "o.tax_amount", "money"),
+    ("total_amount", "o.total_amount", "money"),
+    ("line_item_id", "li.id::text", "string"),
+    ("model_id", "li.model_id", "string"),
+    ("item_code", "li.item_code", "string"),
+    ("description", "li.description", "string"),
+    ("color", "li.color", "string"),
+    ("size", "li.size", "string"),
+    ("quantity", "li.quantity", "int"),
+    ("unit_price", "li.unit_price", "money"),
+    ("amount", "li.amount", "money"),
+    ("delivery_date", "li.delivery_date", "date"),
+]
+
+
+@lru_cache(maxsize=None)
+def export_schema():
+    """The Arrow schema for EXPORT_COLUMNS (imports pyarrow)"""
+    import pyarrow as pa
+
+    arrow_types = {
+        "string": pa.string(),
+        "date": pa.date32(),
+        "int": pa.int32(),
+        "money": pa.decimal128(10, 2),  # NUMERIC(10, 2) columns
+    }
+    return pa.schema([(name, arrow_types[kind]) for name, _, kind in EXPORT_COLUMNS])
+
+
+def build_export_query(
+    search: Optional[str] = None,
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    search_mode: str = "contains",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Tuple[str, list]:
+    """Build the export query: one row per matching (order, line item).
+
+    Orders are filtered exactly like GET /orders; with item filters only the
+    matching items are exported, as in the listing. Orders without items get
+    one row with empty item columns.
+    """
+    where_conditions, params = build_order_filters(search, model_id, color, size, search_mode, date_from, date_to)
+    item_conditions, item_params = build_item_match_conditions(
+        model_id, color, size, param_count=len(params), date_from=date_from, date_to=date_to
+    )
+    join_on = " AND ".join(["li.order_id = o.id"] + item_conditions)
+    select_list = ",\n        ".join(f"{expr} AS {name}" for name, expr, _ in EXPORT_COLUMNS)
+
+    # Ordering on (o.id, idx_line_items_keyset columns) lets Postgres walk the
+    # indexes instead of sorting the whole export; it also keeps each order's
+    # items together
+    query = f"""
+    SELECT
+        {select_list}
+    FROM orders o
+    LEFT JOIN line_items li ON {join_on}
+    {where_sql(where_conditions)}
+    ORDER BY o.id, COALESCE(li.created_at, TIMESTAMP '0001-01-01'), li.id
+    """
+    return query, params + item_params
+
+
+async def iter_batches(cur, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[list]:
+    """Yield rows from a server-side cursor in fixed-size batches.
+
+    The caller owns the transaction the cursor lives in.
+    """
+    while True:
+        rows = await cur.fetch(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+async def encode_csv(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Encode row batches as CSV, one chunk per batch (header first)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue().encode()
+
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _record_batch(rows: list, schema):
+    import pyarrow as pa
+
+    columns = [
+        pa.array([row[index] for row in rows], type=field.type)
+        for index, field in enumerate(schema)
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+async def encode_parquet(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Encode row batches as Parquet, writing one row group per batch"""
+    import pyarrow.parquet as pq
+
+    schema = export_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        async for rows in batches:
+            writer.write_batch(_record_batch(rows, schema), row_group_size=len(rows))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        # Writes the footer; an export cut short by the client is discarded anyway
+        writer.close()
+    yield sink.drain()
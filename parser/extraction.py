@@ -0,0 +1,161 @@
+# extraction.py
+"""Runs the blocking Gemini extraction off the event loop with admission control.
+
+extract_pdf_data blocks for the whole Gemini upload and generate, so it runs in
+a dedicated pool (threads by default, or processes with
+EXTRACTION_EXECUTOR=process). At most `workers` extractions run at once and up
+to `max_queue` more wait; past that, run() raises ExtractionQueueFull, which
+the API turns into 429 with Retry-After.
+
+A call holds its slot until the pool is done with it, not until its caller
+stops waiting: a cancelled caller (a client that disconnected) can't stop an
+extraction that is already running, so the slot stays taken until it ends.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import tracing
+
+EXECUTOR_KINDS = ("thread", "process")
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when every extraction slot and queue place is taken"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Extraction queue is full, retry later")
+        self.retry_after = retry_after
+
+
+def _timed_call(trace_parent, fn: Callable, *args):
+    # Runs in the pool; wall-clock times so they compare across processes, and
+    # the spans fn opens travel back with the result for the caller's trace
+    started = time.time()
+    with tracing.collect(trace_parent) as spans:
+        try:
+            result = fn(*args)
+        except Exception as e:
+            return started, time.time(), None, e, spans
+    return started, time.time(), result, None, spans
+
+
+class ExtractionExecutor:
+    """Sized pool for blocking extraction calls, with a bounded wait queue"""
+
+    def __init__(self, workers: int = 4, max_queue: int = 16, kind: str = "thread",
+                 observer: Optional[Callable[[float, float, bool], None]] = None):
+        """observer, when given, is called with (wait seconds, run seconds, succeeded) per call"""
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Executor kind must be one of {EXECUTOR_KINDS}, got {kind!r}")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.observer = observer
+        self._executor = None
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a free worker"""
+        return max(0, self.in_flight - self.workers)
+
+    def retry_after(self) -> int:
+        """Seconds until a queue place is likely to free up"""
+        average_run = self.run_seconds_total / self.completed if self.completed else 30.0
+        return max(1, math.ceil(average_run * (self.queued + 1) / self.workers))
+
+    def check_capacity(self):
+        """Raise ExtractionQueueFull when a new call would not be admitted"""
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise ExtractionQueueFull(self.retry_after())
+
+    async def run(self, fn: Callable, *args, admit: bool = True):
+        """Run fn(*args) in the pool and return its result.
+
+        admit=False skips the queue limit, for callers that were already
+        admitted elsewhere (the upload job queue, the email scheduler).
+        """
+        if admit:
+            self.check_capacity()
+
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(_timed_call, tracing.propagation(), fn, *args)
+        self.in_flight += 1
+        self.submitted += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        submitted_at = time.time()
+        # Runs when the pool finishes (or drops) the call, whatever happened to the caller
+        future.add_done_callback(lambda _: self._release(loop))
+
+        # Cancelling the wait cancels the call only if it hasn't started yet
+        started, finished, result, error, spans = await asyncio.wrap_future(future)
+
+        wait = max(0.0, started - submitted_at)
+        tracing.annotate(executor=self.kind, queue_wait_ms=round(wait * 1000, 3))
+        tracing.adopt(spans)
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.run_seconds_total += finished - started
+        if self.observer is not None:
+            self.observer(wait, finished - started, error is None)
+        if error is not None:
+            self.failed += 1
+            raise error
+        self.completed += 1
+        return result
+
+    def _release(self, loop):
+        # Called from a pool thread
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            pass  # the loop is closed: nothing is left to admit
+
+    def _finished(self):
+        self.in_flight -= 1
+
+    def start(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": min(self.in_flight, self.workers),
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_seconds_avg": round(self.wait_seconds_total / finished, 3) if finished else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "run_seconds_avg": round(self.run_seconds_total / finished, 3) if finished else 0.0
+        }
@@ -0,0 +1,124 @@
+# extraction_cache.py
+"""Persistent cache of Gemini extractions, so an identical PDF is parsed once.
+
+Entries are keyed by the PDF's SHA-256, the prompt version and the model name,
+so editing SCHEMA_INSTRUCTION_PROMPT or switching GEMINI_MODEL never serves
+output produced under the old ones. Eviction drops entries unused for
+ttl_days and, past max_entries, the least recently used.
+"""
+import json
+from typing import Optional
+
+EXTRACTION_CACHE_GET_QUERY = """
+UPDATE extraction_cache
+SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP
+WHERE content_sha256 = $1 AND prompt_version = $2 AND model_name = $3
+RETURNING parsed_data
+"""
+
+EXTRACTION_CACHE_PUT_QUERY = """
+INSERT INTO extraction_cache (content_sha256, prompt_version, model_name, parsed_data, size_bytes)
+VALUES ($1, $2, $3, $4::jsonb, $5)
+ON CONFLICT (content_sha256, prompt_version, model_name) DO UPDATE SET
+    parsed_data = EXCLUDED.parsed_data,
+    size_bytes = EXCLUDED.size_bytes,
+    last_used_at = CURRENT_TIMESTAMP
+"""
+
+EXTRACTION_CACHE_EVICT_QUERY = """
+DELETE FROM extraction_cache
+WHERE last_used_at < CURRENT_TIMESTAMP - make_interval(days => $1)
+   OR (content_sha256, prompt_version, model_name) IN (
+       SELECT content_sha256, prompt_version, model_name
+       FROM extraction_cache
+       ORDER BY last_used_at DESC
+       OFFSET $2
+   )
+"""
+
+
+def _deleted(status: str) -> int:
+    return int(status.split()[-1])
+
+
+class ExtractionCache:
+    """Reads and writes extraction_cache rows for the current prompt and model"""
+
+    def __init__(self, db_manager, prompt_version: str, model_name: str,
+                 max_entries: int = 10000, ttl_days: int = 90, enabled: bool = True):
+        self.db_manager = db_manager
+        self.prompt_version = prompt_version
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_days = ttl_days
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+
+    async def get(self, sha256: str) -> Optional[dict]:
+        """Return the cached extraction for a PDF hash, or None"""
+        if not self.enabled:
+            return None
+        async with self.db_manager.acquire() as conn:
+            cached = await conn.fetchval(EXTRACTION_CACHE_GET_QUERY, sha256, self.prompt_version, self.model_name)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(cached)
+
+    async def put(self, sha256: str, parsed_data: dict, size_bytes: Optional[int] = None):
+        """Store an extraction, then apply the eviction policy"""
+        if not self.enabled:
+            return
+        async with self.db_manager.acquire() as conn:
+            await conn.execute(
+                EXTRACTION_CACHE_PUT_QUERY,
+                sha256, self.prompt_version, self.model_name, json.dumps(parsed_data), size_bytes
+            )
+            self.stores += 1
+            # Writes follow a Gemini call each, so evicting inline is cheap enough
+            status = await conn.execute(EXTRACTION_CACHE_EVICT_QUERY, self.ttl_days, self.max_entries)
+            self.evicted += _deleted(status)
+
+    async def purge(self, sha256: Optional[str] = None, stale_only: bool = False) -> int:
+        """Delete entries: one PDF's, those from other prompt versions/models, or all; returns rows deleted"""
+        conditions, params = [], []
+        if sha256:
+            params.append(sha256)
+            conditions.append(f"content_sha256 = ${len(params)}")
+        if stale_only:
+            params.extend([self.prompt_version, self.model_name])
+            conditions.append(f"(prompt_version <> ${len(params) - 1} OR model_name <> ${len(params)})")
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        async with self.db_manager.acquire() as conn:
+            status = await conn.execute(f"DELETE FROM extraction_cache {where}", *params)
+        return _deleted(status)
+
+    async def stats(self) -> dict:
+        async with self.db_manager.acquire() as conn:
+            row = await conn.fetchrow("""
+            SELECT COUNT(*) as entries,
+                   COUNT(*) FILTER (WHERE prompt_version = $1 AND model_name = $2) as current_entries,
+                   COALESCE(SUM(size_bytes), 0) as pdf_bytes
+            FROM extraction_cache
+            """, self.prompt_version, self.model_name)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "prompt_version": self.prompt_version,
+            "model_name": self.model_name,
+            "entries": row["entries"],
+            "current_entries": row["current_entries"],
+            "pdf_bytes": row["pdf_bytes"],
+            "max_entries": self.max_entries,
+            "ttl_days": self.ttl_days,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evicted": self.evicted,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -1,8 +1,10 @@
 from textwrap import indent
 import google.generativeai as genai
+import hashlib
 import json
 import os
 from dotenv import load_dotenv
+from tracing import log, span
 
 load_dotenv()
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))  # Load from parent directory
@@ -14,24 +16,28 @@ if not GEMINI_API_KEY:
 
 genai.configure(api_key=GEMINI_API_KEY)
 
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-pro")
+
 def get_gemini_response(pdf_path: str, prompt: str) -> dict:
    
-    model = genai.GenerativeModel('models/gemini-2.5-pro')
+    model = genai.GenerativeModel(GEMINI_MODEL)
     # model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
 
 
-    print(f"pushing file: {pdf_path}...")
-    uploaded_file = genai.upload_file(path=pdf_path, display_name="Purchase Order")
-    print("File upload done .")
+    log.debug("pushing file: %s...", pdf_path)
+    with span("gemini.upload_file", bytes=os.path.getsize(pdf_path)):
+        uploaded_file = genai.upload_file(path=pdf_path, display_name="Purchase Order")
 
-    response = model.generate_content([prompt, uploaded_file])
-    print(response)
+    with span("gemini.generate_content", model=GEMINI_MODEL):
+        response = model.generate_content([prompt, uploaded_file])
+    log.debug("%s", response)
     try:
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        print(json.dumps(cleaned_response, indent=2))
-        return json.loads(cleaned_response)
+        with span("gemini.parse_json") as parse_span:
+            cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+            parse_span.set(chars=len(cleaned_response))
+            return json.loads(cleaned_response)
     except (json.JSONDecodeError, AttributeError) as e:
-        print(f"Error: Failed to parse JSON from the model's response. Details: {e}")
+        log.error("Failed to parse JSON from the model's response. Details: %s", e)
         print("gemini respone:")
         print(response.text)
         print("--------------------------")
@@ -41,9 +47,7 @@ def get_gemini_response(pdf_path: str, prompt: str) -> dict:
 
 
 
-def extract_pdf_data(pdf_path: str) -> dict:
-   
-    SCHEMA_INSTRUCTION_PROMPT = """
+SCHEMA_INSTRUCTION_PROMPT = """
     You are an expert PDF Purchase Order Parser. Your task is to analyze the provided purchase order PDF and extract structured data from it.
     You must return a single, valid JSON object that adheres to the schema below. Do not include any explanations, markdown formatting, or comments in your output.
 
@@ -85,6 +89,11 @@ def extract_pdf_data(pdf_path: str) -> dict:
     - For example, if the first number '3' appears under the 'S' column, and the 'XXS' and 'XS' columns are empty, the output must be `"XXS": 0, "XS": 0, "S": 3, ...` and so on. Do not shift the values to the left.
     """
 
+# Changes whenever the prompt text does; part of the extraction cache key
+PROMPT_VERSION = hashlib.sha256(SCHEMA_INSTRUCTION_PROMPT.encode()).hexdigest()[:16]
+
+def extract_pdf_data(pdf_path: str) -> dict:
+
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
     
@@ -0,0 +1,244 @@
+# ingest.py
+"""Line item expansion and bulk writes used by save_to_database.
+
+A parsed PO carries one entry per model/color with a `sizes` dict; the
+database stores one line_items row per size with a non-zero quantity. The rows
+are built in memory in one pass and written with COPY (or executemany for
+small POs, where COPY's setup cost outweighs the per-statement savings).
+
+When a PO is saved again, LINE_ITEM_SAVE_MODE=reconcile (the default) diffs
+the incoming rows against the stored ones instead of deleting and reinserting
+all of them; LINE_ITEM_SAVE_MODE=replace keeps the old behaviour.
+
+With LINE_ITEMS_PARTITIONED=true (after partitioning.py has swapped in the
+monthly partitioned table) every row also carries its order's order_date.
+"""
+import os
+import uuid
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import List, Optional
+
+# line_items is range-partitioned by a copy of the order's date, see partitioning.py
+LINE_ITEMS_PARTITIONED = os.getenv("LINE_ITEMS_PARTITIONED", "false").lower() in ("1", "true", "yes")
+
+LINE_ITEM_COLUMNS = [
+    "id", "order_id", "model_id", "item_code", "description", "color",
+    "size", "quantity", "unit_price", "amount", "delivery_date"
+] + (["order_date"] if LINE_ITEMS_PARTITIONED else [])
+
+# Below this many expanded rows, executemany beats COPY
+COPY_THRESHOLD = int(os.getenv("LINE_ITEM_COPY_THRESHOLD", "50"))
+
+# How save_to_database rewrites the items of a PO that already exists
+LINE_ITEM_SAVE_MODES = ("reconcile", "replace")
+LINE_ITEM_SAVE_MODE = os.getenv("LINE_ITEM_SAVE_MODE", "reconcile")
+if LINE_ITEM_SAVE_MODE not in LINE_ITEM_SAVE_MODES:
+    raise ValueError(f"LINE_ITEM_SAVE_MODE must be one of {LINE_ITEM_SAVE_MODES}, got {LINE_ITEM_SAVE_MODE!r}")
+
+LINE_ITEM_INSERT_QUERY = f"""
+INSERT INTO line_items
+({", ".join(LINE_ITEM_COLUMNS)})
+VALUES ({", ".join(f"${n}" for n in range(1, len(LINE_ITEM_COLUMNS) + 1))})
+"""
+
+
+def parse_date(value) -> Optional[date]:
+    """Parse a YYYY-MM-DD string from the extractor, returning None when it is missing or invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def to_decimal(value) -> Decimal:
+    """Convert an extracted number to Decimal without float artefacts"""
+    if value is None:
+        return Decimal(0)
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+CENT = Decimal("0.01")
+
+
+def to_money(value) -> Decimal:
+    """to_decimal rounded to cents the way NUMERIC(10,2) stores it, so re-saves compare equal"""
+    return to_decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_quantity(value) -> int:
+    """Extracted quantities can arrive as floats (12.0); line_items.quantity is an integer"""
+    if value is None or value == "":
+        return 0
+    return int(round(float(value)))
+
+
+def expand_line_items(order_id, line_items: list, order_date: Optional[date] = None) -> List[tuple]:
+    """Expand parsed line items into line_items rows, one per size with quantity > 0.
+
+    Rows are tuples in LINE_ITEM_COLUMNS order, ready for COPY or executemany;
+    order_date is only included when LINE_ITEMS_PARTITIONED.
+    """
+    # First pass: flatten to (item, size, quantity, unit_price, amount, delivery_date)
+    flattened = []
+    for item in line_items:
+        delivery_date = parse_date(item.get("delivery_date"))
+
+        # Handle sizes object - create separate line items for each size
+        if "sizes" in item and isinstance(item["sizes"], dict):
+            unit_price = to_money(item.get("price", 0))
+            for size, quantity in item["sizes"].items():
+                quantity = to_quantity(quantity)
+                if quantity > 0:  # Only create line items for sizes with quantity > 0
+                    flattened.append((item, size, quantity, unit_price, to_money(unit_price * quantity), delivery_date))
+        else:
+            # Fallback for items without sizes object (shouldn't happen with current schema)
+            flattened.append((
+                item,
+                item.get("size", ""),
+                to_quantity(item.get("quantity", 0)),
+                to_money(item.get("unit_price", 0)),
+                to_money(item.get("amount", 0)),
+                delivery_date
+            ))
+
+    # Second pass: allocate all ids at once and build the records
+    ids = [uuid.uuid4() for _ in range(len(flattened))]
+    partition_key = (order_date,) if LINE_ITEMS_PARTITIONED else ()
+    return [
+        (
+            row_id,
+            order_id,
+            item.get("model_id", ""),
+            item.get("item_code", ""),
+            item.get("description", ""),
+            item.get("color", ""),
+            size,
+            quantity,
+            unit_price,
+            amount,
+            delivery_date
+        ) + partition_key
+        for row_id, (item, size, quantity, unit_price, amount, delivery_date) in zip(ids, flattened)
+    ]
+
+
+async def insert_line_items(conn, rows: List[tuple]) -> int:
+    """Write expanded line item rows, using COPY above COPY_THRESHOLD rows; returns rows written"""
+    if not rows:
+        return 0
+    if len(rows) >= COPY_THRESHOLD:
+        await conn.copy_records_to_table("line_items", records=rows, columns=LINE_ITEM_COLUMNS)
+    else:
+        await conn.executemany(LINE_ITEM_INSERT_QUERY, rows)
+    return len(rows)
+
+
+# The order row is written first in the same transaction, so its date is current
+_ORDER_DATE_COLUMN = ", order_date" if LINE_ITEMS_PARTITIONED else ""
+_ORDER_DATE_VALUE = ", (SELECT o.order_date FROM orders o WHERE o.id = $1)" if LINE_ITEMS_PARTITIONED else ""
+
+# Rows are matched on the natural key (model_id, color, size, item_code). A PO
+# can repeat a key, so the nth occurrence of a key in the upload pairs with the
+# nth stored row for it (oldest first). Keys are compared with NULL and ''
+# treated alike, because the extractor emits either for a missing field.
+# All CTEs see the same snapshot and touch disjoint rows, so the update,
+# insert and delete go through as one statement.
+LINE_ITEM_RECONCILE_QUERY = f"""
+WITH incoming AS (
+    SELECT i.*,
+           row_number() OVER (
+               PARTITION BY COALESCE(i.model_id, ''), COALESCE(i.color, ''), COALESCE(i.size, ''), COALESCE(i.item_code, '')
+               ORDER BY i.ordinal
+           ) AS occurrence
+    FROM unnest(
+        $2::uuid[], $3::text[], $4::text[], $5::text[], $6::text[], $7::text[],
+        $8::integer[], $9::numeric[], $10::numeric[], $11::date[]
+    ) WITH ORDINALITY AS i(id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date, ordinal)
+),
+existing AS (
+    SELECT li.*,
+           row_number() OVER (
+               PARTITION BY COALESCE(li.model_id, ''), COALESCE(li.color, ''), COALESCE(li.size, ''), COALESCE(li.item_code, '')
+               ORDER BY li.created_at, li.id
+           ) AS occurrence
+    FROM line_items li
+    WHERE li.order_id = $1
+),
+pairs AS (
+    SELECT i.*, e.id AS existing_id
+    FROM incoming i
+    LEFT JOIN existing e
+        ON COALESCE(e.model_id, '') = COALESCE(i.model_id, '')
+       AND COALESCE(e.color, '') = COALESCE(i.color, '')
+       AND COALESCE(e.size, '') = COALESCE(i.size, '')
+       AND COALESCE(e.item_code, '') = COALESCE(i.item_code, '')
+       AND e.occurrence = i.occurrence
+),
+updated AS (
+    UPDATE line_items li SET
+        model_id = p.model_id,
+        item_code = p.item_code,
+        description = p.description,
+        color = p.color,
+        size = p.size,
+        quantity = p.quantity,
+        unit_price = p.unit_price,
+        amount = p.amount,
+        delivery_date = p.delivery_date
+    FROM pairs p
+    WHERE li.id = p.existing_id
+      AND (li.model_id, li.item_code, li.description, li.color, li.size, li.quantity, li.unit_price, li.amount, li.delivery_date)
+          IS DISTINCT FROM
+          (p.model_id, p.item_code, p.description, p.color, p.size, p.quantity, p.unit_price, p.amount, p.delivery_date)
+    RETURNING li.id
+),
+inserted AS (
+    INSERT INTO line_items
+    (id, order_id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date{_ORDER_DATE_COLUMN})
+    SELECT p.id, $1, p.model_id, p.item_code, p.description, p.color, p.size, p.quantity, p.unit_price, p.amount, p.delivery_date{_ORDER_DATE_VALUE}
+    FROM pairs p
+    WHERE p.existing_id IS NULL
+    ORDER BY p.ordinal
+    RETURNING id
+),
+deleted AS (
+    DELETE FROM line_items li
+    USING existing e
+    WHERE li.id = e.id
+      AND NOT EXISTS (SELECT 1 FROM pairs p WHERE p.existing_id = e.id)
+    RETURNING li.id
+)
+SELECT
+    (SELECT COUNT(*) FROM inserted) AS inserted,
+    (SELECT COUNT(*) FROM updated) AS updated,
+    (SELECT COUNT(*) FROM deleted) AS deleted,
+    (SELECT COUNT(*) FROM pairs WHERE existing_id IS NOT NULL) AS matched
+"""
+
+
+async def reconcile_line_items(conn, order_id, rows: List[tuple]) -> dict:
+    """Bring an existing order's line items in line with rows, touching only what changed.
+
+    rows are expand_line_items output. Returns counts of inserted, updated,
+    deleted and unchanged rows.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(LINE_ITEM_COLUMNS)
+    ids, _, model_ids, item_codes, descriptions, colors, sizes, quantities, unit_prices, amounts, delivery_dates = columns[:11]
+
+    result = await conn.fetchrow(
+        LINE_ITEM_RECONCILE_QUERY,
+        order_id,
+        list(ids), list(model_ids), list(item_codes), list(descriptions), list(colors),
+        list(sizes), list(quantities), list(unit_prices), list(amounts), list(delivery_dates)
+    )
+    return {
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "deleted": result["deleted"],
+        "unchanged": result["matched"] - result["updated"]
+    }
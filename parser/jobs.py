@@ -0,0 +1,325 @@
+# jobs.py
+"""In-process background jobs for PDF uploads.
+
+POST /upload-pdf stores the file and returns 202 with a job id; a fixed pool of
+worker tasks then runs each job through its stages:
+
+    uploaded -> extracting -> saving -> done   (or failed)
+
+Jobs run in the worker process that accepted them, which keeps the most
+recent finished ones in memory. With a JobStore every stage change is also
+written to the upload_jobs table, so any API worker can answer GET /jobs/{id}
+and follow GET /jobs/{id}/events (Server-Sent Events) for it, by polling the
+row. A job whose process dies mid-run stays in its last stage.
+"""
+import asyncio
+import contextvars
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+JOB_STAGES = ("uploaded", "extracting", "saving", "done", "failed")
+TERMINAL_STAGES = ("done", "failed")
+
+
+# Newer snapshots only: writes from the submitter and the worker can arrive out of order
+JOB_SAVE_QUERY = """
+INSERT INTO upload_jobs (id, stage, snapshot, created_at, updated_at)
+VALUES ($1::uuid, $2, $3::jsonb, to_timestamp($4), to_timestamp($5))
+ON CONFLICT (id) DO UPDATE SET
+    stage = EXCLUDED.stage,
+    snapshot = EXCLUDED.snapshot,
+    updated_at = EXCLUDED.updated_at
+WHERE upload_jobs.updated_at <= EXCLUDED.updated_at
+"""
+
+JOB_PRUNE_QUERY = f"""
+DELETE FROM upload_jobs
+WHERE id IN (
+    SELECT id FROM upload_jobs
+    WHERE stage IN {TERMINAL_STAGES}
+    ORDER BY updated_at DESC
+    OFFSET $1
+)
+"""
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when max_queued jobs are already waiting"""
+
+
+class Job:
+    """One upload and its progress; every stage change is pushed to subscribers"""
+
+    def __init__(self, filename: str, path: str, sha256: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.path = path
+        self.sha256 = sha256
+        self.stage = "uploaded"
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.history = [{"stage": "uploaded", "at": self.created_at}]
+        self.result = None
+        self.error = None
+        # The submitter's context (trace ids); the handler runs inside it
+        self.context = contextvars.copy_context()
+        self.on_change: Optional[Callable[[dict], None]] = None
+        self._subscribers = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in TERMINAL_STAGES
+
+    def advance(self, stage: str, result: Optional[dict] = None, error: Optional[str] = None):
+        """Move to the next stage and notify subscribers"""
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        self.stage = stage
+        self.updated_at = time.time()
+        self.history.append({"stage": stage, "at": self.updated_at})
+        if result is not None:
+            self.result = result
+        if error is not None:
+            self.error = error
+
+        snapshot = self.to_dict()
+        for queue in self._subscribers:
+            queue.put_nowait(snapshot)
+        if self.on_change is not None:
+            self.on_change(snapshot)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "sha256": self.sha256,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "history": list(self.history),
+            "result": self.result,
+            "error": self.error
+        }
+
+    async def events(self, keepalive_seconds: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """Yield the current state, then every stage change until the job finishes.
+
+        Yields None after keepalive_seconds without a change, so the caller can
+        send a keepalive to the client.
+        """
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            snapshot = self.to_dict()
+            yield snapshot
+            while snapshot["stage"] not in TERMINAL_STAGES:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield snapshot
+        finally:
+            self._subscribers.discard(queue)
+
+
+class JobStore:
+    """Job snapshots in the upload_jobs table, shared by every API worker"""
+
+    def __init__(self, db_manager, max_retained: int = 500):
+        self.db_manager = db_manager
+        self.max_retained = max_retained
+        self.writes = 0
+        self.write_errors = 0
+
+    async def save(self, snapshot: dict):
+        async with self.db_manager.acquire() as conn:
+            await conn.execute(
+                JOB_SAVE_QUERY,
+                snapshot["job_id"], snapshot["stage"], json.dumps(snapshot, default=str),
+                snapshot["created_at"], snapshot["updated_at"]
+            )
+            if snapshot["stage"] in TERMINAL_STAGES:
+                await conn.execute(JOB_PRUNE_QUERY, self.max_retained)
+        self.writes += 1
+
+    async def load(self, job_id: str) -> Optional[dict]:
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        async with self.db_manager.acquire() as conn:
+            snapshot = await conn.fetchval("SELECT snapshot FROM upload_jobs WHERE id = $1::uuid", job_id)
+        return json.loads(snapshot) if snapshot is not None else None
+
+    async def events(self, job_id: str, poll_seconds: float = 1.0,
+                     keepalive_seconds: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """Job.events() for a job running in another process, by polling its row"""
+        snapshot = await self.load(job_id)
+        if snapshot is None:
+            return
+        yield snapshot
+        quiet = 0.0
+        while snapshot["stage"] not in TERMINAL_STAGES:
+            await asyncio.sleep(poll_seconds)
+            latest = await self.load(job_id)
+            if latest is None:
+                return
+            if latest["updated_at"] != snapshot["updated_at"]:
+                snapshot, quiet = latest, 0.0
+                yield snapshot
+                continue
+            quiet += poll_seconds
+            if quiet >= keepalive_seconds:
+                quiet = 0.0
+                yield None
+
+
+class JobManager:
+    """Queue of upload jobs served by a fixed number of worker tasks"""
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[dict]],
+        workers: int = 2,
+        max_queued: int = 100,
+        max_retained: int = 500,
+        discard: Optional[Callable[[Job], None]] = None,
+        store: Optional[JobStore] = None
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self.discard = discard  # called for jobs dropped unrun at shutdown
+        self.store = store
+        self._jobs = OrderedDict()  # job id -> Job, oldest first
+        self._queue = None
+        self._tasks = []
+        # Stage changes waiting to be written to the store, in order
+        self._writes = None
+        self._writer = None
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _prune(self):
+        # Drop the oldest finished jobs beyond max_retained; running ones stay
+        excess = len(self._jobs) - self.max_retained
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    @property
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    async def submit(self, filename: str, path: str, sha256: Optional[str] = None) -> Job:
+        """Register a stored upload and queue it for the workers; raises JobQueueFull.
+
+        With a store, returns once the job's row exists, so the id can be
+        looked up on any worker as soon as the client has it.
+        """
+        job = Job(filename, path, sha256)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"{self.max_queued} upload jobs already queued, retry later")
+        self._jobs[job.id] = job
+        self._prune()
+        if self.store is not None:
+            job.on_change = self._writes.put_nowait
+            await self._save(job.to_dict())
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job accepted by this process"""
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[dict]:
+        """A job's current snapshot, whichever process accepted it"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.store is not None:
+            return await self.store.load(job_id)
+        return None
+
+    async def _save(self, snapshot: dict):
+        try:
+            await self.store.save(snapshot)
+        except Exception as e:
+            self.store.write_errors += 1
+            print(f"⚠️  Couldn't record job {snapshot['job_id']} as {snapshot['stage']}: {str(e)}")
+
+    async def _write_changes(self):
+        while True:
+            snapshot = await self._writes.get()
+            try:
+                await self._save(snapshot)
+            finally:
+                self._writes.task_done()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                result = await asyncio.create_task(self.handler(job), context=job.context)
+                job.advance("done", result=result)
+                self.completed += 1
+            except asyncio.CancelledError:
+                job.advance("failed", error="Server shut down while the job was running")
+                raise
+            except Exception as e:
+                print(f"❌ Job {job.id} ({job.filename}) failed during {job.stage}: {str(e)}")
+                job.advance("failed", error=str(e))
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            if self.store is not None:
+                self._writes = asyncio.Queue()
+                self._writer = asyncio.create_task(self._write_changes())
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.advance("failed", error="Server shut down before the job ran")
+            if self.discard:
+                self.discard(job)
+
+        # Record the failures above before the pool closes
+        if self._writer is not None:
+            await self._writes.join()
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+            "running": sum(1 for job in self._jobs.values() if job.stage in ("extracting", "saving")),
+            "retained": len(self._jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "store": {
+                "pending_writes": self._writes.qsize() if self._writes is not None else 0,
+                "writes": self.store.writes,
+                "write_errors": self.store.write_errors
+            } if self.store is not None else None
+        }
@@ -0,0 +1,129 @@
+# leader.py
+"""Leader election between API workers with a Postgres advisory lock.
+
+Every worker keeps trying pg_try_advisory_lock(lock_key) on a dedicated
+connection; the one holding it is the leader and runs on_elected (the email
+scheduler). Session advisory locks die with their session, so when the leader
+process exits or its connection drops, another worker takes over within
+retry_seconds. The leader pings its connection every health_seconds and steps
+down (on_demoted) as soon as the ping fails.
+
+The lock connection's application_name is "<prefix> <host>:<pid>", so any
+worker can report who leads from pg_locks/pg_stat_activity (current_leader).
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+
+# pg_locks shows a bigint key as two unsigned 32-bit oids: classid (high half)
+# and objid (low half), with objsubid = 1
+LEADER_QUERY = """
+SELECT a.application_name, a.pid AS backend_pid, host(a.client_addr) AS client_addr, a.backend_start
+FROM pg_locks l
+JOIN pg_stat_activity a ON a.pid = l.pid
+WHERE l.locktype = 'advisory' AND l.granted
+  AND l.classid = $1 AND l.objid = $2 AND l.objsubid = 1
+"""
+
+
+def process_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElection:
+    """Holds lock_key on its own connection while it can; calls back on gaining and losing it"""
+
+    def __init__(
+        self,
+        dsn: str,
+        lock_key: int,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+        name: str = "po-scheduler",
+        retry_seconds: float = 5.0,
+        health_seconds: float = 5.0
+    ):
+        if not -2**63 <= lock_key < 2**63:
+            raise ValueError(f"Advisory lock keys are 64-bit signed integers, got {lock_key}")
+        self.dsn = dsn
+        self.lock_key = lock_key
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.identity = process_identity()
+        # Postgres truncates application_name to 63 bytes
+        self.application_name = f"{name} {self.identity}"[:63]
+        self.retry_seconds = retry_seconds
+        self.health_seconds = health_seconds
+        self.is_leader = False
+        self.leader_since: Optional[float] = None
+        self.elections = 0
+        self.last_error: Optional[str] = None
+        self._task = None
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn, server_settings={"application_name": self.application_name})
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key):
+                    await asyncio.sleep(self.retry_seconds)
+
+                self.is_leader = True
+                self.leader_since = time.time()
+                self.elections += 1
+                print(f"👑 {self.identity} is now the scheduler leader")
+                await self.on_elected()
+
+                # Step down as soon as the session holding the lock looks dead
+                while True:
+                    await asyncio.sleep(self.health_seconds)
+                    await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=self.health_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️  Leader election error ({self.identity}): {e}")
+            finally:
+                if self.is_leader:
+                    self.is_leader = False
+                    self.leader_since = None
+                    print(f"🔻 {self.identity} is no longer the scheduler leader")
+                    await self.on_demoted()
+                # Closing the session releases the lock for the next leader
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Step down (running on_demoted) and release the lock"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def current_leader(self, conn) -> Optional[dict]:
+        """The session holding the lock, from any connection; None when nobody leads"""
+        # Masking the high half too keeps negative keys (two's complement) matching
+        row = await conn.fetchrow(LEADER_QUERY, (self.lock_key >> 32) & 0xFFFFFFFF, self.lock_key & 0xFFFFFFFF)
+        return dict(row) if row else None
+
+    def stats(self) -> dict:
+        return {
+            "identity": self.identity,
+            "is_leader": self.is_leader,
+            "leader_since": self.leader_since,
+            "lock_key": self.lock_key,
+            "elections": self.elections,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,211 @@
+# metrics.py
+"""Prometheus metrics for GET /metrics, in the text exposition format.
+
+Recording is an increment or two under the GIL: a histogram observation is a
+bisect over its buckets plus three additions, with no locks and no
+allocation once a label set has been seen. Everything that reports current
+state (pool occupancy, scheduler, in-flight extractions) is a callback gauge
+read only when /metrics is scraped. Label values should come from small,
+fixed sets (route templates, query names), never from request data.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+EXTRACTION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 300.0)
+SIZE_BUCKETS = tuple(float(1024 * 4 ** n) for n in range(3, 10))  # 64 KiB .. 256 MiB
+COUNT_BUCKETS = (1.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing count, or a callback returning {label values: count}"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[tuple, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = {}
+        self.callback = callback
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        values = self.callback() if self.callback else self.values
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()
+        ]
+
+
+class Gauge(Counter):
+    """A value that goes up and down; usually a callback read at scrape time"""
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram(Metric):
+    """Bucketed observations per label set (buckets are upper bounds, +Inf implied)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels) -> _Timer:
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to answer an HTTP request, by route template, method and status",
+    ("route", "method", "status")
+))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "db_query_duration_seconds", "Time spent in a database query or transaction, by query name",
+    ("query",), buckets=QUERY_BUCKETS
+))
+GEMINI_EXTRACTION_SECONDS = registry.register(Histogram(
+    "gemini_extraction_duration_seconds", "Time extract_pdf_data ran (excluding queueing), by outcome",
+    ("outcome",), buckets=EXTRACTION_BUCKETS
+))
+EXTRACTION_WAIT_SECONDS = registry.register(Histogram(
+    "extraction_queue_wait_seconds", "Time an extraction waited for a free worker",
+    buckets=LATENCY_BUCKETS + (30.0, 60.0, 120.0)
+))
+PDF_SIZE_BYTES = registry.register(Histogram(
+    "pdf_size_bytes", "Size of PDFs sent to extraction", buckets=SIZE_BUCKETS
+))
+PO_LINE_ITEMS = registry.register(Histogram(
+    "po_line_item_rows", "line_items rows (one per size) per saved purchase order", buckets=COUNT_BUCKETS
+))
+
+
+def observe_extraction(wait_seconds: float, run_seconds: float, succeeded: bool):
+    """ExtractionExecutor observer"""
+    EXTRACTION_WAIT_SECONDS.observe(wait_seconds)
+    GEMINI_EXTRACTION_SECONDS.observe(run_seconds, "ok" if succeeded else "error")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request into HTTP_REQUEST_SECONDS.
+
+    Routes are labelled by their template (/orders/{order_id}), read from the
+    scope after routing; requests that matched no route share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                getattr(route, "path", "unmatched"), scope["method"], str(status[0])
+            )
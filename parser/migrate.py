@@ -0,0 +1,110 @@
+# migrate.py
+"""Apply the SQL files in migrations/ to an existing database, in filename order.
+
+database_schema.sql always describes the full current schema for fresh
+installs; migrations bring databases created from an older schema up to date.
+Every migration is written to be idempotent, so running one against a fresh
+database is harmless.
+
+Files whose first line is `-- migrate:no-transaction` run statement by statement
+outside a transaction, which CREATE INDEX CONCURRENTLY needs.
+
+Usage (from parser/):
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied/pending migrations
+"""
+import argparse
+import asyncio
+import os
+
+import asyncpg
+from dotenv import load_dotenv
+
+from database import database_url
+
+load_dotenv()
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+
+
+def list_migrations():
+    """Return (version, path) for every migration file, oldest first"""
+    files = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    return [(f[:-4], os.path.join(MIGRATIONS_DIR, f)) for f in files]
+
+
+def split_statements(sql: str):
+    """Split a no-transaction migration into statements (one per `;` line ending)"""
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        if line.strip().startswith("--") and not current:
+            continue
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statement = "\n".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    tail = "\n".join(current).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+async def ensure_migrations_table(conn):
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(255) PRIMARY KEY,
+        applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+async def applied_versions(conn):
+    rows = await conn.fetch("SELECT version FROM schema_migrations")
+    return {row["version"] for row in rows}
+
+
+async def apply_migration(conn, version: str, path: str):
+    """Apply one migration file and record it"""
+    with open(path) as f:
+        sql = f.read()
+
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        for statement in split_statements(sql):
+            await conn.execute(statement)
+        await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1) ON CONFLICT DO NOTHING", version)
+    else:
+        async with conn.transaction():
+            await conn.execute(sql)
+            await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1) ON CONFLICT DO NOTHING", version)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="show applied and pending migrations")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        await ensure_migrations_table(conn)
+        applied = await applied_versions(conn)
+
+        for version, path in list_migrations():
+            if args.status:
+                print(f"{'applied' if version in applied else 'pending':<8} {version}")
+                continue
+            if version in applied:
+                continue
+            print(f"⏳ Applying {version}...")
+            await apply_migration(conn, version, path)
+            print(f"✅ Applied {version}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
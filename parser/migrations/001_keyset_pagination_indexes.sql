@@ -0,0 +1,12 @@
+-- migrate:no-transaction
+-- Indexes matching the keyset (cursor) sort expressions in queries.py, so
+-- cursor pages are read straight off an index instead of sorting the table.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_keyset_order_date
+    ON orders ((COALESCE(order_date, DATE '0001-01-01')), (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_keyset_total_amount
+    ON orders ((COALESCE(total_amount, -1000000000)), (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_line_items_keyset
+    ON line_items (order_id, (COALESCE(created_at, TIMESTAMP '0001-01-01')), id);
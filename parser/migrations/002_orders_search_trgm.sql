@@ -0,0 +1,16 @@
+-- migrate:no-transaction
+-- Trigram GIN indexes for GET /orders?search=...
+-- They serve both the leading-wildcard ILIKE (search_mode=contains) and the
+-- word-similarity operator <% (search_mode=ranked). A B-tree index can't
+-- serve either.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_purchase_order_id_trgm
+    ON orders USING GIN (purchase_order_id gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_buyer_name_trgm
+    ON orders USING GIN (buyer_name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_supplier_name_trgm
+    ON orders USING GIN (supplier_name gin_trgm_ops);
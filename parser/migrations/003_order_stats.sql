@@ -0,0 +1,34 @@
+-- Incrementally maintained dashboard statistics for GET /stats, see stats.py.
+-- Backfilled from the current data; `python stats.py reconcile --fix` repairs
+-- any drift from writes that raced this migration.
+
+CREATE TABLE IF NOT EXISTS order_stats (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    total_orders BIGINT NOT NULL DEFAULT 0,
+    total_items BIGINT NOT NULL DEFAULT 0,
+    total_value NUMERIC(18,2) NOT NULL DEFAULT 0,
+    total_buyers BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS buyer_order_counts (
+    buyer_name VARCHAR(255) PRIMARY KEY,
+    order_count BIGINT NOT NULL
+);
+
+INSERT INTO buyer_order_counts (buyer_name, order_count)
+SELECT buyer_name, COUNT(*) FROM orders WHERE buyer_name IS NOT NULL GROUP BY buyer_name
+ON CONFLICT (buyer_name) DO UPDATE SET order_count = EXCLUDED.order_count;
+
+INSERT INTO order_stats (id, total_orders, total_items, total_value, total_buyers)
+SELECT 1,
+       (SELECT COUNT(id) FROM orders),
+       (SELECT COUNT(id) FROM line_items),
+       (SELECT COALESCE(SUM(total_amount), 0) FROM orders),
+       (SELECT COUNT(DISTINCT buyer_name) FROM orders)
+ON CONFLICT (id) DO UPDATE SET
+    total_orders = EXCLUDED.total_orders,
+    total_items = EXCLUDED.total_items,
+    total_value = EXCLUDED.total_value,
+    total_buyers = EXCLUDED.total_buyers,
+    updated_at = CURRENT_TIMESTAMP;
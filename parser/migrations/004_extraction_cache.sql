@@ -0,0 +1,15 @@
+-- Parsed Gemini output keyed by PDF content, prompt and model, see extraction_cache.py
+
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    content_sha256 CHAR(64) NOT NULL,
+    prompt_version VARCHAR(64) NOT NULL,
+    model_name VARCHAR(100) NOT NULL,
+    parsed_data JSONB NOT NULL,
+    size_bytes BIGINT,
+    hit_count BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (content_sha256, prompt_version, model_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used_at ON extraction_cache(last_used_at);
@@ -0,0 +1,33 @@
+-- Quantity/value rollups by model, color, size and order month for
+-- GET /analytics/rollups, see rollups.py. Backfilled from the current data;
+-- `python rollups.py reconcile --fix` repairs any drift from writes that raced
+-- this migration.
+
+CREATE TABLE IF NOT EXISTS line_item_rollups (
+    model_id VARCHAR(100),
+    color VARCHAR(50),
+    size VARCHAR(20),
+    month DATE,
+    total_quantity BIGINT NOT NULL DEFAULT 0,
+    total_value NUMERIC(18,2) NOT NULL DEFAULT 0,
+    line_item_count BIGINT NOT NULL DEFAULT 0,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT line_item_rollups_key UNIQUE NULLS NOT DISTINCT (model_id, color, size, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_line_item_rollups_month ON line_item_rollups(month);
+
+DELETE FROM line_item_rollups;
+
+INSERT INTO line_item_rollups
+(model_id, color, size, month, total_quantity, total_value, line_item_count, order_count)
+SELECT li.model_id, li.color, li.size,
+       date_trunc('month', o.order_date)::date,
+       COALESCE(SUM(li.quantity), 0)::bigint,
+       COALESCE(SUM(li.amount), 0),
+       COUNT(*),
+       COUNT(DISTINCT li.order_id)
+FROM line_items li
+JOIN orders o ON o.id = li.order_id
+GROUP BY 1, 2, 3, 4;
@@ -0,0 +1,11 @@
+-- Upload job status shared by every API worker, see jobs.py
+
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id UUID PRIMARY KEY,
+    stage VARCHAR(20) NOT NULL,
+    snapshot JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_updated_at ON upload_jobs(updated_at);
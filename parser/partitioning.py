@@ -0,0 +1,523 @@
+# partitioning.py
+"""Optional monthly range partitioning of line_items by a denormalized order_date.
+
+A partitioned line_items carries a copy of its order's order_date and is split
+into one partition per month (line_items_pYYYY_MM), plus line_items_pdefault
+for items of undated orders and months that have no partition yet. Queries
+that bound li.order_date only scan the matching months, and retention can
+detach whole months instead of deleting rows. With LINE_ITEMS_PARTITIONED=true
+the API writes order_date on every item and adds the li.order_date bounds to
+date-filtered queries (see queries.build_order_filters). A trigger on orders
+keeps the copy current when an order's date changes.
+
+Migrating an existing database (from parser/), without long locks:
+    python partitioning.py prepare          # create line_items_partitioned, partitions and sync triggers
+    python partitioning.py backfill         # copy existing rows in short batches (safe to rerun)
+    python partitioning.py swap             # verify, then rename the tables in one brief lock
+    # restart the API with LINE_ITEMS_PARTITIONED=true
+
+Maintenance:
+    python partitioning.py status
+    python partitioning.py ensure --ahead 3          # create upcoming months, move stray rows out of the default partition
+    python partitioning.py retention --keep-months 24 [--drop]
+
+Until swap, writes to line_items are mirrored into line_items_partitioned by
+triggers, so backfill can run while the API is serving. After swap the old
+table is kept as line_items_legacy for rollback; drop it once satisfied.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import date
+from typing import List, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from database import database_url
+
+STAGING_TABLE = "line_items_partitioned"
+LEGACY_TABLE = "line_items_legacy"
+PARTITION_PREFIX = "line_items_p"
+DEFAULT_PARTITION = "line_items_pdefault"
+
+BACKFILL_BATCH_SIZE = 5000
+# DDL that needs a lock on line_items gives up instead of queueing behind long
+# transactions (and blocking every query that arrives after it)
+LOCK_TIMEOUT = "5s"
+LOCK_RETRIES = 5
+
+# Same columns as line_items, plus order_date. The partition key must be part
+# of every unique constraint, hence UNIQUE (id, order_date) in place of the
+# primary key; order_date stays nullable for undated orders.
+PARTITIONED_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    order_id UUID NOT NULL,
+    model_id VARCHAR(100),
+    item_code VARCHAR(100),
+    description TEXT,
+    color VARCHAR(50),
+    size VARCHAR(20),
+    quantity INTEGER,
+    unit_price NUMERIC(10,2),
+    amount NUMERIC(10,2),
+    delivery_date DATE,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    order_date DATE,
+    CONSTRAINT line_items_part_id_key UNIQUE (id, order_date),
+    CONSTRAINT line_items_part_order_id_fkey FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+) PARTITION BY RANGE (order_date)
+"""
+
+# Created on the parent, so every partition gets them
+PARTITIONED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_order_id ON {table}(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_model_id ON {table}(model_id)",
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_color ON {table}(color)",
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_size ON {table}(size)",
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_keyset ON {table}(order_id, (COALESCE(created_at, TIMESTAMP '0001-01-01')), id)",
+    "CREATE INDEX IF NOT EXISTS idx_line_items_part_order_date ON {table}(order_date)",
+]
+
+# Mirrors line_items writes into the staging table while the migration runs
+MIRROR_FUNCTION_DDL = f"""
+CREATE OR REPLACE FUNCTION mirror_line_items_partitioned() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {STAGING_TABLE} WHERE id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {STAGING_TABLE}
+        (id, order_id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date, created_at, order_date)
+        SELECT NEW.id, NEW.order_id, NEW.model_id, NEW.item_code, NEW.description, NEW.color, NEW.size,
+               NEW.quantity, NEW.unit_price, NEW.amount, NEW.delivery_date, NEW.created_at, o.order_date
+        FROM orders o
+        WHERE o.id = NEW.order_id
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Copies an order's new order_date onto its items (moving them between
+# partitions); the items table is the trigger argument
+ORDER_DATE_SYNC_FUNCTION_DDL = """
+CREATE OR REPLACE FUNCTION sync_line_items_order_date() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format('UPDATE %I SET order_date = $1 WHERE order_id = $2 AND order_date IS DISTINCT FROM $1', TG_ARGV[0])
+    USING NEW.order_date, NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+ORDER_DATE_SYNC_TRIGGER_DDL = """
+CREATE TRIGGER line_items_order_date_sync
+    AFTER UPDATE OF order_date ON orders
+    FOR EACH ROW
+    WHEN (OLD.order_date IS DISTINCT FROM NEW.order_date)
+    EXECUTE FUNCTION sync_line_items_order_date('{table}')
+"""
+
+BACKFILL_BATCH_QUERY = f"""
+WITH batch AS (
+    SELECT li.id, li.order_id, li.model_id, li.item_code, li.description, li.color, li.size,
+           li.quantity, li.unit_price, li.amount, li.delivery_date, li.created_at, o.order_date
+    FROM line_items li
+    JOIN orders o ON o.id = li.order_id
+    WHERE li.id > $1
+    ORDER BY li.id
+    LIMIT $2
+    FOR SHARE OF li
+),
+copied AS (
+    INSERT INTO {STAGING_TABLE}
+    (id, order_id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date, created_at, order_date)
+    SELECT * FROM batch b
+    -- The key is (id, order_date): a row already copied under another date
+    -- (its order's date changed since) must not be copied a second time
+    WHERE NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} p WHERE p.id = b.id)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+SELECT (SELECT id FROM batch ORDER BY id DESC LIMIT 1) as last_id,
+       (SELECT COUNT(*) FROM batch) as read,
+       (SELECT COUNT(*) FROM copied) as copied
+"""
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """The month a line_items_pYYYY_MM partition holds (None for other tables)"""
+    try:
+        year, month = name[len(PARTITION_PREFIX):].split("_")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+async def partitioned_parent(conn) -> Optional[str]:
+    """The partitioned items table: line_items after swap, the staging table before it, or None"""
+    return await conn.fetchval("""
+    SELECT relname FROM pg_class
+    WHERE relname IN ('line_items', $1) AND relkind = 'p' AND relnamespace = 'public'::regnamespace
+    ORDER BY relname = 'line_items' DESC
+    LIMIT 1
+    """, STAGING_TABLE)
+
+
+async def line_items_partitioned(conn) -> bool:
+    """Whether line_items itself is the partitioned table (i.e. swap has run)"""
+    return await partitioned_parent(conn) == "line_items"
+
+
+async def list_partitions(conn, parent: str) -> List[asyncpg.Record]:
+    return await conn.fetch("""
+    SELECT c.relname as name, pg_get_expr(c.relpartbound, c.oid) as bound,
+           c.reltuples::bigint as estimated_rows, pg_total_relation_size(c.oid) as total_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = $1::regclass
+    ORDER BY c.relname
+    """, parent)
+
+
+async def with_lock_retries(conn, step, description: str):
+    """Run step() in a transaction with a short lock_timeout, retrying when the lock isn't granted"""
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                return await step()
+        except asyncpg.exceptions.LockNotAvailableError:
+            if attempt == LOCK_RETRIES:
+                raise
+            print(f"⚠️  {description}: lock not granted within {LOCK_TIMEOUT}, retrying ({attempt}/{LOCK_RETRIES})")
+            await asyncio.sleep(attempt)
+
+
+async def create_month_partition(conn, parent: str, month: date) -> bool:
+    """Create one month's partition, moving its rows out of the default partition first; False if it exists"""
+    name = partition_name(month)
+    if await conn.fetchval("SELECT to_regclass($1)", name):
+        return False
+    upper = add_months(month, 1)
+
+    async def step():
+        stray = await conn.fetchval(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE order_date >= $1 AND order_date < $2)",
+            month, upper
+        )
+        if not stray:
+            await conn.execute(
+                f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM ('{month}') TO ('{upper}')"
+            )
+            return
+        # Creating the partition would fail while the default one holds rows
+        # for its range, so build it detached, move the rows, then attach
+        await conn.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)")
+        await conn.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE order_date >= $1 AND order_date < $2
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """, month, upper)
+        await conn.execute(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{upper}')")
+
+    await with_lock_retries(conn, step, f"create {name}")
+    return True
+
+
+async def ensure_partitions(conn, parent: str, ahead: int = 3, first_month: Optional[date] = None) -> List[str]:
+    """Create monthly partitions from first_month (default: this month) to `ahead` months out,
+    plus one for every month that has rows stranded in the default partition"""
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT")
+
+    # Items saved without order_date (e.g. by an API not yet restarted after swap)
+    await conn.execute(f"""
+    UPDATE {parent} li SET order_date = o.order_date
+    FROM orders o
+    WHERE o.id = li.order_id AND li.order_date IS NULL AND o.order_date IS NOT NULL
+    """)
+
+    current = month_start(date.today())
+    months = set()
+    month = first_month or current
+    while month <= add_months(current, ahead):
+        months.add(month)
+        month = add_months(month, 1)
+    stranded = await conn.fetch(f"""
+    SELECT DISTINCT date_trunc('month', order_date)::date as month
+    FROM {DEFAULT_PARTITION}
+    WHERE order_date IS NOT NULL
+    """)
+    months.update(row["month"] for row in stranded)
+
+    created = []
+    for month in sorted(months):
+        if await create_month_partition(conn, parent, month):
+            created.append(partition_name(month))
+    return created
+
+# A batch that read an order's date just before the date changed can still
+# copy its rows under the old date next to the trigger's copies; keep the copy
+# carrying the order's current date (or the newest, for an undated order)
+DEDUPE_STAGED_QUERY = f"""
+DELETE FROM {STAGING_TABLE} p
+USING (
+    SELECT p.ctid, p.tableoid,
+           ROW_NUMBER() OVER (
+               PARTITION BY p.id
+               ORDER BY (p.order_date IS NOT DISTINCT FROM o.order_date) DESC, p.order_date DESC NULLS LAST
+           ) as copy
+    FROM {STAGING_TABLE} p
+    LEFT JOIN orders o ON o.id = p.order_id
+    WHERE p.id IN (SELECT id FROM {STAGING_TABLE} GROUP BY id HAVING COUNT(*) > 1)
+) dup
+WHERE p.ctid = dup.ctid AND p.tableoid = dup.tableoid AND dup.copy > 1
+"""
+
+
+async def prepare(conn, ahead: int):
+    """Create the staging table, its partitions and indexes, and the sync triggers"""
+    if await line_items_partitioned(conn):
+        print("✅ line_items is already partitioned")
+        return
+
+    await conn.execute(PARTITIONED_TABLE_DDL.format(table=STAGING_TABLE))
+    for statement in PARTITIONED_INDEXES:
+        await conn.execute(statement.format(table=STAGING_TABLE))
+
+    first = await conn.fetchval("SELECT date_trunc('month', MIN(order_date))::date FROM orders")
+    created = await ensure_partitions(conn, STAGING_TABLE, ahead, first_month=first)
+    print(f"🔧 Created {STAGING_TABLE} with {len(created)} monthly partitions")
+
+    await conn.execute(MIRROR_FUNCTION_DDL)
+    await conn.execute(ORDER_DATE_SYNC_FUNCTION_DDL)
+
+    async def install_triggers():
+        await conn.execute("DROP TRIGGER IF EXISTS line_items_mirror_partitioned ON line_items")
+        await conn.execute("""
+        CREATE TRIGGER line_items_mirror_partitioned
+            AFTER INSERT OR UPDATE OR DELETE ON line_items
+            FOR EACH ROW
+            EXECUTE FUNCTION mirror_line_items_partitioned()
+        """)
+        await conn.execute("DROP TRIGGER IF EXISTS line_items_order_date_sync ON orders")
+        await conn.execute(ORDER_DATE_SYNC_TRIGGER_DDL.format(table=STAGING_TABLE))
+
+    await with_lock_retries(conn, install_triggers, "install sync triggers")
+    print("🔧 Installed sync triggers; writes to line_items are now mirrored. Next: python partitioning.py backfill")
+
+
+async def backfill(conn, batch_size: int, pause: float):
+    """Copy existing rows into the staging table in short, independent transactions"""
+    if await partitioned_parent(conn) != STAGING_TABLE:
+        print(f"❌ {STAGING_TABLE} doesn't exist; run prepare first")
+        sys.exit(1)
+    if not await conn.fetchval("SELECT COUNT(*) FROM pg_trigger WHERE tgname = 'line_items_mirror_partitioned'"):
+        # Rows written during the copy would otherwise be missed
+        print("❌ The mirror trigger is missing; run prepare first")
+        sys.exit(1)
+
+    last_id = uuid.UUID(int=0)
+    total_read = total_copied = 0
+    started = time.perf_counter()
+    while True:
+        # Each batch only holds FOR SHARE row locks, and only until it commits
+        async with conn.transaction():
+            row = await conn.fetchrow(BACKFILL_BATCH_QUERY, last_id, batch_size)
+        if not row["read"]:
+            break
+        last_id = row["last_id"]
+        total_read += row["read"]
+        total_copied += row["copied"]
+        print(f"  {total_read} rows read, {total_copied} copied ({total_read / (time.perf_counter() - started):.0f} rows/s)")
+        if pause:
+            await asyncio.sleep(pause)
+
+    removed = await conn.execute(DEDUPE_STAGED_QUERY)
+    if removed != "DELETE 0":
+        print(f"🧹 Removed duplicate copies: {removed.split()[-1]} rows")
+    await conn.execute(f"ANALYZE {STAGING_TABLE}")
+    print(f"✅ Backfill done: {total_read} rows read, {total_copied} copied. Next: python partitioning.py swap")
+
+
+async def verify(conn) -> List[str]:
+    """Differences between line_items and the staging table, read from one snapshot"""
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        legacy = await conn.fetchval("SELECT COUNT(*) FROM line_items")
+        staged = await conn.fetchval(f"SELECT COUNT(*) FROM {STAGING_TABLE}")
+        missing = await conn.fetchval(f"""
+        SELECT COUNT(*) FROM line_items li
+        WHERE NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} p WHERE p.id = li.id)
+        """)
+        duplicates = await conn.fetchval(f"""
+        SELECT COALESCE(SUM(copies - 1), 0) FROM (
+            SELECT COUNT(*) as copies FROM {STAGING_TABLE} GROUP BY id HAVING COUNT(*) > 1
+        ) d
+        """)
+        wrong_dates = await conn.fetchval(f"""
+        SELECT COUNT(*) FROM {STAGING_TABLE} p
+        JOIN orders o ON o.id = p.order_id
+        WHERE p.order_date IS DISTINCT FROM o.order_date
+        """)
+    problems = []
+    if legacy != staged:
+        problems.append(f"line_items has {legacy} rows, {STAGING_TABLE} has {staged}")
+    if missing:
+        problems.append(f"{missing} line_items rows are missing from {STAGING_TABLE}")
+    if duplicates:
+        problems.append(f"{duplicates} extra copies of rows in {STAGING_TABLE} (same id under another order_date)")
+    if wrong_dates:
+        problems.append(f"{wrong_dates} rows carry an order_date that differs from their order's")
+    return problems
+
+
+async def swap(conn):
+    """Verify the copy, then put the partitioned table in place of line_items"""
+    if await line_items_partitioned(conn):
+        print("✅ line_items is already partitioned")
+        return
+    problems = await verify(conn)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        print("   Rerun python partitioning.py backfill, then swap again")
+        sys.exit(1)
+
+    async def rename():
+        # Renames and trigger swaps only: the lock is held for milliseconds
+        await conn.execute(f"LOCK TABLE line_items, {STAGING_TABLE} IN ACCESS EXCLUSIVE MODE")
+        await conn.execute("DROP TRIGGER IF EXISTS line_items_mirror_partitioned ON line_items")
+        await conn.execute(f"ALTER TABLE line_items RENAME TO {LEGACY_TABLE}")
+        await conn.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO line_items")
+        await conn.execute("DROP TRIGGER IF EXISTS line_items_order_date_sync ON orders")
+        await conn.execute(ORDER_DATE_SYNC_TRIGGER_DDL.format(table="line_items"))
+        await conn.execute("DROP FUNCTION IF EXISTS mirror_line_items_partitioned()")
+
+    await with_lock_retries(conn, rename, "swap tables")
+    print(f"✅ line_items is now partitioned by month; the old table is {LEGACY_TABLE}")
+    print("   Restart the API with LINE_ITEMS_PARTITIONED=true, then run python partitioning.py ensure")
+    print(f"   Drop {LEGACY_TABLE} once you no longer need it for rollback")
+
+
+async def retention(conn, keep_months: int, drop: bool) -> List[str]:
+    """Detach (and optionally drop) partitions older than keep_months; returns their names"""
+    parent = await partitioned_parent(conn)
+    if parent != "line_items":
+        print("❌ line_items isn't partitioned; run prepare, backfill and swap first")
+        sys.exit(1)
+
+    cutoff = add_months(month_start(date.today()), -keep_months)
+    expired = []
+    for partition in await list_partitions(conn, parent):
+        month = partition_month(partition["name"])
+        if month is not None and month < cutoff:
+            expired.append(partition["name"])
+
+    for name in expired:
+        # DETACH ... CONCURRENTLY isn't allowed next to a default partition;
+        # a plain detach only changes the catalog, under a short lock_timeout
+        async def detach():
+            await conn.execute(f"ALTER TABLE {parent} DETACH PARTITION {name}")
+        await with_lock_retries(conn, detach, f"detach {name}")
+        if drop:
+            await conn.execute(f"DROP TABLE {name}")
+            print(f"🧹 Dropped {name}")
+        else:
+            print(f"🧹 Detached {name} (kept as a standalone table)")
+
+    if expired:
+        # The summaries counted the detached rows
+        from rollups import rebuild_rollups
+        from stats import rebuild_stats
+        await rebuild_stats(conn)
+        await rebuild_rollups(conn)
+        print("🔧 Rebuilt order_stats and line_item_rollups")
+    return expired
+
+
+async def status(conn):
+    parent = await partitioned_parent(conn)
+    if parent is None:
+        print("line_items is not partitioned (run python partitioning.py prepare to start)")
+        return
+    stage = "swapped" if parent == "line_items" else "migrating (staging table, not yet swapped)"
+    print(f"Partitioned table: {parent} — {stage}")
+    for partition in await list_partitions(conn, parent):
+        print(f"  {partition['name']:<28} {partition['bound']:<60} ~{max(partition['estimated_rows'], 0)} rows, "
+              f"{partition['total_bytes'] / 1024 / 1024:.1f} MB")
+    triggers = await conn.fetch("""
+    SELECT tgname FROM pg_trigger
+    WHERE tgname IN ('line_items_mirror_partitioned', 'line_items_order_date_sync')
+    """)
+    print(f"Sync triggers: {', '.join(row['tgname'] for row in triggers) or 'none'}")
+    if await conn.fetchval("SELECT to_regclass($1)", LEGACY_TABLE):
+        print(f"{LEGACY_TABLE} still exists")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Monthly partitioning of line_items")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prepare_parser = subparsers.add_parser("prepare", help="create the partitioned staging table and sync triggers")
+    prepare_parser.add_argument("--ahead", type=int, default=3, help="months to create past the current one")
+    backfill_parser = subparsers.add_parser("backfill", help="copy existing line_items in batches")
+    backfill_parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    backfill_parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    subparsers.add_parser("swap", help="verify the copy and rename it into place")
+    ensure_parser = subparsers.add_parser("ensure", help="create upcoming monthly partitions")
+    ensure_parser.add_argument("--ahead", type=int, default=3)
+    retention_parser = subparsers.add_parser("retention", help="detach partitions older than --keep-months")
+    retention_parser.add_argument("--keep-months", type=int, required=True)
+    retention_parser.add_argument("--drop", action="store_true", help="drop the detached partitions")
+    subparsers.add_parser("status", help="list partitions and migration state")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        if args.command == "prepare":
+            await prepare(conn, args.ahead)
+        elif args.command == "backfill":
+            await backfill(conn, args.batch_size, args.pause)
+        elif args.command == "swap":
+            await swap(conn)
+        elif args.command == "ensure":
+            parent = await partitioned_parent(conn)
+            if parent is None:
+                print("❌ line_items isn't partitioned")
+                sys.exit(1)
+            created = await ensure_partitions(conn, parent, args.ahead)
+            print(f"✅ {len(created)} partitions created{': ' + ', '.join(created) if created else ''}")
+        elif args.command == "retention":
+            expired = await retention(conn, args.keep_months, args.drop)
+            if not expired:
+                print(f"✅ No partitions older than {args.keep_months} months")
+        else:
+            await status(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+    asyncio.run(main())
@@ -0,0 +1,535 @@
+# queries.py
+"""SQL builders for the order listing endpoints.
+
+Kept separate from server.py so the benchmark and check scripts can run the
+exact query shapes the API generates without importing the FastAPI app.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from ingest import LINE_ITEMS_PARTITIONED
+
+
+# search_mode=contains: substring match; the pg_trgm GIN indexes serve the
+# leading-wildcard ILIKE. search_mode=ranked: trigram word similarity (same
+# indexes, via the <% operator) with results ordered by SEARCH_RANK_SQL.
+SEARCH_MODES = ("contains", "ranked")
+SEARCH_RANK_SQL = (
+    "GREATEST(word_similarity($1, o.purchase_order_id), "
+    "word_similarity($1, o.buyer_name), word_similarity($1, o.supplier_name))"
+)
+
+
+def build_order_lookup(order_id: str) -> Tuple[str, list]:
+    """Build the GET /orders/{order_id} lookup, by id or purchase_order_id.
+
+    Comparing id as uuid (never id::text) lets both branches use an index;
+    an order_id that isn't a UUID can only be a purchase_order_id.
+    """
+    try:
+        order_uuid = uuid.UUID(order_id)
+    except ValueError:
+        return "SELECT * FROM orders WHERE purchase_order_id = $1", [order_id]
+    return "SELECT * FROM orders WHERE id = $1 OR purchase_order_id = $2", [order_uuid, order_id]
+
+
+def build_order_filters(
+    search: Optional[str] = None,
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    search_mode: str = "contains",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Tuple[List[str], list]:
+    """Build the WHERE conditions (over alias `o`) and params for the orders listing.
+
+    The search term, when present, is always $1 so SEARCH_RANK_SQL can refer to it.
+    date_from/date_to bound o.order_date (inclusive); with a partitioned
+    line_items the item subqueries repeat the bounds so they only scan the
+    months in range.
+    """
+    where_conditions = []
+    params = []
+    param_count = 0
+    item_date = ""
+
+    if search:
+        param_count += 1
+        if search_mode == "ranked":
+            where_conditions.append(f"(${param_count} <% o.purchase_order_id OR ${param_count} <% o.buyer_name OR ${param_count} <% o.supplier_name)")
+            params.append(search)
+        else:
+            where_conditions.append(f"(o.purchase_order_id ILIKE ${param_count} OR o.buyer_name ILIKE ${param_count} OR o.supplier_name ILIKE ${param_count})")
+            params.append(f"%{search}%")
+
+    date_conditions, date_params = build_date_conditions(date_from, date_to, param_count, "o.order_date")
+    if date_params:
+        where_conditions.extend(date_conditions)
+        if LINE_ITEMS_PARTITIONED:
+            item_conditions, _ = build_date_conditions(date_from, date_to, param_count, "li.order_date")
+            item_date = "".join(f" AND {condition}" for condition in item_conditions)
+        param_count += len(date_params)
+        params.extend(date_params)
+
+    if model_id:
+        param_count += 1
+        where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND li.model_id ILIKE ${param_count}{item_date})")
+        params.append(f"%{model_id}%")
+
+    if color:
+        param_count += 1
+        where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND LOWER(li.color) LIKE LOWER(${param_count}){item_date})")
+        params.append(f"%{color}%")
+
+    if size:
+        param_count += 1
+        where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND li.size = ${param_count}{item_date})")
+        params.append(size)
+
+    return where_conditions, params
+
+
+def build_date_conditions(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    param_count: int = 0,
+    column: str = "o.order_date"
+) -> Tuple[List[str], list]:
+    """Build inclusive order date bounds on column, numbering params after param_count"""
+    conditions = []
+    params = []
+
+    if date_from:
+        param_count += 1
+        conditions.append(f"{column} >= ${param_count}")
+        params.append(date_from)
+
+    if date_to:
+        param_count += 1
+        conditions.append(f"{column} <= ${param_count}")
+        params.append(date_to)
+
+    return conditions, params
+
+
+def where_sql(where_conditions: List[str]) -> str:
+    """Join filter conditions into a WHERE clause (empty string when unfiltered)"""
+    return "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+
+
+def build_orders_page_query(
+    where_clause: str, sort_by: str, sort_order: str, param_count: int, ranked: bool = False, with_total: bool = False
+) -> str:
+    """Build the page query; LIMIT/OFFSET take the two params after the filter params.
+
+    With ranked=True each row carries a search_rank and the best matches come
+    first, with sort_by breaking ties. With with_total=True each row also
+    carries total_count, the number of matching orders (COUNT(*) OVER () runs
+    after GROUP BY and before LIMIT), saving the separate COUNT query.
+    """
+    rank_select = f", {SEARCH_RANK_SQL} as search_rank" if ranked else ""
+    total_select = ", COUNT(*) OVER () as total_count" if with_total else ""
+    rank_order = "search_rank DESC, " if ranked else ""
+
+    if sort_by == 'item_count':
+        # For item_count sorting, we need the COUNT in a subquery
+        return f"""
+        SELECT o.*, COALESCE(item_counts.item_count, 0) as item_count{rank_select}{total_select}
+        FROM orders o
+        LEFT JOIN (
+            SELECT li.order_id, COUNT(li.id) as item_count
+            FROM line_items li
+            GROUP BY li.order_id
+        ) item_counts ON o.id = item_counts.order_id
+        {where_clause}
+        ORDER BY {rank_order}item_count {sort_order.upper()}, o.created_at DESC
+        LIMIT ${param_count + 1} OFFSET ${param_count + 2}
+        """
+
+    # For simple column sorting
+    sort_column_map = {
+        'order_date': 'o.order_date',
+        'total_amount': 'o.total_amount'
+    }
+    sort_column = sort_column_map.get(sort_by, 'o.order_date')
+
+    return f"""
+    SELECT o.*, COUNT(li.id) as item_count{rank_select}{total_select}
+    FROM orders o
+    LEFT JOIN line_items li ON o.id = li.order_id
+    {where_clause}
+    GROUP BY o.id
+    ORDER BY {rank_order}{sort_column} {sort_order.upper()}, o.created_at DESC
+    LIMIT ${param_count + 1} OFFSET ${param_count + 2}
+    """
+
+
+ORDER_COUNT_STRATEGIES = ("exact", "window", "estimate")
+
+
+def build_orders_count_query(where_clause: str) -> str:
+    return f"SELECT COUNT(*) FROM orders o {where_clause}"
+
+
+async def estimate_orders_count(conn, where_clause: str, params: list) -> int:
+    """The planner's row estimate for the filtered orders, from EXPLAIN (no execution).
+
+    Estimates come from table statistics, so they drift between ANALYZE runs
+    and are loosest for the correlated line_items EXISTS filters.
+    """
+    plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM orders o {where_clause}", *params)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def build_item_match_conditions(
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    param_count: int = 0,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Tuple[List[str], list]:
+    """Build line item match conditions (over alias `li`), numbering params after param_count.
+
+    The date bounds are only applied with a partitioned line_items, where they
+    prune partitions; the orders filter already holds them otherwise.
+    """
+    item_conditions = []
+    item_params = []
+
+    if LINE_ITEMS_PARTITIONED:
+        item_conditions, item_params = build_date_conditions(date_from, date_to, param_count, "li.order_date")
+        param_count += len(item_params)
+
+    if model_id:
+        param_count += 1
+        item_conditions.append(f"li.model_id ILIKE ${param_count}")
+        item_params.append(f"%{model_id}%")
+
+    if color:
+        param_count += 1
+        item_conditions.append(f"LOWER(li.color) LIKE LOWER(${param_count})")
+        item_params.append(f"%{color}%")
+
+    if size:
+        param_count += 1
+        item_conditions.append(f"li.size ILIKE ${param_count}")
+        item_params.append(f"%{size}%")
+
+    return item_conditions, item_params
+
+
+def build_matching_items_query(
+    order_ids: list,
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Tuple[str, list]:
+    """Build the query (and params) fetch_matching_items runs for a page of orders"""
+    item_conditions, item_params = build_item_match_conditions(
+        model_id, color, size, param_count=1, date_from=date_from, date_to=date_to
+    )
+    item_where = " AND ".join(["li.order_id = ANY($1::uuid[])"] + item_conditions)
+
+    items_query = f"""
+    SELECT li.*, true as is_match
+    FROM line_items li
+    WHERE {item_where}
+    ORDER BY li.order_id, li.created_at
+    """
+    return items_query, [list(order_ids)] + item_params
+
+
+async def fetch_matching_items(
+    conn,
+    order_ids: list,
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Dict[object, List[dict]]:
+    """Fetch the matching line items for a whole page of orders in one round trip.
+
+    Returns a dict keyed by order id; every requested id is present, with an
+    empty list when none of its items match.
+    """
+    items_by_order = {order_id: [] for order_id in order_ids}
+    if not order_ids:
+        return items_by_order
+
+    items_query, item_params = build_matching_items_query(order_ids, model_id, color, size, date_from, date_to)
+    items = await conn.fetch(items_query, *item_params)
+    for item in items:
+        items_by_order[item["order_id"]].append(dict(item))
+
+    return items_by_order
+
+
+# --- Keyset (cursor) pagination -------------------------------------------------
+
+# Sort keys are COALESCEd so NULLs take part in row comparisons; in cursor mode
+# they sort as the lowest value. created_at/id break ties between equal keys.
+# The date sentinels are date.min/datetime.min in Python, which asyncpg sends
+# as -infinity: cursor keys are therefore bound as text and cast in SQL (see
+# keyset_param), so an undated order's key comes back as '0001-01-01'.
+KEYSET_SORT_KEYS = {
+    'order_date': ("COALESCE(o.order_date, DATE '0001-01-01')", "date"),
+    'total_amount': ("COALESCE(o.total_amount, -1000000000)", "numeric"),
+    'item_count': ("page.item_count", "bigint"),
+}
+KEYSET_CREATED = "COALESCE(o.created_at, TIMESTAMP '0001-01-01')"
+
+
+def encode_cursor(payload: dict) -> str:
+    """Encode a cursor payload as an opaque URL-safe token"""
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    """Decode a cursor token; raises ValueError when it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if not isinstance(payload, dict) or payload.get("d") not in ("next", "prev"):
+        raise ValueError("Malformed cursor")
+    return payload
+
+
+def parse_sort_key(sort_by: str, value):
+    """Turn a cursor's sort key back into the Python type asyncpg expects"""
+    if sort_by == 'order_date':
+        return date.fromisoformat(value)
+    if sort_by == 'total_amount':
+        return Decimal(value)
+    if sort_by == 'item_count':
+        return int(value)
+    raise ValueError(f"Unsupported sort_by for cursor: {sort_by}")
+
+
+def keyset_param(position: int, sql_type: str) -> str:
+    """Placeholder for a cursor key: bound as text so sentinel values round-trip unchanged"""
+    return f"${position}::text::{sql_type}"
+
+
+def order_cursor(row, sort_by: str, sort_order: str, direction: str) -> str:
+    """Build the cursor that continues from an orders keyset row"""
+    return encode_cursor({
+        "s": sort_by,
+        "o": sort_order,
+        "d": direction,
+        "k": str(row["sort_key"]),
+        "c": row["sort_created"].isoformat(),
+        "i": str(row["id"]),
+    })
+
+
+def keyset_bounds(cursor: Optional[dict], sort_order: str) -> Tuple[str, str]:
+    """Return the (comparison, ORDER BY direction) to read the next rows for a cursor"""
+    descending = sort_order == 'desc'
+    if cursor and cursor["d"] == 'prev':
+        descending = not descending
+    return ("<", "DESC") if descending else (">", "ASC")
+
+
+def build_orders_keyset_query(
+    where_conditions: List[str],
+    sort_by: str,
+    sort_order: str,
+    cursor: Optional[dict],
+    param_count: int
+) -> Tuple[str, list]:
+    """Build the cursor-mode page query.
+
+    Returns the query and the params to append after the filter params: the
+    cursor's (key, created_at, id) when continuing, then LIMIT. Callers fetch
+    limit + 1 rows to learn whether another page exists.
+    """
+    key_expr, key_type = KEYSET_SORT_KEYS[sort_by]
+    comparison, direction = keyset_bounds(cursor, sort_order)
+    extra_params = []
+    keyset_condition = None
+
+    if cursor:
+        if sort_by == 'item_count':
+            created_expr, id_expr = "page.sort_created", "page.id"
+        else:
+            created_expr, id_expr = KEYSET_CREATED, "o.id"
+        keyset_condition = (
+            f"({key_expr}, {created_expr}, {id_expr}) {comparison} "
+            f"({keyset_param(param_count + 1, key_type)}, {keyset_param(param_count + 2, 'timestamp')}, ${param_count + 3}::uuid)"
+        )
+        # Parsed to reject malformed cursors, then bound as text
+        extra_params = [
+            str(parse_sort_key(sort_by, cursor["k"])),
+            datetime.fromisoformat(cursor["c"]).isoformat(),
+            uuid.UUID(cursor["i"]),
+        ]
+        param_count += 3
+
+    limit_param = f"${param_count + 1}"
+
+    if sort_by == 'item_count':
+        outer_where = f"WHERE {keyset_condition}" if keyset_condition else ""
+        query = f"""
+        SELECT page.*, page.item_count as sort_key
+        FROM (
+            SELECT o.*, COALESCE(item_counts.item_count, 0) as item_count, {KEYSET_CREATED} as sort_created
+            FROM orders o
+            LEFT JOIN (
+                SELECT li.order_id, COUNT(li.id) as item_count
+                FROM line_items li
+                GROUP BY li.order_id
+            ) item_counts ON o.id = item_counts.order_id
+            {where_sql(where_conditions)}
+        ) page
+        {outer_where}
+        ORDER BY page.item_count {direction}, page.sort_created {direction}, page.id {direction}
+        LIMIT {limit_param}
+        """
+    else:
+        # No join/GROUP BY here: the keyset indexes return the page in order and
+        # the item counts are only computed for the rows that are returned.
+        conditions = where_conditions + ([keyset_condition] if keyset_condition else [])
+        query = f"""
+        SELECT o.*,
+               (SELECT COUNT(li.id) FROM line_items li WHERE li.order_id = o.id) as item_count,
+               {key_expr} as sort_key, {KEYSET_CREATED} as sort_created
+        FROM orders o
+        {where_sql(conditions)}
+        ORDER BY {key_expr} {direction}, {KEYSET_CREATED} {direction}, o.id {direction}
+        LIMIT {limit_param}
+        """
+
+    return query, extra_params
+
+
+def keyset_page(rows: list, limit: int, cursor: Optional[dict], make_cursor) -> Tuple[list, Optional[str], Optional[str]]:
+    """Trim a limit + 1 keyset fetch and work out the next/prev cursors.
+
+    make_cursor(row, direction) builds the token for continuing from a row.
+    """
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    going_back = bool(cursor) and cursor["d"] == 'prev'
+    if going_back:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    if going_back:
+        next_cursor = make_cursor(rows[-1], "next")
+        prev_cursor = make_cursor(rows[0], "prev") if has_more else None
+    else:
+        next_cursor = make_cursor(rows[-1], "next") if has_more else None
+        prev_cursor = make_cursor(rows[0], "prev") if cursor else None
+
+    return rows, next_cursor, prev_cursor
+
+
+LINE_ITEM_CREATED = "COALESCE(li.created_at, TIMESTAMP '0001-01-01')"
+
+
+def build_line_item_filters(
+    order,
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None
+) -> Tuple[List[str], list]:
+    """Build the WHERE conditions (over alias `li`) and params for one order's items (GET /orders/{id}).
+
+    order is the orders row (its id and order_date are used).
+    """
+    where_conditions = ["li.order_id = $1"]
+    params = [order["id"]]
+    param_count = 1
+
+    if LINE_ITEMS_PARTITIONED:
+        # Items carry their order's date, so only its month's partition is read
+        if order["order_date"] is None:
+            where_conditions.append("li.order_date IS NULL")
+        else:
+            param_count += 1
+            where_conditions.append(f"li.order_date = ${param_count}")
+            params.append(order["order_date"])
+
+    if model_id:
+        param_count += 1
+        where_conditions.append(f"li.model_id ILIKE ${param_count}")
+        params.append(f"%{model_id}%")
+
+    if color:
+        param_count += 1
+        where_conditions.append(f"LOWER(li.color) LIKE LOWER(${param_count})")
+        params.append(f"%{color}%")
+
+    if size:
+        param_count += 1
+        where_conditions.append(f"li.size = ${param_count}")
+        params.append(size)
+
+    return where_conditions, params
+
+
+def build_line_items_page_query(where_clause: str, param_count: int) -> str:
+    """Build the page-mode line item query for one order; LIMIT/OFFSET take the two params after the filters.
+
+    where_clause is the conditions joined with AND (no WHERE keyword).
+    """
+    return f"""
+    SELECT li.* FROM line_items li
+    WHERE {where_clause}
+    ORDER BY li.created_at
+    LIMIT ${param_count + 1} OFFSET ${param_count + 2}
+    """
+
+
+def line_item_cursor(row, direction: str) -> str:
+    """Build the cursor that continues from a line item keyset row"""
+    return encode_cursor({
+        "s": "line_items",
+        "d": direction,
+        "c": row["sort_created"].isoformat(),
+        "i": str(row["id"]),
+    })
+
+
+def build_line_items_keyset_query(where_conditions: List[str], cursor: Optional[dict], param_count: int) -> Tuple[str, list]:
+    """Build the cursor-mode line item query for one order, in created_at order.
+
+    Returns the query and the params to append: the cursor's (created_at, id)
+    when continuing, then LIMIT.
+    """
+    comparison, direction = keyset_bounds(cursor, 'asc')
+    conditions = list(where_conditions)
+    extra_params = []
+
+    if cursor:
+        conditions.append(
+            f"({LINE_ITEM_CREATED}, li.id) {comparison} ({keyset_param(param_count + 1, 'timestamp')}, ${param_count + 2}::uuid)"
+        )
+        extra_params = [datetime.fromisoformat(cursor["c"]).isoformat(), uuid.UUID(cursor["i"])]
+        param_count += 2
+
+    query = f"""
+    SELECT li.*, {LINE_ITEM_CREATED} as sort_created
+    FROM line_items li
+    {where_sql(conditions)}
+    ORDER BY {LINE_ITEM_CREATED} {direction}, li.id {direction}
+    LIMIT ${param_count + 1}
+    """
+    return query, extra_params
@@ -0,0 +1,51 @@
+# responses.py
+"""orjson-backed JSON rendering for asyncpg records.
+
+orjson serialises dates, datetimes and UUIDs natively; the default hook only
+sees Decimal (and asyncpg's UUID subclass), which it renders the same way
+FastAPI's jsonable_encoder does so responses keep their shape.
+"""
+import uuid
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        # Same rule as fastapi.encoders.decimal_encoder
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Serialise a response payload to JSON bytes"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_line(content) -> bytes:
+    """Serialise one NDJSON line"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson.
+
+    Handlers return it directly: FastAPI still runs jsonable_encoder over a
+    plain dict a handler returns, even with this as the default response class.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(JSONResponse):
+    """JSON response for a payload that is already serialised bytes (e.g. from a cache)"""
+
+    def render(self, content) -> bytes:
+        return content
@@ -0,0 +1,236 @@
+# rollups.py
+"""Pre-aggregated line item quantities and values by model, color, size and month.
+
+line_item_rollups holds one row per (model_id, color, size, order month). Every
+write path captures the order's contribution before it changes and after, and
+applies the difference with apply_rollup_delta inside its own transaction, so
+the rollups commit (or roll back) with the change. Deltas are applied in key
+order, which keeps concurrent saves touching the same rows from deadlocking.
+Rows whose counts drop to zero are left in place and filtered out on read.
+
+Reconcile against a full recompute (from parser/):
+    python rollups.py reconcile          # report drift
+    python rollups.py reconcile --fix    # report drift and rebuild
+    python rollups.py rebuild            # rebuild unconditionally
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from database import database_url
+
+# (model_id, color, size, month)
+RollupKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[date]]
+# (total_quantity, total_value, line_item_count)
+RollupTotals = Tuple[int, Decimal, int]
+
+ROLLUP_DIMENSIONS = ("model_id", "color", "size", "month")
+
+ORDER_CONTRIBUTION_QUERY = """
+SELECT li.model_id, li.color, li.size,
+       date_trunc('month', o.order_date)::date as month,
+       COALESCE(SUM(li.quantity), 0)::bigint as total_quantity,
+       COALESCE(SUM(li.amount), 0) as total_value,
+       COUNT(*) as line_item_count
+FROM line_items li
+JOIN orders o ON o.id = li.order_id
+WHERE li.order_id = $1
+GROUP BY 1, 2, 3, 4
+"""
+
+APPLY_DELTA_QUERY = """
+INSERT INTO line_item_rollups
+(model_id, color, size, month, total_quantity, total_value, line_item_count, order_count)
+SELECT d.model_id, d.color, d.size, d.month, d.total_quantity, d.total_value, d.line_item_count, d.order_count
+FROM unnest($1::text[], $2::text[], $3::text[], $4::date[], $5::bigint[], $6::numeric[], $7::bigint[], $8::bigint[])
+     WITH ORDINALITY AS d(model_id, color, size, month, total_quantity, total_value, line_item_count, order_count, ordinal)
+ORDER BY d.ordinal
+ON CONFLICT (model_id, color, size, month) DO UPDATE SET
+    total_quantity = line_item_rollups.total_quantity + EXCLUDED.total_quantity,
+    total_value = line_item_rollups.total_value + EXCLUDED.total_value,
+    line_item_count = line_item_rollups.line_item_count + EXCLUDED.line_item_count,
+    order_count = line_item_rollups.order_count + EXCLUDED.order_count,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+RECOMPUTE_QUERY = """
+SELECT li.model_id, li.color, li.size,
+       date_trunc('month', o.order_date)::date as month,
+       COALESCE(SUM(li.quantity), 0)::bigint as total_quantity,
+       COALESCE(SUM(li.amount), 0) as total_value,
+       COUNT(*) as line_item_count,
+       COUNT(DISTINCT li.order_id) as order_count
+FROM line_items li
+JOIN orders o ON o.id = li.order_id
+GROUP BY 1, 2, 3, 4
+"""
+
+
+def _sort_key(key: RollupKey):
+    # NULLs first, then by value, per dimension
+    return tuple((value is not None, value if value is not None else "") for value in key)
+
+
+async def order_contribution(conn, order_id) -> Dict[RollupKey, RollupTotals]:
+    """What one order's current line items add to each rollup row ({} when it has none)"""
+    if order_id is None:
+        return {}
+    rows = await conn.fetch(ORDER_CONTRIBUTION_QUERY, order_id)
+    return {
+        (row["model_id"], row["color"], row["size"], row["month"]):
+            (row["total_quantity"], row["total_value"], row["line_item_count"])
+        for row in rows
+    }
+
+
+def rollup_delta(before: Dict[RollupKey, RollupTotals], after: Dict[RollupKey, RollupTotals]) -> List[tuple]:
+    """Per-row changes (key + quantity, value, items, orders deltas), in lock order"""
+    delta = []
+    for key in sorted(set(before) | set(after), key=_sort_key):
+        old = before.get(key, (0, Decimal(0), 0))
+        new = after.get(key, (0, Decimal(0), 0))
+        orders = (1 if key in after else 0) - (1 if key in before else 0)
+        change = (new[0] - old[0], new[1] - old[1], new[2] - old[2], orders)
+        if any(change):
+            delta.append(key + change)
+    return delta
+
+
+async def apply_rollup_delta(conn, delta: List[tuple]):
+    """Apply rollup_delta output; must run inside the caller's transaction"""
+    if not delta:
+        return
+    await conn.execute(APPLY_DELTA_QUERY, *(list(column) for column in zip(*delta)))
+
+
+def build_rollup_query(
+    group_by: List[str],
+    model_id: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    month_from: Optional[date] = None,
+    month_to: Optional[date] = None,
+    sort_by: str = "total_quantity",
+    sort_order: str = "desc"
+) -> Tuple[str, list]:
+    """Build the /analytics/rollups query; LIMIT/OFFSET take the two params after the filters"""
+    conditions = ["r.line_item_count > 0"]
+    params = []
+
+    if model_id:
+        params.append(f"%{model_id}%")
+        conditions.append(f"r.model_id ILIKE ${len(params)}")
+    if color:
+        params.append(f"%{color}%")
+        conditions.append(f"LOWER(r.color) LIKE LOWER(${len(params)})")
+    if size:
+        params.append(size)
+        conditions.append(f"r.size = ${len(params)}")
+    if month_from:
+        params.append(month_from)
+        conditions.append(f"r.month >= ${len(params)}")
+    if month_to:
+        params.append(month_to)
+        conditions.append(f"r.month <= ${len(params)}")
+
+    dimensions = ", ".join(f"r.{dimension}" for dimension in group_by)
+    select_dimensions = dimensions + ", " if group_by else ""
+    group_clause = f"GROUP BY {dimensions}" if group_by else ""
+    tie_break = ", " + ", ".join(f"r.{dimension} NULLS FIRST" for dimension in group_by) if group_by else ""
+    # An order spans several rows, so order counts only add up per full key
+    order_count = "SUM(r.order_count)::bigint as order_count," if set(group_by) == set(ROLLUP_DIMENSIONS) else ""
+
+    query = f"""
+    SELECT {select_dimensions}
+           SUM(r.total_quantity)::bigint as total_quantity,
+           SUM(r.total_value) as total_value,
+           SUM(r.line_item_count)::bigint as line_item_count,
+           {order_count}
+           COUNT(*) OVER () as total_groups
+    FROM line_item_rollups r
+    WHERE {" AND ".join(conditions)}
+    {group_clause}
+    ORDER BY {sort_by} {sort_order.upper()}{tie_break}
+    LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
+    """
+    return query, params
+
+
+async def find_drift(conn) -> List[tuple]:
+    """Compare the rollups with a full recompute; returns (key, stored, actual) per mismatch"""
+    stored = {
+        (row["model_id"], row["color"], row["size"], row["month"]):
+            (row["total_quantity"], row["total_value"], row["line_item_count"], row["order_count"])
+        for row in await conn.fetch("""
+        SELECT * FROM line_item_rollups
+        WHERE line_item_count <> 0 OR order_count <> 0 OR total_quantity <> 0 OR total_value <> 0
+        """)
+    }
+    actual = {
+        (row["model_id"], row["color"], row["size"], row["month"]):
+            (row["total_quantity"], row["total_value"], row["line_item_count"], row["order_count"])
+        for row in await conn.fetch(RECOMPUTE_QUERY)
+    }
+    return [
+        (key, stored.get(key), actual.get(key))
+        for key in sorted(set(stored) | set(actual), key=_sort_key)
+        if stored.get(key) != actual.get(key)
+    ]
+
+
+async def rebuild_rollups(conn):
+    """Recompute line_item_rollups from scratch"""
+    async with conn.transaction():
+        # Blocks saves until the rebuild commits, so none of their deltas get lost
+        await conn.execute("LOCK TABLE line_item_rollups IN EXCLUSIVE MODE")
+        await conn.execute("DELETE FROM line_item_rollups")
+        await conn.execute(f"""
+        INSERT INTO line_item_rollups
+        (model_id, color, size, month, total_quantity, total_value, line_item_count, order_count)
+        {RECOMPUTE_QUERY}
+        """)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Line item rollup maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reconcile = subparsers.add_parser("reconcile", help="compare the rollups with a full recompute")
+    reconcile.add_argument("--fix", action="store_true", help="rebuild the rollups when they have drifted")
+    subparsers.add_parser("rebuild", help="recompute the rollups from line_items")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        if args.command == "rebuild":
+            await rebuild_rollups(conn)
+            print("🔧 Rebuilt line_item_rollups")
+            return
+
+        drift = await find_drift(conn)
+        if not drift:
+            print("✅ line_item_rollups matches a full recompute")
+            return
+        for key, stored, actual in drift[:50]:
+            print(f"❌ {key}: stored={stored} actual={actual}")
+        if len(drift) > 50:
+            print(f"   ... and {len(drift) - 50} more")
+        if args.fix:
+            await rebuild_rollups(conn)
+            print("🔧 Rebuilt line_item_rollups")
+        else:
+            sys.exit(1)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+# scheduler.py
+"""Email polling on the app's event loop.
+
+Runs are started at a fixed rate: run n is due at start + n * interval, so the
+time spent polling and processing doesn't push later runs back. Each run
+reads the window since the previous one ended (no gaps, no double reads,
+and a restarted scheduler catches up on the time it was stopped),
+queues the PDFs it finds for `workers` worker tasks and waits for them, so
+runs never overlap. A run that outlasts the interval skips the ticks it
+missed (counted as overruns) and the next run's window covers them.
+
+The first run reads initial_lookback_seconds back (default: one interval).
+A scheduler taking over from a failed leader doesn't know where that one
+stopped reading, so it is given a longer lookback; PDFs read twice are
+deduplicated by the extraction cache and the order upsert.
+
+stop() lets the current run finish and drains its queue, for up to
+drain_seconds, before cancelling what is left.
+"""
+import asyncio
+import contextvars
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+
+class EmailScheduler:
+    """Polls for order PDFs every interval_seconds and processes them with a worker pool.
+
+    fetch(start, end) is the blocking mailbox read (run in a thread) returning
+    PDF paths; handle(path) processes one and returns whether it succeeded.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[datetime, datetime], List[str]],
+        handle: Callable[[str], Awaitable[bool]],
+        interval_seconds: float = 300.0,
+        workers: int = 2,
+        max_queued: int = 100,
+        drain_seconds: float = 60.0,
+        initial_lookback_seconds: Optional[float] = None
+    ):
+        self.fetch = fetch
+        self.handle = handle
+        self.interval_seconds = interval_seconds
+        self.workers = workers
+        self.max_queued = max_queued
+        self.drain_seconds = drain_seconds
+        self.initial_lookback_seconds = initial_lookback_seconds or interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._workers: List[asyncio.Task] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.in_flight = 0
+        self.runs = 0
+        self.overruns = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.window_end: Optional[datetime] = None
+        self.last_run_started: Optional[datetime] = None
+        self.last_run_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.next_run_at: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the schedule on the running loop (no-op if already running)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._stopping = asyncio.Event()
+        # A fresh context: tasks started from a request must not inherit its trace
+        context = contextvars.Context()
+        self._workers = [asyncio.create_task(self._worker(), context=context.copy()) for _ in range(self.workers)]
+        self._task = asyncio.create_task(self._schedule(), context=context.copy())
+        print(f"📧 Email scheduler started - checking for new order PDFs every {self.interval_seconds:g}s "
+              f"with {self.workers} worker(s)")
+
+    async def stop(self):
+        """Finish the current run and drain its PDFs (up to drain_seconds), then stop"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=self.drain_seconds)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Email scheduler still busy after {self.drain_seconds:g}s; cancelling the rest")
+            self._task.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(self._task, *self._workers, return_exceptions=True)
+
+        while not self._queue.empty():
+            path = self._queue.get_nowait()
+            self.dropped += 1
+            print(f"⚠️  Email PDF not processed before shutdown: {path}")
+        self._task = None
+        self._workers = []
+        self.next_run_at = None
+        print("🛑 Email scheduler stopped")
+
+    async def _schedule(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tick = 0
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Error in email scheduler: {str(e)}")
+
+            # Fixed rate: the next tick still in the future, counting the ones missed
+            elapsed_ticks = int((loop.time() - started) // self.interval_seconds) + 1
+            if elapsed_ticks > tick + 1:
+                self.overruns += elapsed_ticks - tick - 1
+            tick = elapsed_ticks
+            delay = max(0.0, started + tick * self.interval_seconds - loop.time())
+            self.next_run_at = datetime.now() + timedelta(seconds=delay)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self):
+        """Read the window since the last run and process every PDF found in it"""
+        end_time = datetime.now()
+        start_time = self.window_end or end_time - timedelta(seconds=self.initial_lookback_seconds)
+        self.last_run_started = end_time
+        run_started = time.perf_counter()
+        self.runs += 1
+
+        print(f"🔍 Checking emails from {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        try:
+            pdf_paths = await asyncio.to_thread(self.fetch, start_time, end_time)
+        except Exception as e:
+            # Leave window_end alone so the next run reads this window again
+            self.last_error = str(e)
+            print(f"❌ Error in email scheduler: {str(e)}")
+            return
+        self.window_end = end_time
+        self.last_error = None
+
+        if pdf_paths:
+            print(f"📄 Found {len(pdf_paths)} order PDF(s) to process")
+            for pdf_path in pdf_paths:
+                await self._queue.put(pdf_path)
+            await self._queue.join()
+        else:
+            print(f"📭 No new order PDFs found since {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        self.last_run_seconds = round(time.perf_counter() - run_started, 3)
+
+    async def _worker(self):
+        while True:
+            pdf_path = await self._queue.get()
+            self.in_flight += 1
+            try:
+                ok = await self.handle(pdf_path)
+            except Exception as e:
+                print(f"❌ Error processing {pdf_path}: {str(e)}")
+                ok = False
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval_seconds,
+            "initial_lookback_seconds": self.initial_lookback_seconds,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "window_end": self.window_end.isoformat() if self.window_end else None,
+            "last_run_started": self.last_run_started.isoformat() if self.last_run_started else None,
+            "last_run_seconds": self.last_run_seconds,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None
+        }
@@ -1,22 +1,50 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-import asyncpg
-import tempfile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
 import uuid
 import asyncio
-import threading
 import time
-from datetime import datetime, timedelta
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Optional, List, Tuple
 from dotenv import load_dotenv
-from gemini import extract_pdf_data
+from gemini import GEMINI_MODEL, PROMPT_VERSION, extract_pdf_data
 from email_reader import get_order_pdf_files
+from database import DatabaseManager, PoolTimeoutError
+from ingest import LINE_ITEM_SAVE_MODE, LINE_ITEMS_PARTITIONED, expand_line_items, insert_line_items, reconcile_line_items
+from partitioning import line_items_partitioned
+from stats import record_order_change, read_stats
+from rollups import ROLLUP_DIMENSIONS, apply_rollup_delta, build_rollup_query, order_contribution, rollup_delta
+from export import EXPORT_FORMATS, build_export_query, export_schema, iter_batches, encode_csv, encode_parquet
+from jobs import Job, JobManager, JobQueueFull, JobStore
+from scheduler import EmailScheduler
+from leader import LeaderElection
+from extraction import ExtractionExecutor, ExtractionQueueFull
+from extraction_cache import ExtractionCache
+from uploads import MAX_UPLOAD_BYTES, UploadRejected, hash_file, store_upload
+from responses import FastJSONResponse, RawJSONResponse, NDJSON_MEDIA_TYPE, dumps, dumps_line
+import metrics
+import tracing
+from tracing import TracingMiddleware, log
+from metrics import DB_QUERY_SECONDS, PDF_SIZE_BYTES, PO_LINE_ITEMS, Counter, Gauge, MetricsMiddleware, observe_extraction
+from cache import (
+    INVALIDATION_CHANNEL, InvalidationListener, QueryCache, data_generation, etag_matches, filter_cache
+)
+from queries import (
+    ORDER_COUNT_STRATEGIES, build_order_filters, build_order_lookup, where_sql, build_orders_page_query,
+    build_orders_count_query, estimate_orders_count, fetch_matching_items,
+    decode_cursor, build_orders_keyset_query, order_cursor, keyset_page,
+    build_line_item_filters, build_line_items_page_query, build_line_items_keyset_query, line_item_cursor
+)
 
 load_dotenv()  # Load from current directory
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))  # Load from parent directory
 
-app = FastAPI(title="Purchase Order API", description="API for managing purchase orders")
+app = FastAPI(
+    title="Purchase Order API",
+    description="API for managing purchase orders",
+    default_response_class=FastJSONResponse
+)
 
 # Add CORS middleware for frontend
 app.add_middleware(
@@ -27,6 +55,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms for GET /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Trace id and root span per request (spans go to TRACE_FILE)
+app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """Shed load with 503 when every pooled connection stays busy past the acquire timeout"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse uploads whose declared size is over the limit before the body is read"""
+    limit = UPLOAD_REQUEST_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length")
+    if limit and request.method == "POST" and content_length and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(status_code=413, content={"detail": f"Upload larger than the {limit} byte limit"})
+    return await call_next(request)
+
+@app.exception_handler(UploadRejected)
+async def upload_rejected_handler(request: Request, exc: UploadRejected):
+    """Answer oversized or non-PDF uploads with their 413/415"""
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+@app.exception_handler(ExtractionQueueFull)
+async def extraction_queue_full_handler(request: Request, exc: ExtractionQueueFull):
+    """Reject new extractions with 429 while the extraction queue is full"""
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full_handler(request: Request, exc: JobQueueFull):
+    """Reject new upload jobs with 429 while the job queue is full"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(extraction_executor.retry_after())}
+    )
+
 # Get database configuration from environment variables
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "4000")
@@ -36,121 +103,243 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "parser")
 
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-# Global variable to control scheduler
-scheduler_running = False
+# Connection pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# One pool for the lifetime of the app, created in startup_event
+db_manager = DatabaseManager(
+    host=POSTGRES_HOST,
+    port=int(POSTGRES_PORT),
+    user=POSTGRES_USER,
+    password=POSTGRES_PASSWORD,
+    database=POSTGRES_DB,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+    command_timeout=DB_COMMAND_TIMEOUT,
+    statement_cache_size=DB_STATEMENT_CACHE_SIZE
+)
+
+# Response cache for GET /orders
+ORDERS_CACHE_ENABLED = os.getenv("ORDERS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ORDERS_CACHE_MAX_ENTRIES = int(os.getenv("ORDERS_CACHE_MAX_ENTRIES", "256"))
+ORDERS_CACHE_TTL_SECONDS = float(os.getenv("ORDERS_CACHE_TTL_SECONDS", "30"))
+
+orders_cache = QueryCache(
+    max_entries=ORDERS_CACHE_MAX_ENTRIES,
+    ttl_seconds=ORDERS_CACHE_TTL_SECONDS,
+    enabled=ORDERS_CACHE_ENABLED
+)
+
+# GET /orders totals (count=): a separate COUNT(*) (exact), COUNT(*) OVER ()
+# on the page query itself (window), or the planner's estimate once it reaches
+# the threshold (estimate). Totals are cached per filter set, across pages and
+# sorts, until the next write.
+ORDERS_COUNT_STRATEGY = os.getenv("ORDERS_COUNT_STRATEGY", "exact")
+ORDERS_COUNT_ESTIMATE_THRESHOLD = int(os.getenv("ORDERS_COUNT_ESTIMATE_THRESHOLD", "10000"))
+ORDERS_COUNT_CACHE_MAX_ENTRIES = int(os.getenv("ORDERS_COUNT_CACHE_MAX_ENTRIES", "1024"))
+ORDERS_COUNT_CACHE_TTL_SECONDS = float(os.getenv("ORDERS_COUNT_CACHE_TTL_SECONDS", "300"))
+if ORDERS_COUNT_STRATEGY not in ORDER_COUNT_STRATEGIES:
+    raise ValueError(f"ORDERS_COUNT_STRATEGY must be one of {ORDER_COUNT_STRATEGIES}, got {ORDERS_COUNT_STRATEGY!r}")
+
+count_cache = QueryCache(
+    max_entries=ORDERS_COUNT_CACHE_MAX_ENTRIES,
+    ttl_seconds=ORDERS_COUNT_CACHE_TTL_SECONDS,
+    enabled=ORDERS_CACHE_ENABLED
+)
+
+# Rows per server-side cursor fetch for streaming endpoints
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Batch uploads (/upload-pdfs): default and maximum concurrent extractions per request
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
+UPLOAD_BATCH_MAX_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_MAX_CONCURRENCY", "16"))
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "100"))
+
+# Declared request sizes past these get 413 before the body is read (PDF limit
+# plus room for the multipart framing); store_upload enforces the exact limit
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_REQUEST_LIMITS = {
+    "/upload-pdf": MAX_UPLOAD_BYTES + UPLOAD_MULTIPART_OVERHEAD,
+    "/upload-pdfs": (MAX_UPLOAD_BYTES + UPLOAD_MULTIPART_OVERHEAD) * UPLOAD_BATCH_MAX_FILES
+}
+
+# Blocking Gemini extraction runs in its own pool: EXTRACTION_WORKERS at once,
+# up to EXTRACTION_MAX_QUEUE more waiting, then 429
+EXTRACTION_EXECUTOR = os.getenv("EXTRACTION_EXECUTOR", "thread")
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+EXTRACTION_MAX_QUEUE = int(os.getenv("EXTRACTION_MAX_QUEUE", "16"))
+
+extraction_executor = ExtractionExecutor(
+    workers=EXTRACTION_WORKERS,
+    max_queue=EXTRACTION_MAX_QUEUE,
+    kind=EXTRACTION_EXECUTOR,
+    observer=observe_extraction
+)
+
+# Gemini output cached by PDF hash + prompt version + model
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+EXTRACTION_CACHE_TTL_DAYS = int(os.getenv("EXTRACTION_CACHE_TTL_DAYS", "90"))
+
+extraction_cache = ExtractionCache(
+    db_manager,
+    prompt_version=PROMPT_VERSION,
+    model_name=GEMINI_MODEL,
+    max_entries=EXTRACTION_CACHE_MAX_ENTRIES,
+    ttl_days=EXTRACTION_CACHE_TTL_DAYS,
+    enabled=EXTRACTION_CACHE_ENABLED
+)
+
+# Background upload jobs (POST /upload-pdf without wait=true)
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", str(EXTRACTION_WORKERS)))
+UPLOAD_JOB_MAX_QUEUED = int(os.getenv("UPLOAD_JOB_MAX_QUEUED", "100"))
+UPLOAD_JOB_RETAIN = int(os.getenv("UPLOAD_JOB_RETAIN", "500"))
+# Job status in Postgres, so GET /jobs/{id} works whichever worker answers it
+UPLOAD_JOB_STORE = os.getenv("UPLOAD_JOB_STORE", "true").lower() in ("1", "true", "yes")
+
+# Bumps this worker's cache generation when another worker commits a write
+invalidation_listener = InvalidationListener(DATABASE_URL)
+
+# Email polling runs on the app loop (see scheduler.py); PDFs it finds are
+# processed by EMAIL_SCHEDULER_WORKERS tasks through the shared pool
+EMAIL_POLL_INTERVAL_SECONDS = float(os.getenv("EMAIL_POLL_INTERVAL_SECONDS", "300"))
+EMAIL_SCHEDULER_WORKERS = int(os.getenv("EMAIL_SCHEDULER_WORKERS", "2"))
+EMAIL_SCHEDULER_MAX_QUEUED = int(os.getenv("EMAIL_SCHEDULER_MAX_QUEUED", "100"))
+EMAIL_SCHEDULER_DRAIN_SECONDS = float(os.getenv("EMAIL_SCHEDULER_DRAIN_SECONDS", "60"))
+
+# With several API workers only the holder of a Postgres advisory lock runs
+# the scheduler; another worker takes over when it exits
+SCHEDULER_LEADER_ELECTION = os.getenv("SCHEDULER_LEADER_ELECTION", "true").lower() in ("1", "true", "yes")
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "5002001"))
+SCHEDULER_LEADER_RETRY_SECONDS = float(os.getenv("SCHEDULER_LEADER_RETRY_SECONDS", "5"))
+# A new leader's first window reaches back past the interval the old leader may
+# not have read plus the time the lock takes to change hands (re-read PDFs are
+# deduplicated by the extraction cache and the order upsert)
+EMAIL_SCHEDULER_INITIAL_LOOKBACK_SECONDS = float(os.getenv(
+    "EMAIL_SCHEDULER_INITIAL_LOOKBACK_SECONDS",
+    str(EMAIL_POLL_INTERVAL_SECONDS + 2 * SCHEDULER_LEADER_RETRY_SECONDS)
+))
+
+async def process_email_pdf(pdf_path: str) -> bool:
+    """Process one PDF found by the email scheduler; returns whether it was saved"""
+    if not pdf_path or not os.path.exists(pdf_path):
+        print(f"⚠️  PDF file not found or invalid: {pdf_path}")
+        return False
+    
+    print(f"🔄 Processing PDF: {pdf_path}")
+    result = await process_pdf_from_path(pdf_path)
+    if result["success"]:
+        print(f"✅ Successfully processed: {pdf_path}")
+        if result["is_duplicate"]:
+            print(f"   📝 Updated existing order: {result['order_id']}")
+        else:
+            print(f"   🆕 Created new order: {result['order_id']}")
+        return True
+    print(f"❌ Failed to process {pdf_path}: {result['error']}")
+    return False
+
+email_scheduler = EmailScheduler(
+    get_order_pdf_files,
+    process_email_pdf,
+    interval_seconds=EMAIL_POLL_INTERVAL_SECONDS,
+    workers=EMAIL_SCHEDULER_WORKERS,
+    max_queued=EMAIL_SCHEDULER_MAX_QUEUED,
+    drain_seconds=EMAIL_SCHEDULER_DRAIN_SECONDS,
+    initial_lookback_seconds=EMAIL_SCHEDULER_INITIAL_LOOKBACK_SECONDS
+)
+
+async def start_email_scheduler():
+    email_scheduler.start()
+
+scheduler_leader = LeaderElection(
+    DATABASE_URL,
+    SCHEDULER_LOCK_KEY,
+    on_elected=start_email_scheduler,
+    on_demoted=email_scheduler.stop,
+    retry_seconds=SCHEDULER_LEADER_RETRY_SECONDS,
+    health_seconds=SCHEDULER_LEADER_RETRY_SECONDS
+)
+
+async def extract_cached(pdf_path: str, sha256: Optional[str], admit: bool = True) -> dict:
+    """Extract a PDF, reusing the cached extraction of identical content when there is one.
 
-def email_scheduler():
-    """Background scheduler that checks for new order PDFs every 5 minutes"""
-    global scheduler_running
-    scheduler_running = True
+    With admit=True the extraction queue limit (ExtractionQueueFull) is only
+    checked on a cache miss.
+    """
+    if sha256:
+        with tracing.span("extraction_cache.get") as lookup_span:
+            try:
+                cached = await extraction_cache.get(sha256)
+            except Exception as e:
+                # The cache is an optimisation; never fail an extraction over it
+                print(f"⚠️  Extraction cache lookup failed: {str(e)}")
+                cached = None
+            lookup_span.set(hit=cached is not None)
+        if cached is not None:
+            log.debug("Extraction cache hit for %s", sha256[:12])
+            return cached
     
-    print("📧 Email scheduler started - checking for new order PDFs every 5 minutes")
+    pdf_size = os.path.getsize(pdf_path)
+    PDF_SIZE_BYTES.observe(pdf_size)
+    with tracing.span("extract", bytes=pdf_size):
+        parsed_data = await extraction_executor.run(extract_pdf_data, pdf_path, admit=admit)
     
-    while scheduler_running:
+    if sha256:
         try:
-            # Calculate time range (last 5 minutes)
-            end_time = datetime.now()
-            start_time = end_time - timedelta(minutes=5)
-            
-            print(f"🔍 Checking emails from {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            # Get order PDF files from email reader
-            pdf_paths = get_order_pdf_files(start_time, end_time)
-            
-            if pdf_paths and len(pdf_paths) > 0:
-                print(f"📄 Found {len(pdf_paths)} order PDF(s) to process")
-                
-                # Process each PDF file
-                for pdf_path in pdf_paths:
-                    if pdf_path and os.path.exists(pdf_path):
-                        print(f"🔄 Processing PDF: {pdf_path}")
-                        
-                        # Create new event loop for this thread
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        
-                        try:
-                            # Process the PDF
-                            result = loop.run_until_complete(process_pdf_from_path(pdf_path))
-                            
-                            if result["success"]:
-                                print(f"✅ Successfully processed: {pdf_path}")
-                                if result["is_duplicate"]:
-                                    print(f"   📝 Updated existing order: {result['order_id']}")
-                                else:
-                                    print(f"   🆕 Created new order: {result['order_id']}")
-                            else:
-                                print(f"❌ Failed to process {pdf_path}: {result['error']}")
-                                
-                        except Exception as e:
-                            print(f"❌ Error processing {pdf_path}: {str(e)}")
-                        finally:
-                            loop.close()
-                    else:
-                        print(f"⚠️  PDF file not found or invalid: {pdf_path}")
-            else:
-                print("📭 No new order PDFs found in the last 5 minutes")
-                
+            await extraction_cache.put(sha256, parsed_data, pdf_size)
         except Exception as e:
-            print(f"❌ Error in email scheduler: {str(e)}")
-        
-        # Wait for 5 minutes before next check
-        print("⏰ Waiting 5 minutes before next check...")
-        time.sleep(300)  # 5 minutes = 300 seconds
-
-def start_email_scheduler():
-    """Start the email scheduler in a background thread"""
-    scheduler_thread = threading.Thread(target=email_scheduler, daemon=True)
-    scheduler_thread.start()
-    print("🚀 Email scheduler thread started")
-    return scheduler_thread
-
-def stop_email_scheduler():
-    """Stop the email scheduler"""
-    global scheduler_running
-    scheduler_running = False
-    print("🛑 Email scheduler stopped")
+            print(f"⚠️  Extraction cache store failed: {str(e)}")
+    return parsed_data
 
 async def process_pdf_from_path(pdf_path: str) -> dict:
     """Process a PDF file from local path and save to database"""
-    try:
-        print(f"DEBUG: Processing PDF from path: {pdf_path}")
+    # Email PDFs arrive outside any request, so each starts its own trace
+    with tracing.span("email_pdf", pdf_path=pdf_path):
+        try:
+            log.debug("Processing PDF from path: %s", pdf_path)
         
-        # Check if file exists
-        if not os.path.exists(pdf_path):
-            raise HTTPException(status_code=404, detail=f"PDF file not found: {pdf_path}")
+            # Check if file exists
+            if not os.path.exists(pdf_path):
+                raise HTTPException(status_code=404, detail=f"PDF file not found: {pdf_path}")
         
-        # Parse PDF using existing function
-        parsed_data = extract_pdf_data(pdf_path)
-        print(f"DEBUG: PDF parsed successfully from path")
+            # Parse PDF using existing function
+            # Background work: queue behind uploads rather than being turned away
+            sha256 = await asyncio.to_thread(hash_file, pdf_path)
+            parsed_data = await extract_cached(pdf_path, sha256, admit=False)
+            log.debug("PDF parsed successfully from path")
         
-        # Save to database using existing function
-        result = await save_to_database(parsed_data)
-        print(f"DEBUG: Saved to database successfully from path")
+            # Save to database using existing function
+            result = await save_to_database(parsed_data)
+            log.debug("Saved to database successfully from path")
         
-        return {
-            "success": True,
-            "message": "PDF processed successfully from email",
-            "order_id": result["order_id"],
-            "is_duplicate": result["is_duplicate"],
-            "parsed_data": parsed_data,
-            "pdf_path": pdf_path
-        }
+            return {
+                "success": True,
+                "message": "PDF processed successfully from email",
+                "order_id": result["order_id"],
+                "is_duplicate": result["is_duplicate"],
+                "parsed_data": parsed_data,
+                "pdf_path": pdf_path
+            }
         
-    except Exception as e:
-        print(f"ERROR: Failed to process PDF from path {pdf_path}: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e),
-            "pdf_path": pdf_path
-        }
+        except Exception as e:
+            log.error("Failed to process PDF from path %s: %s", pdf_path, e)
+            return {
+                "success": False,
+                "error": str(e),
+                "pdf_path": pdf_path
+            }
 
 async def save_to_database(parsed_data: dict) -> dict:
     """Save parsed PDF data to PostgreSQL database with UPSERT logic"""
-    conn = await asyncpg.connect(DATABASE_URL)
-    
-    try:
-        async with conn.transaction():
+    async with db_manager.acquire() as conn:
+        save_started = time.perf_counter()
+        async with tracing.span("db.save_transaction", purchase_order_id=parsed_data["purchase_order_id"]) as save_span, \
+                conn.transaction():
             # Parse order date
             order_date = None
             if parsed_data.get("order_date"):
@@ -159,6 +348,16 @@ async def save_to_database(parsed_data: dict) -> dict:
                 except:
                     order_date = None
             
+            # Serialise saves of the same PO so the previous state read below
+            # is still current when the upsert replaces it
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", parsed_data["purchase_order_id"])
+            previous = await conn.fetchrow(
+                "SELECT id, buyer_name, total_amount FROM orders WHERE purchase_order_id = $1",
+                parsed_data["purchase_order_id"]
+            )
+            # What the order adds to the rollups now, before its date or items change
+            rollups_before = await order_contribution(conn, previous["id"] if previous else None)
+            
             # UPSERT order using ON CONFLICT
             order_id = str(uuid.uuid4())
             upsert_order_query = """
@@ -177,7 +376,7 @@ async def save_to_database(parsed_data: dict) -> dict:
                 tax_amount = EXCLUDED.tax_amount,
                 total_amount = EXCLUDED.total_amount,
                 updated_at = CURRENT_TIMESTAMP
-            RETURNING id, (xmax = 0) AS is_new
+            RETURNING id, (xmax = 0) AS is_new, buyer_name, total_amount
             """
             
             result = await conn.fetchrow(
@@ -197,260 +396,564 @@ async def save_to_database(parsed_data: dict) -> dict:
             actual_order_id = result["id"]
             is_duplicate = not result["is_new"]
             
-            if is_duplicate:
-                await conn.execute("DELETE FROM line_items WHERE order_id = $1", actual_order_id)
+            # Expand sizes into rows in memory, then write them in one bulk operation
+            line_item_rows = expand_line_items(actual_order_id, parsed_data["line_items"], order_date)
             
-            line_item_query = """
-            INSERT INTO line_items 
-            (id, order_id, model_id, item_code, description, color, size, quantity, unit_price, amount, delivery_date)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            """
+            if is_duplicate and LINE_ITEM_SAVE_MODE == "reconcile":
+                # Only rows whose contents changed are written
+                item_changes = await reconcile_line_items(conn, actual_order_id, line_item_rows)
+            else:
+                items_removed = 0
+                if is_duplicate:
+                    status = await conn.execute("DELETE FROM line_items WHERE order_id = $1", actual_order_id)
+                    items_removed = int(status.split()[-1])
+                items_added = await insert_line_items(conn, line_item_rows)
+                item_changes = {"inserted": items_added, "updated": 0, "deleted": items_removed, "unchanged": 0}
+            save_span.set(line_item_rows=len(line_item_rows), **item_changes)
+            log.debug("Line items for %s: %s", parsed_data["purchase_order_id"], item_changes)
             
-            for item in parsed_data["line_items"]:
-                delivery_date = None
-                if item.get("delivery_date"):
-                    try:
-                        delivery_date = datetime.strptime(item["delivery_date"], "%Y-%m-%d").date()
-                    except:
-                        delivery_date = None
-                
-                # Handle sizes object - create separate line items for each size
-                if "sizes" in item and isinstance(item["sizes"], dict):
-                    for size, quantity in item["sizes"].items():
-                        if quantity > 0:  # Only create line items for sizes with quantity > 0
-                            # Calculate amount for this size
-                            unit_price = item.get("price", 0)
-                            amount = unit_price * quantity
-                            
-                            await conn.execute(
-                                line_item_query,
-                                str(uuid.uuid4()),
-                                actual_order_id,
-                                item.get("model_id", ""),
-                                item.get("item_code", ""),
-                                item.get("description", ""),
-                                item.get("color", ""),
-                                size,  # Individual size like "M"
-                                quantity,  # Individual quantity like 12
-                                unit_price,  # Unit price like 68.0
-                                amount,  # Calculated amount like 816.0
-                                delivery_date
-                            )
-                else:
-                    # Fallback for items without sizes object (shouldn't happen with current schema)
-                    await conn.execute(
-                        line_item_query,
-                        str(uuid.uuid4()),
-                        actual_order_id,
-                        item.get("model_id", ""),
-                        item.get("item_code", ""),
-                        item.get("description", ""),
-                        item.get("color", ""),
-                        item.get("size", ""),
-                        item.get("quantity", 0),
-                        item.get("unit_price", 0),
-                        item.get("amount", 0),
-                        delivery_date
-                    )
+            # Keep /analytics/rollups and the /stats summary in step, in the same transaction
+            await apply_rollup_delta(conn, rollup_delta(rollups_before, await order_contribution(conn, actual_order_id)))
+            await record_order_change(
+                conn,
+                parsed_data["purchase_order_id"],
+                (previous["buyer_name"], previous["total_amount"]) if previous else None,
+                (result["buyer_name"], result["total_amount"]),
+                item_changes["inserted"] - item_changes["deleted"]
+            )
             
-            return {
-                "order_id": str(actual_order_id),
-                "is_duplicate": is_duplicate,
-                "purchase_order_id": parsed_data["purchase_order_id"]
-            }
+            # Delivered on commit; tells every worker to drop its read caches
+            await conn.execute(f"NOTIFY {INVALIDATION_CHANNEL}")
+        
+        # Committed: invalidate this worker's caches straight away
+        data_generation.bump()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - save_started, "save_order")
+        PO_LINE_ITEMS.observe(len(line_item_rows))
+        
+        return {
+            "order_id": str(actual_order_id),
+            "is_duplicate": is_duplicate,
+            "purchase_order_id": parsed_data["purchase_order_id"],
+            "line_items": item_changes
+        }
+
+def upload_response(result: dict, parsed_data: dict) -> dict:
+    """Response body for a processed upload (the sync reply, or a finished job's result)"""
+    message = "PDF uploaded and processed successfully"
+    if result["is_duplicate"]:
+        message = f"Duplicate order '{result['purchase_order_id']}' updated successfully"
+    
+    return {
+        "success": True,
+        "message": message,
+        "order_id": result["order_id"],
+        "is_duplicate": result["is_duplicate"],
+        "line_items": result["line_items"],
+        "parsed_data": parsed_data
+    }
+
+def discard_upload(job: Job):
+    """Remove the stored PDF of a job that will never run"""
+    try:
+        os.unlink(job.path)
+    except:
+        pass
+
+async def run_upload_job(job: Job) -> dict:
+    """Extract and save a queued upload, reporting each stage on the job"""
+    # Runs in the submitting request's context, so this joins its trace
+    with tracing.span("upload_job", job_id=job.id, queued_ms=round((time.time() - job.created_at) * 1000, 3)):
+        try:
+            job.advance("extracting")
+            # Admitted when the job was queued
+            parsed_data = await extract_cached(job.path, job.sha256, admit=False)
             
-    finally:
-        await conn.close()
+            job.advance("saving")
+            result = await save_to_database(parsed_data)
+            return upload_response(result, parsed_data)
+        finally:
+            discard_upload(job)
+
+upload_jobs = JobManager(
+    run_upload_job,
+    workers=UPLOAD_JOB_WORKERS,
+    max_queued=UPLOAD_JOB_MAX_QUEUED,
+    max_retained=UPLOAD_JOB_RETAIN,
+    discard=discard_upload,
+    store=JobStore(db_manager, max_retained=UPLOAD_JOB_RETAIN) if UPLOAD_JOB_STORE else None
+)
 
 @app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Upload and parse a PDF purchase order"""
+async def upload_pdf(file: UploadFile = File(...), wait: bool = Query(False)):
+    """Upload a PDF purchase order.
+
+    Returns 202 with a job id straight away; follow progress via GET /jobs/{id}
+    or GET /jobs/{id}/events. With wait=true the PDF is processed within the
+    request and the result returned directly.
+    """
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+    # Turn the upload away before storing it when it would be rejected anyway
+    # (wait=true checks extraction capacity only on an extraction cache miss,
+    # which needs the stored file's hash, see extract_cached)
+    if not wait and upload_jobs.full:
+        raise JobQueueFull(f"{UPLOAD_JOB_MAX_QUEUED} upload jobs already queued, retry later")
+    
+    upload = await store_upload(file)
+    
+    if not wait:
         try:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file.flush()
-            
-            try:
-                print(f"DEBUG: Parsing PDF with Gemini...")
-                parsed_data = extract_pdf_data(temp_file.name)
-                print(f"DEBUG: PDF parsed successfully")
-            except Exception as e:
-                print(f"ERROR: Failed to parse PDF: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
-            
-            try:
-                print(f"DEBUG: Saving to database...")
-                result = await save_to_database(parsed_data)
-                print(f"DEBUG: Saved to database successfully")
-            except Exception as e:
-                print(f"ERROR: Failed to save to database: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Failed to save to database: {str(e)}")
-            
-            message = "PDF uploaded and processed successfully"
-            if result["is_duplicate"]:
-                message = f"Duplicate order '{result['purchase_order_id']}' updated successfully"
-            
-            return {
-                "success": True,
-                "message": message,
-                "order_id": result["order_id"],
-                "is_duplicate": result["is_duplicate"],
-                "parsed_data": parsed_data
-            }
+            job = await upload_jobs.submit(upload.filename, upload.path, upload.sha256)
+        except JobQueueFull:
+            upload.discard()
+            raise
+        return FastJSONResponse(
+            status_code=202,
+            content={
+                "job_id": job.id,
+                "stage": job.stage,
+                "sha256": upload.sha256,
+                "size_bytes": upload.size,
+                "status_url": f"/jobs/{job.id}",
+                "events_url": f"/jobs/{job.id}/events"
+            },
+            headers={"Location": f"/jobs/{job.id}"}
+        )
+    
+    try:
+        try:
+            log.debug("Parsing PDF with Gemini...")
+            # A cached PDF is answered even while the extraction queue is full
+            parsed_data = await extract_cached(upload.path, upload.sha256)
+            log.debug("PDF parsed successfully")
+        except ExtractionQueueFull:
+            raise
+        except Exception as e:
+            log.error("Failed to parse PDF: %s", e)
+            raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
+        
+        try:
+            log.debug("Saving to database...")
+            result = await save_to_database(parsed_data)
+            log.debug("Saved to database successfully")
+        except Exception as e:
+            log.error("Failed to save to database: %s", e)
+            raise HTTPException(status_code=500, detail=f"Failed to save to database: {str(e)}")
+        
+        return FastJSONResponse(content=upload_response(result, parsed_data))
+        
+    finally:
+        upload.discard()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Current stage of an upload job, with its result once done"""
+    snapshot = await upload_jobs.lookup(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(content=snapshot)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of an upload job's stage changes; ends when the job finishes"""
+    job = upload_jobs.get(job_id)
+    if job is not None:
+        events = job.events()
+    elif upload_jobs.store is not None and await upload_jobs.store.load(job_id) is not None:
+        # Accepted by another worker: follow its row instead
+        events = upload_jobs.store.events(job_id)
+    else:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def generate():
+        async for snapshot in events:
+            if snapshot is None:
+                yield b": keepalive\n\n"
+            else:
+                yield b"event: stage\ndata: " + dumps(snapshot) + b"\n\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def process_batch_file(file: UploadFile, semaphore: asyncio.Semaphore) -> dict:
+    """Extract and save one file of a batch upload; failures are reported, never raised"""
+    result = {"filename": file.filename}
+    if not file.filename or not file.filename.lower().endswith('.pdf'):
+        result.update(status="error", stage="validate", error="Only PDF files are allowed")
+        return result
+    
+    stage = "upload"
+    upload = None
+    try:
+        async with semaphore:
+            upload = await store_upload(file)
+            result["sha256"] = upload.sha256
             
-        finally:
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
+            stage = "extract"
+            started = time.perf_counter()
+            parsed_data = await extract_cached(upload.path, upload.sha256)
+            result["extract_seconds"] = round(time.perf_counter() - started, 3)
+        
+        # Saved outside the semaphore so the next extraction starts while this one writes
+        stage = "save"
+        started = time.perf_counter()
+        saved = await save_to_database(parsed_data)
+        result["save_seconds"] = round(time.perf_counter() - started, 3)
+        
+        result.update(
+            status="duplicate" if saved["is_duplicate"] else "success",
+            order_id=saved["order_id"],
+            purchase_order_id=saved["purchase_order_id"],
+            line_items=saved["line_items"]
+        )
+    except Exception as e:
+        log.error("Batch upload of %s failed during %s: %s", file.filename, stage, e)
+        result.update(status="error", stage=stage, error=str(e))
+    finally:
+        if upload:
+            upload.discard()
+    return result
+
+@app.post("/upload-pdfs")
+async def upload_pdfs(
+    files: List[UploadFile] = File(...),
+    concurrency: int = Query(UPLOAD_BATCH_CONCURRENCY, ge=1, le=UPLOAD_BATCH_MAX_CONCURRENCY)
+):
+    """Upload many PDF purchase orders; extracts up to `concurrency` at a time and saves each as it finishes"""
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {UPLOAD_BATCH_MAX_FILES} files per batch")
+    
+    # Files that find the queue full later are reported as failed
+    extraction_executor.check_capacity()
+    
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(process_batch_file(file, semaphore) for file in files))
+    elapsed = time.perf_counter() - started
+    
+    statuses = [result["status"] for result in results]
+    return FastJSONResponse(content={
+        "success": "error" not in statuses,
+        "summary": {
+            "files": len(results),
+            "created": statuses.count("success"),
+            "duplicates": statuses.count("duplicate"),
+            "failed": statuses.count("error"),
+            "concurrency": concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "extract_seconds_total": round(sum(result.get("extract_seconds", 0) for result in results), 3),
+            "save_seconds_total": round(sum(result.get("save_seconds", 0) for result in results), 3),
+            "files_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else None
+        },
+        "results": results
+    })
 
 @app.get("/orders")
 async def get_orders(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
     search: Optional[str] = Query(None),
+    search_mode: str = Query("contains", pattern="^(contains|ranked)$"),
     model_id: Optional[str] = Query(None),
     color: Optional[str] = Query(None),
     size: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
     sort_by: str = Query("order_date", pattern="^(order_date|total_amount|item_count)$"),
-    sort_order: str = Query("desc", pattern="^(asc|desc)$")
+    sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+    paginate: str = Query("page", pattern="^(page|cursor)$"),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False),
+    count: str = Query(ORDERS_COUNT_STRATEGY, pattern="^(exact|window|estimate)$")
 ):
-    """Get orders with filtering and pagination"""
-    conn = await asyncpg.connect(DATABASE_URL)
-    
-    try:
-        # Build WHERE clause
-        where_conditions = []
-        params = []
-        param_count = 0
-        
-        if search:
-            param_count += 1
-            where_conditions.append(f"(o.purchase_order_id ILIKE ${param_count} OR o.buyer_name ILIKE ${param_count} OR o.supplier_name ILIKE ${param_count})")
-            params.append(f"%{search}%")
-        
-        if model_id:
-            param_count += 1
-            where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND li.model_id ILIKE ${param_count})")
-            params.append(f"%{model_id}%")
-            
-        if color:
-            param_count += 1
-            where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND LOWER(li.color) LIKE LOWER(${param_count}))")
-            params.append(f"%{color}%")
-            
-        if size:
-            param_count += 1
-            where_conditions.append(f"EXISTS (SELECT 1 FROM line_items li WHERE li.order_id = o.id AND li.size = ${param_count})")
-            params.append(size)
-        
-        where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    """Get orders with filtering and pagination (page/limit, or keyset cursors with paginate=cursor).
+
+    count picks how the total is computed; total_is_estimate is true when it
+    is the planner's estimate (count=estimate on large result sets).
+    """
+    # Normalise so equivalent requests share a cache entry
+    search, model_id, color, size, cursor = (
+        (value.strip() or None) if value else None
+        for value in (search, model_id, color, size, cursor)
+    )
+    if not search:
+        search_mode = "contains"
+    ranked = bool(search) and search_mode == "ranked"
+    use_cursor = bool(cursor) or paginate == "cursor"
+
+    if use_cursor:
+        if ranked:
+            raise HTTPException(status_code=400, detail="search_mode=ranked is not supported with cursor pagination")
+        key = ("cursor", limit, search, search_mode, model_id, color, size, date_from, date_to, sort_by, sort_order, cursor, include_total, count)
+        load = lambda: get_orders_by_cursor(
+            limit, search, model_id, color, size, sort_by, sort_order, cursor, include_total, date_from, date_to, count
+        )
+    else:
+        key = ("page", page, limit, search, search_mode, model_id, color, size, date_from, date_to, sort_by, sort_order, count)
+        load = lambda: get_orders_by_page(
+            page, limit, search, search_mode, model_id, color, size, sort_by, sort_order, date_from, date_to, count
+        )
+
+    # Cache the serialised body so hits skip JSON encoding entirely
+    async def loader() -> bytes:
+        return dumps(await load())
+
+    return RawJSONResponse(await orders_cache.get_or_load(key, loader))
+
+def count_cache_key(strategy: str, where_clause: str, params: list) -> tuple:
+    return (strategy, where_clause, tuple(params))
+
+async def count_orders(where_clause: str, params: list, strategy: str) -> Tuple[int, bool]:
+    """(total, is_estimate) for the filtered orders, from count_cache when it has them.
+
+    strategy=estimate returns the planner's estimate when it reaches
+    ORDERS_COUNT_ESTIMATE_THRESHOLD and counts exactly below it. Uses its own
+    connection: concurrent requests for the same filters share one count.
+    """
+    estimate = strategy == "estimate"
+
+    async def load() -> Tuple[int, bool]:
+        async with db_manager.acquire() as conn:
+            if estimate:
+                with DB_QUERY_SECONDS.time("orders_count_estimate"):
+                    estimated = await estimate_orders_count(conn, where_clause, params)
+                if estimated >= ORDERS_COUNT_ESTIMATE_THRESHOLD:
+                    return estimated, True
+            with DB_QUERY_SECONDS.time("orders_count"):
+                return await conn.fetchval(build_orders_count_query(where_clause), *params), False
+
+    key = count_cache_key("estimate" if estimate else "exact", where_clause, params)
+    return await count_cache.get_or_load(key, load)
+
+def build_order_entries(orders: list, items_by_order: dict) -> List[dict]:
+    """Shape order rows for the listing responses, embedding their matching items"""
+    orders_with_items = []
+    for order in orders:
+        matching_items = items_by_order[order["id"]]
         
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM orders o {where_clause}"
-        total = await conn.fetchval(count_query, *params)
+        order_dict = dict(order)
+        order_dict.pop("sort_key", None)
+        order_dict.pop("sort_created", None)
+        order_dict.pop("total_count", None)
+        order_dict["item_match_count"] = len(matching_items)
+        order_dict["items"] = matching_items
         
-        # Use subquery approach for cleaner sorting
-        if sort_by == 'item_count':
-            # For item_count sorting, we need the COUNT in a subquery
-            orders_query = f"""
-            SELECT o.*, COALESCE(item_counts.item_count, 0) as item_count
-            FROM orders o
-            LEFT JOIN (
-                SELECT li.order_id, COUNT(li.id) as item_count
-                FROM line_items li
-                GROUP BY li.order_id
-            ) item_counts ON o.id = item_counts.order_id
-            {where_clause.replace('li.', 'item_counts.') if where_clause and 'li.' in where_clause else where_clause}
-            ORDER BY item_count {sort_order.upper()}, o.created_at DESC
-            LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
-            """
-        else:
-            # For simple column sorting
-            sort_column_map = {
-                'order_date': 'o.order_date',
-                'total_amount': 'o.total_amount'
-            }
-            sort_column = sort_column_map.get(sort_by, 'o.order_date')
-            
-            orders_query = f"""
-            SELECT o.*, COUNT(li.id) as item_count
-            FROM orders o
-            LEFT JOIN line_items li ON o.id = li.order_id
-            {where_clause}
-            GROUP BY o.id
-            ORDER BY {sort_column} {sort_order.upper()}, o.created_at DESC
-            LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
-            """
+        orders_with_items.append(order_dict)
+    return orders_with_items
+
+async def get_orders_by_page(
+    page: int,
+    limit: int,
+    search: Optional[str],
+    search_mode: str,
+    model_id: Optional[str],
+    color: Optional[str],
+    size: Optional[str],
+    sort_by: str,
+    sort_order: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    count: str = "exact"
+) -> dict:
+    """Page/limit order listing with its total (see count_orders for the count strategies)"""
+    ranked = bool(search) and search_mode == "ranked"
+
+    # Build WHERE clause
+    where_conditions, params = build_order_filters(search, model_id, color, size, search_mode, date_from, date_to)
+    where_clause = where_sql(where_conditions)
+    filter_params = list(params)
+
+    # Totals for this filter set may be cached from another page or sort
+    if count == "window":
+        count_key = count_cache_key("exact", where_clause, params)
+        count_generation = data_generation.value
+        counted = count_cache.get(count_key)
+    else:
+        counted = await count_orders(where_clause, params, count)
 
+    orders_query = build_orders_page_query(where_clause, sort_by, sort_order, len(params), ranked, with_total=counted is None)
+
+    async with db_manager.acquire() as conn:
         # Get orders with pagination
         offset = (page - 1) * limit
         params.extend([limit, offset])
         
-        print(f"DEBUG: Sort by: {sort_by}, Order: {sort_order}")
-        print(f"DEBUG: Query: {orders_query}")
-        
-        orders = await conn.fetch(orders_query, *params)
+        with DB_QUERY_SECONDS.time("orders_page"):
+            orders = await conn.fetch(orders_query, *params)
         
-        # Get matching line items for each order
-        orders_with_items = []
-        for order in orders:
-            # Build line items filter conditions
-            item_conditions = []
-            item_params = [order["id"]]  # order_id is always first param
-            item_param_count = 1
-            
-            if model_id:
-                item_param_count += 1
-                item_conditions.append(f"li.model_id ILIKE ${item_param_count}")
-                item_params.append(f"%{model_id}%")
-                
-            if color:
-                item_param_count += 1
-                item_conditions.append(f"LOWER(li.color) LIKE LOWER(${item_param_count})")
-                item_params.append(f"%{color}%")
-                
-            if size:
-                item_param_count += 1
-                item_conditions.append(f"li.size ILIKE ${item_param_count}")
-                item_params.append(f"%{size}%")
-            
-            # Get matching line items
-            item_where = " AND ".join(item_conditions) if item_conditions else "1=1"
-            items_query = f"""
-            SELECT li.*, 
-                   CASE WHEN ({item_where}) THEN true ELSE false END as is_match
-            FROM line_items li 
-            WHERE li.order_id = $1
-            ORDER BY is_match DESC, li.created_at
-            """
-            
-            items = await conn.fetch(items_query, *item_params)
-            
-            # Separate matching and non-matching items
-            matching_items = [dict(item) for item in items if item["is_match"]]
-            item_match_count = len(matching_items)
-            
-            order_dict = dict(order)
-            order_dict["item_match_count"] = item_match_count
-            order_dict["items"] = matching_items
-            
-            orders_with_items.append(order_dict)
+        # Get matching line items for the whole page in one query
+        with DB_QUERY_SECONDS.time("orders_items"):
+            items_by_order = await fetch_matching_items(
+                conn, [order["id"] for order in orders], model_id, color, size, date_from, date_to
+            )
         
-        return {
+        orders_with_items = build_order_entries(orders, items_by_order)
+
+    if counted is None:
+        if orders:
+            counted = (orders[0]["total_count"], False)
+            count_cache.put(count_key, count_generation, counted)
+        elif page == 1:
+            counted = (0, False)
+        else:
+            # Past the last page the window has no rows to report the total on
+            counted = await count_orders(where_clause, filter_params, "exact")
+    total, estimated = counted
+    
+    return {
+        "orders": orders_with_items,
+        "total": total,
+        "total_is_estimate": estimated,
+        "page": page,
+        "limit": limit,
+        "total_pages": (total + limit - 1) // limit
+    }
+
+def parse_cursor_param(cursor: Optional[str], expected: dict) -> Optional[dict]:
+    """Decode a cursor query param, rejecting tokens minted for a different listing"""
+    if not cursor:
+        return None
+    try:
+        decoded = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for key, value in expected.items():
+        if decoded.get(key) != value:
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sort; start again without a cursor")
+    return decoded
+
+async def get_orders_by_cursor(
+    limit: int,
+    search: Optional[str],
+    model_id: Optional[str],
+    color: Optional[str],
+    size: Optional[str],
+    sort_by: str,
+    sort_order: str,
+    cursor: Optional[str],
+    include_total: bool,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    count: str = "exact"
+) -> dict:
+    """Keyset-paginated order listing; skips counting unless include_total is set.
+
+    count=window counts exactly here: a keyset page only sees the rows past its cursor.
+    """
+    decoded = parse_cursor_param(cursor, {"s": sort_by, "o": sort_order})
+    where_conditions, params = build_order_filters(search, model_id, color, size, date_from=date_from, date_to=date_to)
+
+    total = estimated = None
+    if include_total:
+        total, estimated = await count_orders(where_sql(where_conditions), params, "estimate" if count == "estimate" else "exact")
+
+    async with db_manager.acquire() as conn:
+        try:
+            orders_query, keyset_params = build_orders_keyset_query(where_conditions, sort_by, sort_order, decoded, len(params))
+        except (ValueError, KeyError, ArithmeticError):
+            raise HTTPException(status_code=400, detail="Malformed cursor")
+        params.extend(keyset_params)
+        params.append(limit + 1)
+
+        with DB_QUERY_SECONDS.time("orders_keyset"):
+            rows = await conn.fetch(orders_query, *params)
+        orders, next_cursor, prev_cursor = keyset_page(
+            rows, limit, decoded,
+            lambda row, direction: order_cursor(row, sort_by, sort_order, direction)
+        )
+
+        with DB_QUERY_SECONDS.time("orders_items"):
+            items_by_order = await fetch_matching_items(
+                conn, [order["id"] for order in orders], model_id, color, size, date_from, date_to
+            )
+
+        orders_with_items = build_order_entries(orders, items_by_order)
+
+        response = {
             "orders": orders_with_items,
-            "total": total,
-            "page": page,
             "limit": limit,
-            "total_pages": (total + limit - 1) // limit
+            "pagination": "cursor",
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor
         }
-        
-    finally:
-        await conn.close()
+        if include_total:
+            response["total"] = total
+            response["total_is_estimate"] = estimated
+            response["total_pages"] = (total + limit - 1) // limit
+        return response
+
+@app.get("/orders/stream")
+async def stream_orders(
+    search: Optional[str] = Query(None),
+    search_mode: str = Query("contains", pattern="^(contains|ranked)$"),
+    model_id: Optional[str] = Query(None),
+    color: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    sort_by: str = Query("order_date", pattern="^(order_date|total_amount|item_count)$"),
+    sort_order: str = Query("desc", pattern="^(asc|desc)$")
+):
+    """Stream every matching order as NDJSON, one order (with its matching items) per line"""
+    ranked = bool(search) and search_mode == "ranked"
+    where_conditions, params = build_order_filters(search, model_id, color, size, search_mode, date_from, date_to)
+    # LIMIT NULL = no limit; the server-side cursor bounds how much is in memory
+    orders_query = build_orders_page_query(where_sql(where_conditions), sort_by, sort_order, len(params), ranked)
+    params.extend([None, 0])
+
+    async def generate():
+        async with db_manager.acquire() as conn:
+            async with conn.transaction():
+                cur = await conn.cursor(orders_query, *params)
+                while True:
+                    orders = await cur.fetch(STREAM_BATCH_SIZE)
+                    if not orders:
+                        break
+                    items_by_order = await fetch_matching_items(
+                        conn, [order["id"] for order in orders], model_id, color, size, date_from, date_to
+                    )
+                    yield b"".join(dumps_line(entry) for entry in build_order_entries(orders, items_by_order))
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    search: Optional[str] = Query(None),
+    search_mode: str = Query("contains", pattern="^(contains|ranked)$"),
+    model_id: Optional[str] = Query(None),
+    color: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None)
+):
+    """Stream all matching orders joined with their line items as CSV or Parquet"""
+    query, params = build_export_query(search, model_id, color, size, search_mode, date_from, date_to)
+    if format == "parquet":
+        # Fail before the response starts rather than mid-stream
+        try:
+            export_schema()
+        except ImportError as e:
+            raise HTTPException(status_code=503, detail=f"Parquet export is unavailable: {str(e)}")
+
+    async def generate():
+        encode = encode_parquet if format == "parquet" else encode_csv
+        async with db_manager.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cur = await conn.cursor(query, *params)
+                async for chunk in encode(iter_batches(cur)):
+                    yield chunk
+
+    filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.get("/orders/{order_id}")
 async def get_order(
@@ -459,60 +962,82 @@ async def get_order(
     limit: int = Query(10, ge=1, le=50),
     model_id: Optional[str] = Query(None),
     color: Optional[str] = Query(None),
-    size: Optional[str] = Query(None)
+    size: Optional[str] = Query(None),
+    paginate: str = Query("page", pattern="^(page|cursor)$"),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False)
 ):
     """Get order details with line items (with filtering and pagination)"""
-    conn = await asyncpg.connect(DATABASE_URL)
-    
-    try:
+    use_cursor = bool(cursor) or paginate == "cursor"
+    decoded = parse_cursor_param(cursor, {"s": "line_items"})
+
+    async with db_manager.acquire() as conn:
         # Get order
-        order_query = "SELECT * FROM orders WHERE id::text = $1 OR purchase_order_id = $1"
-        order = await conn.fetchrow(order_query, order_id)
+        order_query, order_params = build_order_lookup(order_id)
+        with DB_QUERY_SECONDS.time("order_lookup"):
+            order = await conn.fetchrow(order_query, *order_params)
         
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        # Build line items filter conditions
-        where_conditions = ["li.order_id = $1"]
-        params = [order["id"]]
-        param_count = 1
-        
-        if model_id:
-            param_count += 1
-            where_conditions.append(f"li.model_id ILIKE ${param_count}")
-            params.append(f"%{model_id}%")
-            
-        if color:
-            param_count += 1
-            where_conditions.append(f"LOWER(li.color) LIKE LOWER(${param_count})")
-            params.append(f"%{color}%")
-            
-        if size:
-            param_count += 1
-            where_conditions.append(f"li.size = ${param_count}")
-            params.append(size)
+        where_conditions, params = build_line_item_filters(order, model_id, color, size)
+        param_count = len(params)
         
         where_clause = " AND ".join(where_conditions)
         
+        if use_cursor:
+            total_items = None
+            if include_total:
+                with DB_QUERY_SECONDS.time("order_items_count"):
+                    total_items = await conn.fetchval(f"SELECT COUNT(*) FROM line_items li WHERE {where_clause}", *params)
+
+            try:
+                items_query, keyset_params = build_line_items_keyset_query(where_conditions, decoded, param_count)
+            except (ValueError, KeyError):
+                raise HTTPException(status_code=400, detail="Malformed cursor")
+            params.extend(keyset_params)
+            params.append(limit + 1)
+
+            with DB_QUERY_SECONDS.time("order_items_keyset"):
+                rows = await conn.fetch(items_query, *params)
+            items, next_cursor, prev_cursor = keyset_page(rows, limit, decoded, line_item_cursor)
+
+            line_items = []
+            for item in items:
+                item_dict = dict(item)
+                item_dict.pop("sort_created", None)
+                line_items.append(item_dict)
+
+            pagination = {
+                "mode": "cursor",
+                "limit": limit,
+                "next_cursor": next_cursor,
+                "prev_cursor": prev_cursor
+            }
+            if include_total:
+                pagination["total"] = total_items
+                pagination["total_pages"] = (total_items + limit - 1) // limit
+
+            return FastJSONResponse(content={
+                "order": dict(order),
+                "line_items": line_items,
+                "pagination": pagination
+            })
+        
         # Get total count of matching line items
         count_query = f"SELECT COUNT(*) FROM line_items li WHERE {where_clause}"
-        total_items = await conn.fetchval(count_query, *params)
+        with DB_QUERY_SECONDS.time("order_items_count"):
+            total_items = await conn.fetchval(count_query, *params)
         
         # Get paginated line items
         offset = (page - 1) * limit
-        param_count += 1
-        param_count += 1
-        items_query = f"""
-        SELECT li.* FROM line_items li 
-        WHERE {where_clause}
-        ORDER BY li.created_at
-        LIMIT ${param_count - 1} OFFSET ${param_count}
-        """
+        items_query = build_line_items_page_query(where_clause, param_count)
         params.extend([limit, offset])
         
-        items = await conn.fetch(items_query, *params)
+        with DB_QUERY_SECONDS.time("order_items_page"):
+            items = await conn.fetch(items_query, *params)
         
-        return {
+        return FastJSONResponse(content={
             "order": dict(order),
             "line_items": [dict(item) for item in items],
             "pagination": {
@@ -521,92 +1046,277 @@ async def get_order(
                 "total": total_items,
                 "total_pages": (total_items + limit - 1) // limit
             }
-        }
-        
-    finally:
-        await conn.close()
+        })
 
-@app.get("/filters")
-async def get_filters():
-    """Get available filter options"""
-    conn = await asyncpg.connect(DATABASE_URL)
-    
-    try:
-        # Get unique model IDs
-        models = await conn.fetch("SELECT DISTINCT model_id FROM line_items WHERE model_id IS NOT NULL AND model_id != '' ORDER BY model_id")
-        
-        # Get unique colors
-        colors = await conn.fetch("SELECT DISTINCT color FROM line_items WHERE color IS NOT NULL AND color != '' ORDER BY color")
-        
-        # Get unique sizes
-        sizes = await conn.fetch("SELECT DISTINCT size FROM line_items WHERE size IS NOT NULL AND size != '' ORDER BY size")
+async def load_filters() -> dict:
+    """Query the distinct filter values from line_items"""
+    async with db_manager.acquire() as conn:
+        with DB_QUERY_SECONDS.time("filters"):
+            # Get unique model IDs
+            models = await conn.fetch("SELECT DISTINCT model_id FROM line_items WHERE model_id IS NOT NULL AND model_id != '' ORDER BY model_id")
+
+            # Get unique colors
+            colors = await conn.fetch("SELECT DISTINCT color FROM line_items WHERE color IS NOT NULL AND color != '' ORDER BY color")
+
+            # Get unique sizes
+            sizes = await conn.fetch("SELECT DISTINCT size FROM line_items WHERE size IS NOT NULL AND size != '' ORDER BY size")
         
         return {
             "model_ids": [row["model_id"] for row in models],
             "colors": [row["color"] for row in colors],
             "sizes": [row["size"] for row in sizes]
         }
-        
-    finally:
-        await conn.close()
+
+@app.get("/filters")
+async def get_filters(request: Request):
+    """Get available filter options (cached until the next write, with ETag revalidation)"""
+    payload, etag = await filter_cache.get(load_filters)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return FastJSONResponse(content=payload, headers=headers)
 
 @app.get("/stats")
 async def get_stats():
     """Get dashboard statistics"""
-    conn = await asyncpg.connect(DATABASE_URL)
-    
+    async with db_manager.acquire() as conn:
+        # Sum of the summary slots maintained by save_to_database
+        with DB_QUERY_SECONDS.time("stats"):
+            stats = await read_stats(conn)
+    return FastJSONResponse(content=stats)
+
+def parse_month(value: Optional[str], name: str):
+    if not value:
+        return None
     try:
-        stats = await conn.fetchrow("""
-        SELECT 
-            COUNT(o.id) as total_orders,
-            (SELECT COUNT(id) FROM line_items) as total_items,
-            SUM(o.total_amount) as total_value,
-            COUNT(DISTINCT o.buyer_name) as total_buyers
-        FROM orders o
-        """)
-        
-        return dict(stats)
-        
-    finally:
-        await conn.close()
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be formatted as YYYY-MM")
+
+@app.get("/analytics/rollups")
+async def get_rollups(
+    group_by: str = Query(",".join(ROLLUP_DIMENSIONS)),
+    model_id: Optional[str] = Query(None),
+    color: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    month_from: Optional[str] = Query(None, description="YYYY-MM"),
+    month_to: Optional[str] = Query(None, description="YYYY-MM"),
+    sort_by: str = Query("total_quantity", pattern="^(total_quantity|total_value|line_item_count)$"),
+    sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Ordered quantity and value per model/color/size/month from the pre-aggregated rollups.
+
+    group_by is a comma-separated subset of model_id,color,size,month; the
+    other dimensions are summed over.
+    """
+    dimensions = [dimension.strip() for dimension in group_by.split(",") if dimension.strip()]
+    unknown = [dimension for dimension in dimensions if dimension not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by dimensions: {', '.join(unknown)}")
+    dimensions = [dimension for dimension in ROLLUP_DIMENSIONS if dimension in dimensions]
+    
+    query, params = build_rollup_query(
+        dimensions, model_id, color, size,
+        parse_month(month_from, "month_from"), parse_month(month_to, "month_to"),
+        sort_by, sort_order
+    )
+    async with db_manager.acquire() as conn:
+        with DB_QUERY_SECONDS.time("rollups"):
+            rows = await conn.fetch(query, *params, limit, offset)
+    
+    total = rows[0]["total_groups"] if rows else 0
+    groups = []
+    for row in rows:
+        group = dict(row)
+        group.pop("total_groups")
+        groups.append(group)
+    
+    return FastJSONResponse(content={
+        "group_by": dimensions,
+        "groups": groups,
+        "total": total,
+        "limit": limit,
+        "offset": offset
+    })
+
+# Current-state metrics, read only when /metrics is scraped
+metrics.registry.register(Gauge(
+    "scheduler_running", "1 while the email scheduler is running",
+    callback=lambda: {(): int(email_scheduler.running)}
+))
+metrics.registry.register(Gauge(
+    "scheduler_leader", "1 while this worker holds the scheduler leadership lock",
+    callback=lambda: {(): int(scheduler_leader.is_leader or not SCHEDULER_LEADER_ELECTION)}
+))
+metrics.registry.register(Gauge(
+    "extractions_in_flight", "Extractions running or queued in the extraction executor, by state",
+    ("state",),
+    callback=lambda: {
+        ("running",): min(extraction_executor.in_flight, extraction_executor.workers),
+        ("queued",): extraction_executor.queued
+    }
+))
+metrics.registry.register(Counter(
+    "extractions_rejected_total", "Extractions turned away with 429 because the executor queue was full",
+    callback=lambda: {(): extraction_executor.rejected}
+))
+metrics.registry.register(Gauge(
+    "upload_jobs_queued", "Background upload jobs waiting for a worker",
+    callback=lambda: {(): upload_jobs.stats()["queued"]}
+))
+metrics.registry.register(Counter(
+    "extraction_cache_lookups_total", "Extraction cache lookups, by result",
+    ("result",),
+    callback=lambda: {("hit",): extraction_cache.hits, ("miss",): extraction_cache.misses}
+))
+metrics.registry.register(Counter(
+    "orders_cache_lookups_total", "GET /orders response cache lookups, by result",
+    ("result",),
+    callback=lambda: {
+        ("hit",): orders_cache.hits, ("miss",): orders_cache.misses, ("coalesced",): orders_cache.coalesced
+    }
+))
+
+def pool_metrics(field: str) -> dict:
+    stats = db_manager.pool_stats()
+    return {(): stats[field]} if stats["initialised"] else {}
+
+metrics.registry.register(Gauge(
+    "db_pool_connections", "Connections in the database pool",
+    callback=lambda: pool_metrics("size")
+))
+metrics.registry.register(Gauge(
+    "db_pool_connections_in_use", "Pool connections checked out",
+    callback=lambda: pool_metrics("in_use")
+))
+metrics.registry.register(Gauge(
+    "db_pool_waiting", "Callers waiting to acquire a pool connection",
+    callback=lambda: pool_metrics("waiting")
+))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/pool")
+async def get_pool_status():
+    """Get database connection pool occupancy and wait times"""
+    return db_manager.pool_stats()
+
+@app.get("/debug/cache")
+async def get_cache_status():
+    """Get read cache hit/miss counters"""
+    return {
+        "data_generation": data_generation.value,
+        "invalidation_notifications": invalidation_listener.notifications,
+        "filters": filter_cache.stats(),
+        "orders": orders_cache.stats(),
+        "counts": count_cache.stats()
+    }
+
+@app.get("/debug/jobs")
+async def get_jobs_status():
+    """Get upload job queue and extraction executor counters"""
+    return {
+        "jobs": upload_jobs.stats(),
+        "extraction": extraction_executor.stats()
+    }
+
+@app.get("/admin/extraction-cache")
+async def get_extraction_cache():
+    """Extraction cache size and hit/miss counters"""
+    return await extraction_cache.stats()
+
+@app.delete("/admin/extraction-cache")
+async def purge_extraction_cache(
+    sha256: Optional[str] = Query(None, pattern="^[0-9a-f]{64}$"),
+    stale_only: bool = Query(False)
+):
+    """Purge cached extractions: one PDF's (sha256), those from older prompts/models (stale_only), or all"""
+    deleted = await extraction_cache.purge(sha256=sha256, stale_only=stale_only)
+    print(f"🧹 Purged {deleted} extraction cache entries")
+    return {"deleted": deleted}
 
 @app.get("/scheduler/status")
 async def get_scheduler_status():
-    """Get email scheduler status"""
+    """Get email scheduler status, and which worker process leads (runs it)"""
+    leadership = {"election": SCHEDULER_LEADER_ELECTION, **scheduler_leader.stats()}
+    if SCHEDULER_LEADER_ELECTION:
+        async with db_manager.acquire() as conn:
+            leadership["leader"] = await scheduler_leader.current_leader(conn)
+    else:
+        leadership["is_leader"] = True
     return {
-        "scheduler_running": scheduler_running,
-        "status": "active" if scheduler_running else "stopped",
-        "check_interval": "5 minutes",
-        "description": "Automatically checks for new order PDFs from emails"
+        "scheduler_running": email_scheduler.running,
+        "status": "active" if email_scheduler.running else "stopped",
+        "check_interval": f"{EMAIL_POLL_INTERVAL_SECONDS:g} seconds",
+        "description": "Automatically checks for new order PDFs from emails",
+        "leadership": leadership,
+        **email_scheduler.stats()
     }
 
 @app.post("/scheduler/start")
 async def start_scheduler():
-    """Manually start the email scheduler"""
-    if not scheduler_running:
-        start_email_scheduler()
+    """Manually start the email scheduler (on the leader; see /scheduler/status)"""
+    if SCHEDULER_LEADER_ELECTION and not scheduler_leader.is_leader:
+        raise HTTPException(status_code=409, detail="This worker is not the scheduler leader")
+    if not email_scheduler.running:
+        email_scheduler.start()
         return {"message": "Email scheduler started", "status": "started"}
     else:
         return {"message": "Email scheduler is already running", "status": "already_running"}
 
 @app.post("/scheduler/stop")
 async def stop_scheduler():
-    """Manually stop the email scheduler"""
-    if scheduler_running:
-        stop_email_scheduler()
+    """Manually stop the email scheduler, finishing the PDFs of the current run first.
+
+    The leader keeps its lock, so no other worker starts polling in its place.
+    """
+    if email_scheduler.running:
+        await email_scheduler.stop()
         return {"message": "Email scheduler stopped", "status": "stopped"}
     else:
         return {"message": "Email scheduler is already stopped", "status": "already_stopped"}
 
 @app.on_event("startup")
 async def startup_event():
-    """Start the email scheduler when the server starts"""
-    start_email_scheduler()
+    """Open the database pool and start the email scheduler when the server starts"""
+    await db_manager.create_pool()
+    print(f"🗄️  Database pool ready (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    async with db_manager.acquire() as conn:
+        partitioned = await line_items_partitioned(conn)
+    if LINE_ITEMS_PARTITIONED and not partitioned:
+        raise RuntimeError("LINE_ITEMS_PARTITIONED=true but line_items isn't partitioned; see partitioning.py")
+    if partitioned and not LINE_ITEMS_PARTITIONED:
+        print("⚠️  line_items is partitioned but LINE_ITEMS_PARTITIONED is off: new items land in the default partition")
+    invalidation_listener.start()
+    extraction_executor.start()
+    upload_jobs.start()
+    if not UPLOAD_JOB_STORE and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("⚠️  UPLOAD_JOB_STORE is off with several workers: GET /jobs/{id} 404s on workers that didn't "
+              "accept the upload; run a single worker or route /jobs by sticky sessions")
+    if SCHEDULER_LEADER_ELECTION:
+        scheduler_leader.start()
+    else:
+        email_scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop the email scheduler when the server shuts down"""
-    stop_email_scheduler()
+    """Stop the email scheduler and close the database pool when the server shuts down"""
+    # Drain the scheduler's PDFs while the pool and extraction executor are still up,
+    # then release leadership for another worker
+    await scheduler_leader.stop()
+    await email_scheduler.stop()
+    await upload_jobs.stop()
+    extraction_executor.shutdown()
+    await invalidation_listener.stop()
+    await db_manager.close_pool()
+    tracing.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,202 @@
+# stats.py
+"""Incrementally maintained dashboard statistics.
+
+Every write path calls record_order_change inside its own transaction, so the
+summary commits (or rolls back) together with the change it describes.
+buyer_order_counts tracks orders per buyer, which is what keeps total_buyers
+(a COUNT(DISTINCT)) exact.
+
+The totals are spread over ORDER_STATS_SLOTS rows of order_stats: a change is
+added to the slot its purchase order id hashes to, and GET /stats sums the
+rows. With a single row every save transaction held that row's lock until
+commit, so concurrent saves of different POs queued behind each other.
+Changing the slot count needs no migration: the sum is right for any set of
+rows.
+
+Reconcile against a full recompute (from parser/):
+    python stats.py reconcile          # report drift
+    python stats.py reconcile --fix    # report drift and rebuild the summary
+"""
+import argparse
+import asyncio
+import os
+import sys
+import zlib
+from decimal import Decimal
+from typing import Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from database import database_url
+
+# (buyer_name, total_amount) of an order before or after a change; None when
+# the order doesn't exist on that side of the change
+OrderFacts = Optional[Tuple[Optional[str], Optional[Decimal]]]
+
+# Saves of different POs update different rows, see the module docstring
+ORDER_STATS_SLOTS = int(os.getenv("ORDER_STATS_SLOTS", "64"))
+
+STATS_QUERY = """
+SELECT COALESCE(SUM(total_orders), 0)::bigint as total_orders,
+       COALESCE(SUM(total_items), 0)::bigint as total_items,
+       COALESCE(SUM(total_value), 0) as total_value,
+       COALESCE(SUM(total_buyers), 0)::bigint as total_buyers
+FROM order_stats
+"""
+
+RECOMPUTE_QUERY = """
+SELECT
+    (SELECT COUNT(id) FROM orders) as total_orders,
+    (SELECT COUNT(id) FROM line_items) as total_items,
+    (SELECT COALESCE(SUM(total_amount), 0) FROM orders) as total_value,
+    (SELECT COUNT(DISTINCT buyer_name) FROM orders) as total_buyers
+"""
+
+
+def _amount(value) -> Decimal:
+    if value is None:
+        return Decimal(0)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def stats_slot(purchase_order_id: str) -> int:
+    """The order_stats row (1..ORDER_STATS_SLOTS) a PO's changes are added to"""
+    return 1 + zlib.crc32(purchase_order_id.encode()) % ORDER_STATS_SLOTS
+
+
+async def record_order_change(conn, purchase_order_id: str, before: OrderFacts, after: OrderFacts, items_delta: int):
+    """Apply one order's insert/update/delete to the summary tables.
+
+    Must run inside the caller's transaction. Buyer rows are always locked in
+    name order and before the order_stats slot, so concurrent saves (and
+    reconcile) can't deadlock each other.
+    """
+    before_buyer = before[0] if before else None
+    after_buyer = after[0] if after else None
+
+    buyer_steps = []
+    if before_buyer != after_buyer:
+        if before_buyer is not None:
+            buyer_steps.append((before_buyer, -1))
+        if after_buyer is not None:
+            buyer_steps.append((after_buyer, 1))
+    buyer_steps.sort()
+
+    buyers_delta = 0
+    for buyer_name, step in buyer_steps:
+        if step > 0:
+            count = await conn.fetchval("""
+            INSERT INTO buyer_order_counts (buyer_name, order_count) VALUES ($1, 1)
+            ON CONFLICT (buyer_name) DO UPDATE SET order_count = buyer_order_counts.order_count + 1
+            RETURNING order_count
+            """, buyer_name)
+            if count == 1:
+                buyers_delta += 1
+        else:
+            count = await conn.fetchval("""
+            UPDATE buyer_order_counts SET order_count = order_count - 1
+            WHERE buyer_name = $1
+            RETURNING order_count
+            """, buyer_name)
+            if count is not None and count <= 0:
+                await conn.execute("DELETE FROM buyer_order_counts WHERE buyer_name = $1", buyer_name)
+                buyers_delta -= 1
+
+    orders_delta = (1 if after else 0) - (1 if before else 0)
+    value_delta = (_amount(after[1]) if after else Decimal(0)) - (_amount(before[1]) if before else Decimal(0))
+
+    await conn.execute("""
+    INSERT INTO order_stats (id, total_orders, total_items, total_value, total_buyers)
+    VALUES ($5, $1, $2, $3, $4)
+    ON CONFLICT (id) DO UPDATE SET
+        total_orders = order_stats.total_orders + EXCLUDED.total_orders,
+        total_items = order_stats.total_items + EXCLUDED.total_items,
+        total_value = order_stats.total_value + EXCLUDED.total_value,
+        total_buyers = order_stats.total_buyers + EXCLUDED.total_buyers,
+        updated_at = CURRENT_TIMESTAMP
+    """, orders_delta, items_delta, value_delta, buyers_delta, stats_slot(purchase_order_id))
+
+
+async def read_stats(conn) -> dict:
+    """Sum the summary slots (zeros when nothing has been recorded yet)"""
+    return dict(await conn.fetchrow(STATS_QUERY))
+
+
+async def find_drift(conn) -> dict:
+    """Compare the summary with a full recompute; returns {field: (stored, actual)} for mismatches"""
+    stored = await read_stats(conn)
+    actual = dict(await conn.fetchrow(RECOMPUTE_QUERY))
+    drift = {key: (stored[key], actual[key]) for key in actual if stored[key] != actual[key]}
+
+    bad_buyers = await conn.fetchval("""
+    SELECT COUNT(*)
+    FROM buyer_order_counts b
+    FULL OUTER JOIN (
+        SELECT buyer_name, COUNT(*) as order_count
+        FROM orders
+        WHERE buyer_name IS NOT NULL
+        GROUP BY buyer_name
+    ) o ON o.buyer_name = b.buyer_name
+    WHERE b.order_count IS DISTINCT FROM o.order_count
+    """)
+    if bad_buyers:
+        drift["buyer_order_counts"] = (f"{bad_buyers} buyers wrong", "0 buyers wrong")
+    return drift
+
+
+async def rebuild_stats(conn):
+    """Recompute order_stats (into slot 1, zeroing the others) and buyer_order_counts from scratch"""
+    async with conn.transaction():
+        # Same lock order as record_order_change: buyers first, then the summary
+        # slots (EXCLUSIVE also keeps saves from creating a new slot meanwhile)
+        await conn.execute("LOCK TABLE buyer_order_counts IN EXCLUSIVE MODE")
+        await conn.execute("LOCK TABLE order_stats IN EXCLUSIVE MODE")
+
+        await conn.execute("DELETE FROM buyer_order_counts")
+        await conn.execute("""
+        INSERT INTO buyer_order_counts (buyer_name, order_count)
+        SELECT buyer_name, COUNT(*) FROM orders WHERE buyer_name IS NOT NULL GROUP BY buyer_name
+        """)
+        actual = await conn.fetchrow(RECOMPUTE_QUERY)
+        await conn.execute("DELETE FROM order_stats WHERE id <> 1")
+        await conn.execute("""
+        INSERT INTO order_stats (id, total_orders, total_items, total_value, total_buyers)
+        VALUES (1, $1, $2, $3, $4)
+        ON CONFLICT (id) DO UPDATE SET
+            total_orders = EXCLUDED.total_orders,
+            total_items = EXCLUDED.total_items,
+            total_value = EXCLUDED.total_value,
+            total_buyers = EXCLUDED.total_buyers,
+            updated_at = CURRENT_TIMESTAMP
+        """, actual["total_orders"], actual["total_items"], actual["total_value"], actual["total_buyers"])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Dashboard statistics maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reconcile = subparsers.add_parser("reconcile", help="compare the summary with a full recompute")
+    reconcile.add_argument("--fix", action="store_true", help="rebuild the summary when it has drifted")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        drift = await find_drift(conn)
+        if not drift:
+            print("✅ order_stats matches a full recompute")
+            return
+        for key, (stored, actual) in drift.items():
+            print(f"❌ {key}: stored={stored} actual={actual}")
+        if args.fix:
+            await rebuild_stats(conn)
+            print("🔧 Rebuilt order_stats and buyer_order_counts")
+        else:
+            sys.exit(1)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+    asyncio.run(main())
@@ -0,0 +1,301 @@
+# tracing.py
+"""Lightweight in-process tracing for the upload -> extract -> save pipeline.
+
+Every HTTP request gets a trace id (the caller's, when it sends a W3C
+traceparent header) and a root span; span() opens a timed child span in the
+current trace and works as a sync or async context manager. Finished spans are
+written one JSON object per line to TRACE_FILE, rotated at
+TRACE_FILE_MAX_BYTES, by a background thread so the event loop never waits on
+the disk. Traces are sampled at the root (TRACE_SAMPLE_RATE); spans of an
+unsampled trace are timed but never serialised.
+
+Extraction runs in a thread or process pool that can't see the request's
+context: collect() records the spans opened there and adopt() writes them into
+the caller's trace.
+
+log is the sampled logger for hot-path debug output. debug() prints for one
+trace in DEBUG_LOG_SAMPLE_RATE (per call outside a trace) and formats its
+message only then; warning() and error() always print. Lines carry the trace
+id, so a slow upload's output can be matched with its spans.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_collector: ContextVar[Optional[list]] = ContextVar("span_collector", default=None)
+
+
+@lru_cache(maxsize=None)
+def settings() -> dict:
+    """Read on first use, after the server has loaded .env"""
+    return {
+        # {pid} keeps uvicorn/gunicorn workers from rotating each other's files
+        "file": os.getenv("TRACE_FILE", "traces.jsonl").format(pid=os.getpid()),
+        "max_bytes": int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024))),
+        "backups": int(os.getenv("TRACE_FILE_BACKUPS", "5")),
+        "sample_rate": float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+        "debug_sample_rate": float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0.01"))
+    }
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Span:
+    """A timed operation; use span() to create one"""
+
+    __slots__ = ("name", "attributes", "traceparent", "trace_id", "span_id", "parent_id",
+                 "sampled", "verbose", "start", "_started", "_token")
+
+    def __init__(self, name: str, attributes: dict, traceparent: Optional[str] = None):
+        self.name = name
+        self.attributes = attributes
+        self.traceparent = traceparent
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        if parent is not None:
+            self.trace_id, self.parent_id = parent.trace_id, parent.span_id
+            self.sampled, self.verbose = parent.sampled, parent.verbose
+        else:
+            config = settings()
+            remote = parse_traceparent(self.traceparent)
+            if remote:
+                self.trace_id, self.parent_id, self.sampled = remote
+            else:
+                self.trace_id, self.parent_id = _new_id(128), None
+                # Spans collected for another process/thread are kept; the caller samples
+                self.sampled = _collector.get() is not None or random.random() < config["sample_rate"]
+            self.verbose = random.random() < config["debug_sample_rate"]
+        self.span_id = _new_id(64)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if not self.sampled:
+            return False
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "status": "ok" if exc is None else "error",
+            "attributes": self.attributes,
+            "pid": os.getpid()
+        }
+        if exc is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        collected = _collector.get()
+        if collected is not None:
+            collected.append(record)
+        else:
+            export(record)
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def span(name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+    """A child of the current span, or the root of a new trace (continuing traceparent if given)"""
+    return Span(name, attributes, traceparent)
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def propagation() -> Optional[tuple]:
+    """The current span as a picklable (trace id, span id, sampled, verbose), for collect()"""
+    active = _current.get()
+    if active is None:
+        return None
+    return active.trace_id, active.span_id, active.sampled, active.verbose
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if there is one"""
+    active = _current.get()
+    if active is not None:
+        active.attributes.update(attributes)
+
+
+class collect:
+    """Collect the spans finished inside the block instead of exporting them.
+
+    For work handed to a pool: parent is the caller's propagation(), so spans
+    and log lines in the pool belong to its trace; the spans come back to the
+    caller with the result, and adopt() exports them there.
+    """
+
+    def __init__(self, parent: Optional[tuple] = None):
+        self.parent = parent
+
+    def __enter__(self) -> List[dict]:
+        self.spans = []
+        remote = None
+        if self.parent is not None:
+            remote = Span("remote", {})
+            remote.trace_id, remote.span_id, remote.sampled, remote.verbose = self.parent
+        self._tokens = (_collector.set(self.spans), _current.set(remote))
+        return self.spans
+
+    def __exit__(self, *exc):
+        collector_token, current_token = self._tokens
+        _current.reset(current_token)
+        _collector.reset(collector_token)
+        return False
+
+
+def adopt(spans: List[dict]):
+    """Export spans from collect() as descendants of the current span (parentless ones re-parented)"""
+    active = _current.get()
+    if active is None or not active.sampled:
+        return
+    for record in spans:
+        record["trace_id"] = active.trace_id
+        if record["parent_id"] is None:
+            record["parent_id"] = active.span_id
+        export(record)
+
+
+_exporter: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_exporter() -> Optional[logging.Logger]:
+    global _exporter, _listener
+    config = settings()
+    exporter = logging.getLogger("tracing.spans")
+    exporter.propagate = False
+    exporter.setLevel(logging.INFO)
+    if config["file"]:
+        directory = os.path.dirname(config["file"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            config["file"], maxBytes=config["max_bytes"], backupCount=config["backups"], delay=True
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        spans_queue = queue.SimpleQueue()
+        exporter.addHandler(logging.handlers.QueueHandler(spans_queue))
+        _listener = logging.handlers.QueueListener(spans_queue, handler)
+        _listener.start()
+    else:
+        exporter.disabled = True
+    _exporter = exporter
+    return exporter
+
+
+def export(record: dict):
+    """Queue a finished span for the writer thread (TRACE_FILE empty: dropped)"""
+    exporter = _exporter or _start_exporter()
+    if not exporter.disabled:
+        exporter.info(json.dumps(record, default=str))
+
+
+def shutdown():
+    """Flush queued spans to disk"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class SampledLogger:
+    """print() for the hot path: debug lines only for sampled traces"""
+
+    def enabled(self) -> bool:
+        active = _current.get()
+        if active is not None:
+            return active.verbose
+        return random.random() < settings()["debug_sample_rate"]
+
+    def _emit(self, prefix: str, message: str, args: tuple):
+        text = message % args if args else message
+        active = _current.get()
+        suffix = f" [trace {active.trace_id}]" if active is not None else ""
+        print(f"{prefix}{text}{suffix}")
+
+    def debug(self, message: str, *args):
+        if self.enabled():
+            self._emit("DEBUG: ", message, args)
+
+    def warning(self, message: str, *args):
+        self._emit("⚠️  ", message, args)
+
+    def error(self, message: str, *args):
+        self._emit("ERROR: ", message, args)
+
+
+log = SampledLogger()
+
+
+class TracingMiddleware:
+    """ASGI middleware giving every HTTP request a root span and an X-Trace-Id response header.
+
+    The span is named after the route template once routing has run
+    ("GET /orders/{order_id}"), like the metrics labels.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with span(f"{scope['method']} {scope['path']}", traceparent=traceparent, path=scope["path"]) as root:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", root.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    root.name = f"{scope['method']} {route.path}"
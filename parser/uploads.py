@@ -0,0 +1,101 @@
+# uploads.py
+"""Stores uploaded PDFs on disk for extraction.
+
+Uploads are copied to a temp file in UPLOAD_CHUNK_BYTES chunks, never held in
+memory whole. The SHA-256 and the %PDF- magic-byte check are computed on the
+chunks as they pass, so a non-PDF is rejected on its first chunk and an
+oversized file as soon as it crosses MAX_UPLOAD_BYTES.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from fastapi import UploadFile
+
+from tracing import span
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+PDF_MAGIC = b"%PDF-"
+
+
+class UploadRejected(Exception):
+    """An upload that failed validation; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredUpload:
+    """A validated upload written to a temp file"""
+
+    def __init__(self, filename: Optional[str], path: str, size: int, sha256: str):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+async def store_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredUpload:
+    """Stream an uploaded PDF to a temp file, validating and hashing it on the way.
+
+    Raises UploadRejected (413 too large, 415 not a PDF) and leaves no file behind.
+    """
+    with span("upload.write_temp_file") as write_span:
+        stored = await _write_upload(file, max_bytes)
+        write_span.set(bytes=stored.size)
+    return stored
+
+
+async def _write_upload(file: UploadFile, max_bytes: int) -> StoredUpload:
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+
+                if len(head) < len(PDF_MAGIC):
+                    head += chunk[:len(PDF_MAGIC) - len(head)]
+                    if head != PDF_MAGIC[:len(head)]:
+                        raise UploadRejected(415, f"{file.filename} is not a PDF file")
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"{file.filename} is larger than the {max_bytes} byte limit")
+
+                digest.update(chunk)
+                out.write(chunk)
+
+        if head != PDF_MAGIC:
+            raise UploadRejected(415, f"{file.filename} is not a PDF file")
+    except BaseException:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        raise
+
+    return StoredUpload(file.filename, path, size, digest.hexdigest())
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file on disk (for PDFs that didn't come through store_upload)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()